@@ -13,10 +13,11 @@ from .model import Model
 from . import proj
 from .proj import Proj
 from . import calc
-from .calc import Calc
+from .calc import Calc, load_results
 from .automate import submit_mult_calcs
 from . import examples
 
 __all__ = ['user_path', '_constants', 'utils', 'var', 'Var', 'region',
            'Region', 'run', 'Run', 'model', 'Model', 'proj', 'Proj',
-           'calc', 'Calc', 'submit_mult_calcs', 'examples']
+           'calc', 'Calc', 'load_results', 'submit_mult_calcs',
+           'examples']
@@ -0,0 +1,7 @@
+"""Entry point of ``python -m aospy``; see :py:mod:`aospy.cli`."""
+import sys
+
+from .cli import main
+
+
+sys.exit(main())
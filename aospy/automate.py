@@ -1,19 +1,29 @@
 """Functionality for specifying and cycling through multiple calculations."""
 from __future__ import print_function
 
+from collections import OrderedDict
 from distutils.version import LooseVersion
+import functools
 from multiprocessing import cpu_count
+import os
 
 import dask
 import dask.bag as db
-import distributed
+from dask.utils import parse_bytes
 import itertools
 import logging
 import pprint
+import sys
+import time
 import traceback
 
-from .calc import Calc, _TIME_DEFINED_REDUCTIONS
+from . import (executors, instrument, planning, scheduling, sharding, utils,
+               workqueue)
+from .calc import Calc
+from .manifest import Manifest, default_manifest_path
 from .region import Region
+from .specs import (CalcSpec, CalcSpecs, ObjectLibrary, compact, materialize,
+                    _prune_invalid_time_reductions)
 from .var import Var
 
 
@@ -24,6 +34,9 @@ _RUNS_STR = 'runs'
 _REGIONS_STR = 'regions'
 _VARIABLES_STR = 'variables'
 _TAG_ATTR_MODIFIERS = dict(all='', default='default_')
+# The exec options passed on to Calc.compute by the workers of a WorkQueue.
+_QUEUE_COMPUTE_OPTIONS = ('write_to_tar', 'output_backend', 'output_format',
+                          'output_encoding', 'max_threads', 'weights_cache')
 
 
 class AospyException(Exception):
@@ -236,45 +249,117 @@ class CalcSuite(object):
                 all_specs.append(_merge_dicts(core_dict, aux_dict))
         return all_specs
 
-    def create_calcs(self):
-        """Generate a Calc object for each requested parameter combination."""
+    def create_calcs(self, lazy=False):
+        """Generate a Calc object for each requested parameter combination.
+
+        Parameters
+        ----------
+        lazy : bool, default False
+            If True, instead return a lazy :py:class:`aospy.specs.CalcSpecs`
+            sequence of lightweight specifications, from which each Calc is
+            only created when it is executed.  Its length and subsets
+            satisfying given criteria are available without creating any
+            Calc.
+
+        Returns
+        -------
+        list of aospy.Calc, or aospy.specs.CalcSpecs if ``lazy``
+        """
+        if lazy:
+            return CalcSpecs(self._permute_core_specs(),
+                             self._permute_aux_specs())
         specs = self._combine_core_aux_specs()
         for spec in specs:
             spec['dtype_out_time'] = _prune_invalid_time_reductions(spec)
         return [Calc(**sp) for sp in specs]
 
 
-def _prune_invalid_time_reductions(spec):
-    """Prune time reductions of spec with no time dimension."""
-    valid_reductions = []
-    if not spec['var'].def_time and spec['dtype_out_time'] is not None:
-        for reduction in spec['dtype_out_time']:
-            if reduction not in _TIME_DEFINED_REDUCTIONS:
-                valid_reductions.append(reduction)
-            else:
-                msg = ("Var {0} has no time dimension "
-                       "for the given time reduction "
-                       "{1} so this calculation will "
-                       "be skipped".format(spec['var'].name, reduction))
-                logging.info(msg)
-    else:
-        valid_reductions = spec['dtype_out_time']
-    return valid_reductions
+def _compute(calc, compute_kwargs, profiler=None):
+    """Execute the Calc, profiling it if the Profiler selects it."""
+    if profiler is not None and profiler.selects(calc):
+        return profiler.profile(calc, calc.compute, **compute_kwargs)
+    return calc.compute(**compute_kwargs)
+
 
+def _compute_within_limits(calc, compute_kwargs, limits, manifest=None,
+                           profiler=None):
+    """Execute the Calc in its own process within the given limits.
 
-def _compute_or_skip_on_error(calc, compute_kwargs):
+    An execution that times out, exceeds the memory limit, or is killed is
+    retried, after a delay, up to ``limits.retries`` times; one that raises
+    any other exception is not.  Each attempt and the kind of any failure
+    are recorded in the ``Manifest``, if given.  Returns None if the Calc
+    did not complete.
+    """
+    func = functools.partial(_compute, compute_kwargs=compute_kwargs,
+                             profiler=profiler)
+    for attempt in range(limits.retries + 1):
+        if attempt:
+            delay = limits.delay(attempt)
+            logging.info('Retrying aospy calculation `{0}` in {1} seconds '
+                         '(retry {2} of {3})'.format(calc, delay, attempt,
+                                                     limits.retries))
+            time.sleep(delay)
+        started = time.time()
+        if manifest is not None:
+            manifest.mark_running(calc)
+        outcome, value = executors.call_isolated(
+            func, calc, timeout=limits.timeout,
+            memory_limit=limits.memory_limit)
+        if outcome == executors.DONE:
+            if manifest is not None:
+                manifest.mark_finished(calc, started)
+            return value
+        if manifest is not None:
+            manifest.mark_finished(calc, started, traceback=value,
+                                   failure=outcome)
+        logging.warn("aospy calculation `{0}` failed ({1}): "
+                     "\n{2}".format(calc, outcome, value))
+        if outcome == executors.ERROR:
+            break
+    logging.warn("Skipping aospy calculation `{}`".format(calc))
+    return None
+
+
+def _compute_or_skip_on_error(calc, compute_kwargs, manifest=None,
+                              profiler=None, limits=None):
     """Execute the Calc, catching and logging exceptions, but don't re-raise.
 
     Prevents one failed calculation from stopping a larger requested set
-    of calculations.
+    of calculations.  If a ``Manifest`` is given, the Calc's status, timing,
+    and (if applicable) traceback are recorded in it.  If a ``Profiler`` is
+    given and selects the Calc, its execution is profiled.  If
+    ``ResourceLimits`` are given, the Calc is executed in its own process
+    within them (see ``_compute_within_limits``).  A
+    :py:class:`aospy.specs.CalcSpec` is first materialized into its Calc.
     """
+    started = time.time()
+    if isinstance(calc, CalcSpec):
+        try:
+            calc = calc.materialize()
+        except Exception:
+            logging.warn("Skipping aospy calculation `{0}` due to error in "
+                         "creating it with the following traceback: "
+                         "\n{1}".format(calc, traceback.format_exc()))
+            return None
+    if limits is not None:
+        return _compute_within_limits(calc, compute_kwargs, limits,
+                                      manifest=manifest, profiler=profiler)
+    if manifest is not None:
+        manifest.mark_running(calc)
     try:
-        return calc.compute(**compute_kwargs)
+        result = _compute(calc, compute_kwargs, profiler=profiler)
     except Exception:
+        tb = traceback.format_exc()
+        if manifest is not None:
+            manifest.mark_finished(calc, started, traceback=tb)
         msg = ("Skipping aospy calculation `{0}` due to error with the "
                "following traceback: \n{1}")
-        logging.warn(msg.format(calc, traceback.format_exc()))
+        logging.warn(msg.format(calc, tb))
         return None
+    if manifest is not None:
+        manifest.mark_finished(calc, started)
+    return result
 
 
 def _submit_calcs_on_client(calcs, client, func):
@@ -285,7 +370,8 @@ def _submit_calcs_on_client(calcs, client, func):
     else:
         dask_option_setter = dask.config.set
     with dask_option_setter(get=client.get):
-        return db.from_sequence(calcs).map(func).compute()
+        # One partition per task, so that they are scheduled in order.
+        return db.from_sequence(calcs, partition_size=1).map(func).compute()
 
 
 def _n_workers_for_local_cluster(calcs):
@@ -299,51 +385,431 @@ def _n_workers_for_local_cluster(calcs):
     return min(cpu_count(), len(calcs))
 
 
-def _exec_calcs(calcs, parallelize=False, client=None, **compute_kwargs):
+def _n_workers_of_client(client):
+    """The number of calculations a distributed Client executes at once."""
+    try:
+        return max(1, sum(client.ncores().values()))
+    except Exception:
+        return 1
+
+
+def _compute_all_or_skip_on_error(calcs, compute_kwargs, manifest=None,
+                                  profiler=None, limits=None):
+    """Execute each of the Calcs in turn via _compute_or_skip_on_error."""
+    return [_compute_or_skip_on_error(calc, compute_kwargs, manifest=manifest,
+                                      profiler=profiler, limits=limits)
+            for calc in calcs]
+
+
+def _limit_nested_threads(compute_kwargs, n_workers):
+    """Limit the threads used within each Calc executing in parallel.
+
+    So that the threads of the Calcs executing at once don't oversubscribe
+    the CPUs, each Calc uses at most its share of the CPUs across the
+    ``n_workers`` workers.
+    """
+    max_threads = compute_kwargs.get('max_threads')
+    if max_threads is None or max_threads <= 1:
+        return
+    limit = max(1, cpu_count() // max(1, n_workers))
+    if max_threads > limit:
+        logging.info('Limiting each of the calculations executing on {0} '
+                     'workers to {1} threads'.format(n_workers, limit))
+        compute_kwargs['max_threads'] = limit
+
+
+def _partition_calcs(calcs, n_workers, schedule=True, locality=False):
+    """Partition the Calcs into the groups submitted to the workers.
+
+    If ``schedule`` or ``locality``, the cost of each Calc is estimated and
+    reported.  If ``schedule``, the Calcs are ordered longest first.  If
+    ``locality``, Calcs reading the same input files are grouped together
+    (see :py:func:`aospy.scheduling.partition_by_inputs`); otherwise each
+    Calc forms its own group.
+
+    Returns
+    -------
+    list of lists of int
+        The indices of the Calcs in each group
+    """
+    if not (schedule or locality):
+        return [[i] for i in range(len(calcs))]
+    costs = [scheduling.estimate_cost(calc) for calc in calcs]
+    logging.info(scheduling.format_schedule(calcs, costs, n_workers))
+    if locality:
+        groups = scheduling.partition_by_inputs(calcs, costs, n_workers)
+        logging.info('Executing {0} calculations in {1} groups sharing '
+                     'input files'.format(len(calcs), len(groups)))
+        if not schedule:
+            groups.sort(key=min)
+        return groups
+    return [[i] for i in scheduling.longest_first(costs)]
+
+
+def _gather_results(calcs, groups, task_results):
+    """The result of each Calc, in order, from the results of its group."""
+    result = [None] * len(calcs)
+    for group, group_results in zip(groups, task_results):
+        # A group's results are None if its worker died.
+        for i, calc_result in zip(group, group_results or []):
+            result[i] = calc_result
+    return result
+
+
+def _exec_calcs(calcs, parallelize=False, client=None, manifest=None,
+                write_to_tar=True, executor=None, max_workers=None,
+                schedule=True, locality=False, memory_budget=None,
+                profiler=None, timeout=None, memory_limit=None, retries=0,
+                retry_backoff=1., library=None, prefetch=1, write_behind=1,
+                shard=None, **compute_kwargs):
     """Execute the given calculations.
 
     Parameters
     ----------
-    calcs : Sequence of ``aospy.Calc`` objects
+    calcs : Sequence of ``aospy.Calc`` or ``aospy.specs.CalcSpec`` objects
+        Each CalcSpec is only materialized into its Calc when executed.  The
+        ``schedule``, ``locality``, and ``memory_budget`` options, which
+        require the Calcs, are not applied to CalcSpecs.
     parallelize : bool, default False
         Whether to submit the calculations in parallel or not
     client : distributed.Client or None
         The distributed Client used if parallelize is set to True; if None
         a distributed LocalCluster is used.
+    manifest : aospy.manifest.Manifest or None
+        If provided, the status of each Calc is recorded in this manifest.
+    write_to_tar : bool, default True
+        Whether to add the output of the calculations to the tar archive of
+        their Run.  Each archive is written once, after all calculations have
+        been executed.
+    executor : {None, 'distributed', 'processes', 'pipeline'}, default None
+        How to execute the calculations in parallel.  If 'processes', use a
+        pool of local worker processes (see
+        :py:func:`aospy.executors.map_on_process_pool`) rather than a
+        distributed cluster, regardless of ``parallelize``.  If 'pipeline',
+        execute the calculations one at a time, but in a pipeline (see
+        :py:func:`aospy.executors.map_pipelined`) in which the input of the
+        next calculations is loaded, and the output of the previous ones
+        written, while computing the current one.  If None, use
+        distributed if ``parallelize`` is True.
+    max_workers : int or None
+        The number of worker processes if ``executor`` is 'processes'.  This
+        also bounds the number of calculations in flight at once.  If None,
+        the number of workers is determined via
+        ``_n_workers_for_local_cluster``.
+    schedule : bool, default True
+        When executing in parallel, whether to estimate the cost of each
+        calculation (see :py:func:`aospy.scheduling.estimate_cost`), report
+        the estimates, and submit the calculations longest first, which
+        minimizes the time spent waiting on a few long calculations at the
+        end.
+    locality : bool, default False
+        When executing in parallel, whether to execute calculations of the
+        same Run that read the same input files on the same worker, one
+        after the other, so that the files are read from the page cache
+        after the first time.
+    memory_budget : int, str, or None, default None
+        When executing in parallel, the total memory, in bytes (or as a
+        string such as '16GB'), that the calculations executing at once are
+        estimated to use may not exceed (see
+        :py:class:`aospy.scheduling.AdmissionController`).  With the
+        'processes' executor, each calculation is only started once the
+        memory it is estimated to need is available.  With a distributed
+        LocalCluster, the number of workers is limited such that the largest
+        calculations fit within the budget at once.  It is not applied to a
+        given distributed ``client``.  If None, memory is not considered.
+    profiler : aospy.instrument.Profiler or None
+        If provided, the calculations it selects are profiled.
+    timeout : float or None, default None
+        If given, each calculation is executed in its own process, which is
+        killed if the calculation takes longer than this many seconds.
+    memory_limit : int, str, or None, default None
+        If given, each calculation is executed in its own process, in which
+        allocating more than this many bytes (or e.g. '4GB') fails.
+    retries : int, default 0
+        The number of times a calculation that timed out, exceeded the
+        memory limit, or whose process was killed is retried, each time in
+        a new process.  If nonzero, each calculation is executed in its own
+        process even without a timeout or memory limit.
+    retry_backoff : float, default 1
+        Seconds to wait before the first retry of a calculation, doubling
+        with each further retry.  See
+        :py:class:`aospy.executors.ResourceLimits`.
+    library : module or None, default None
+        If given, the object library of the calculations, in which case,
+        when executing in parallel, each calculation is sent to the workers
+        as a :py:class:`aospy.specs.CompactCalcSpec` referencing the
+        library's objects by name, and created on the worker from the
+        library as imported there.
+    prefetch : int, default 1
+        If ``executor`` is 'pipeline', the number of calculations whose
+        input may be loaded ahead of the calculation being computed.
+    write_behind : int, default 1
+        If ``executor`` is 'pipeline', the number of computed calculations
+        whose output may be waiting to be written.
+    shard : str, tuple, or None, default None
+        If given, the shard of a suite that the calculations comprise (see
+        :py:mod:`aospy.sharding`), in which case their output is added to
+        the shard's own counterpart of the tar archive of each Run.
     compute_kwargs : dict of keyword arguments passed to ``Calc.compute``
 
     Returns
     -------
-    A list of the values returned by each Calc object that was executed.
+    A list of the values returned by each Calc object that was executed, in
+    the same order as ``calcs``.
     """
-    if parallelize:
-        def func(calc):
-            """Wrap _compute_or_skip_on_error to require only the calc
-            argument"""
-            if 'write_to_tar' in compute_kwargs:
-                compute_kwargs['write_to_tar'] = False
-            return _compute_or_skip_on_error(calc, compute_kwargs)
+    if executor not in (None, 'distributed', 'processes', 'pipeline'):
+        raise ValueError("executor must be one of None, 'distributed', "
+                         "'processes', or 'pipeline'; got "
+                         "'{}'".format(executor))
+    calcs = list(calcs)
+    # Tar archives are written in a single batch per Run after computing.
+    compute_kwargs['write_to_tar'] = False
+    limits = None
+    if timeout is not None or memory_limit is not None or retries:
+        if isinstance(memory_limit, str):
+            memory_limit = parse_bytes(memory_limit)
+        limits = executors.ResourceLimits(timeout, memory_limit, retries,
+                                          retry_backoff)
+    if executor == 'pipeline':
+        if profiler is not None or limits is not None:
+            raise ValueError("The profile, timeout, memory_limit, and "
+                             "retries options are not supported by the "
+                             "'pipeline' executor")
+        pipeline = _CalcPipeline(compute_kwargs, manifest=manifest)
+        result = executors.map_pipelined(
+            [pipeline.load, pipeline.reduce, pipeline.write], calcs,
+            depths=[prefetch, write_behind])
+        if write_to_tar:
+            _write_to_tar_by_run(result, shard=shard)
+        return result
+    if executor is None and not parallelize:
+        result = _compute_all_or_skip_on_error(calcs, compute_kwargs,
+                                               manifest=manifest,
+                                               profiler=profiler,
+                                               limits=limits)
+        if write_to_tar:
+            _write_to_tar_by_run(result, shard=shard)
+        return result
 
+    if executor == 'processes':
+        if max_workers is None:
+            max_workers = _n_workers_for_local_cluster(calcs)
+        n_workers = max_workers
+    elif client is None:
+        n_workers = _n_workers_for_local_cluster(calcs)
+    else:
+        n_workers = _n_workers_of_client(client)
+    if executor != 'processes':
+        # Imported only when needed, since importing it is slow.
+        import distributed
+    _limit_nested_threads(compute_kwargs, n_workers)
+    if any(isinstance(calc, CalcSpec) for calc in calcs):
+        # Estimating costs requires creating the Calcs, which lazily
+        # specified Calcs defer to the workers.
+        if locality or memory_budget is not None:
+            logging.info('The locality and memory_budget options are not '
+                         'applied to lazily created calculations')
+        schedule, locality, memory_budget = False, False, None
+    groups = _partition_calcs(calcs, n_workers, schedule=schedule,
+                              locality=locality)
+    # Each group of Calcs is a single task, and so executes on one worker.
+    tasks = [[calcs[i] for i in group] for group in groups]
+    func = functools.partial(_compute_all_or_skip_on_error,
+                             compute_kwargs=compute_kwargs, manifest=manifest,
+                             profiler=profiler, limits=limits)
+    admission = None
+    if memory_budget is not None:
+        if isinstance(memory_budget, str):
+            memory_budget = parse_bytes(memory_budget)
         if client is None:
-            n_workers = _n_workers_for_local_cluster(calcs)
-            with distributed.LocalCluster(n_workers=n_workers) as cluster:
-                with distributed.Client(cluster) as client:
-                    result = _submit_calcs_on_client(calcs, client, func)
+            admission = scheduling.AdmissionController(memory_budget, tasks)
         else:
-            result = _submit_calcs_on_client(calcs, client, func)
-        if compute_kwargs['write_to_tar']:
-            _serial_write_to_tar(calcs)
-        return result
+            logging.info('The memory budget is not applied to calculations '
+                         'submitted to a given distributed client')
+    if library is not None:
+        tasks = _compact_tasks(tasks, library)
+
+    if executor == 'processes':
+        result = _gather_results(calcs, groups, executors.map_on_process_pool(
+            func, tasks, max_workers, admission))
+        if write_to_tar:
+            _write_to_tar_by_run(result, max_workers=max_workers,
+                                 shard=shard)
+    elif client is None:
+        if admission is not None:
+            n_workers = admission.max_concurrency(n_workers)
+            logging.info('Using {} workers to stay within the memory '
+                         'budget'.format(n_workers))
+        with distributed.LocalCluster(n_workers=n_workers) as cluster:
+            with distributed.Client(cluster) as client:
+                result = _gather_results(calcs, groups,
+                                         _submit_calcs_on_client(
+                                             tasks, client, func))
+                if write_to_tar:
+                    _write_to_tar_by_run(result, client=client, shard=shard)
     else:
-        return [_compute_or_skip_on_error(calc, compute_kwargs)
-                for calc in calcs]
+        result = _gather_results(calcs, groups, _submit_calcs_on_client(
+            tasks, client, func))
+        if write_to_tar:
+            _write_to_tar_by_run(result, client=client, shard=shard)
+    return result
+
 
+class _PipelineItem(object):
+    """A Calc passing through the stages of a _CalcPipeline."""
+    def __init__(self, calc):
+        self.calc = calc
+        self.data = None
+        self.started = time.time()
+        self.recorder = None
+        self.failed = False
 
-def _serial_write_to_tar(calcs):
+
+class _CalcPipeline(object):
+    """The stages of executing Calcs in a pipeline.
+
+    The stages load the input data of a Calc, compute its reductions, and
+    write its output, respectively.  As in ``_compute_or_skip_on_error``,
+    any exception is caught and logged, and recorded in the ``Manifest`` if
+    given, after which the Calc skips the remaining stages and its result is
+    None.  If instrumented, the 'total' phase of each Calc is the sum over
+    the stages.
+    """
+    def __init__(self, compute_kwargs, manifest=None):
+        self.compute_kwargs = dict(compute_kwargs)
+        self.instrument = self.compute_kwargs.pop('instrument', False)
+        self.write_to_tar = self.compute_kwargs.pop('write_to_tar', False)
+        self.manifest = manifest
+
+    def _run(self, item, func, *args):
+        """Apply the function within the Calc's recording, if any."""
+        if item.failed:
+            return None
+        try:
+            if item.recorder is None:
+                return func(*args)
+            with item.recorder.recording():
+                return func(*args)
+        except Exception:
+            tb = traceback.format_exc()
+            item.failed = True
+            item.data = None
+            if self.manifest is not None:
+                self.manifest.mark_finished(item.calc, item.started,
+                                            traceback=tb)
+            msg = ("Skipping aospy calculation `{0}` due to error with the "
+                   "following traceback: \n{1}")
+            logging.warn(msg.format(item.calc, tb))
+
+    def load(self, calc):
+        """Create the Calc, if necessary, and load its input data."""
+        item = _PipelineItem(calc)
+        try:
+            item.calc = materialize(calc)
+        except Exception:
+            logging.warn("Skipping aospy calculation `{0}` due to error in "
+                         "creating it with the following traceback: "
+                         "\n{1}".format(calc, traceback.format_exc()))
+            item.failed = True
+            return item
+        if self.manifest is not None:
+            self.manifest.mark_running(item.calc)
+        if self.instrument:
+            item.recorder = instrument.Recorder()
+        self._run(item, item.calc._configure, **self.compute_kwargs)
+        item.data = self._run(item, item.calc._load_inputs)
+        return item
+
+    def reduce(self, item):
+        """Compute the reductions of the Calc's input data."""
+        item.data = self._run(item, item.calc._reduce, item.data)
+        return item
+
+    def write(self, item):
+        """Write the Calc's output; return the Calc, or None if it failed.
+
+        The netCDF library is not thread-safe, so input files are not read
+        while writing.
+        """
+        with utils.io._NETCDF4_LOCK:
+            self._run(item, item.calc._write_outputs, item.data,
+                      self.write_to_tar)
+        if item.failed:
+            return None
+        if item.recorder is not None:
+            item.calc.phases = item.recorder.to_dict()
+        if self.manifest is not None:
+            self.manifest.mark_finished(item.calc, item.started)
+        return item.calc
+
+
+def _compact_tasks(tasks, library):
+    """Replace the Calcs of each task with CompactCalcSpecs.
+
+    The Calcs are left as they are if the library cannot be imported by
+    name by the workers.
+    """
+    name = getattr(library, '__name__', '__main__')
+    if name == '__main__' or sys.modules.get(name) is not library:
+        logging.warning('The object library {} cannot be imported by name, '
+                        'so the full calculations are sent to the '
+                        'workers'.format(library))
+        return tasks
+    obj_lib = ObjectLibrary(library)
+    return [[compact(calc, obj_lib) for calc in task] for task in tasks]
+
+
+def _tar_archives(calcs, shard=None):
+    """Group the outputs of the given Calcs by the tar file of their Run.
+
+    Calcs that failed (i.e. are None) or whose output is not archived are
+    skipped.  If a shard is given, the shard's counterpart of each tar file
+    is used instead.
+    """
+    archives = OrderedDict()
     for calc in calcs:
-        if calc.proj.tar_direc_out:
-            for dtype_out_time in calc.dtype_out_time:
-                calc._write_to_tar(dtype_out_time)
+        if (calc is None or not calc.proj.tar_direc_out or
+                calc.output_backend != 'netcdf'):
+            continue
+        path = calc.path_tar_out
+        if shard is not None:
+            path = sharding.shard_path(path, shard)
+        archives.setdefault(path, {}).update(calc._tar_members())
+    return archives
+
+
+def _write_tar_archive(archive):
+    """Add all of the given outputs to a single tar file at once."""
+    path_tar_out, members = archive
+    try:
+        os.makedirs(os.path.dirname(path_tar_out), exist_ok=True)
+        utils.io.dmget([path_tar_out])
+        utils.archive.add_to_tar(path_tar_out, members)
+    except Exception:
+        msg = ("Unable to write aospy output to the tar file `{0}` due to "
+               "error with the following traceback: \n{1}")
+        logging.warn(msg.format(path_tar_out, traceback.format_exc()))
+        return None
+    return path_tar_out
+
+
+def _write_to_tar_by_run(calcs, client=None, max_workers=None, shard=None):
+    """Write the outputs of the given Calcs to tar files, one task per Run.
+
+    If a distributed Client is given, or ``max_workers`` is greater than one,
+    the tar files of the different Runs are written in parallel, using
+    respectively the Client or a pool of that many worker processes.  If a
+    shard is given, the shard's own tar files are written.
+    """
+    archives = list(_tar_archives(calcs, shard=shard).items())
+    if not archives:
+        return []
+    if client is not None:
+        return _submit_calcs_on_client(archives, client, _write_tar_archive)
+    if max_workers is not None and max_workers > 1:
+        return executors.map_on_process_pool(_write_tar_archive, archives,
+                                             max_workers)
+    return [_write_tar_archive(archive) for archive in archives]
 
 
 def _print_suite_summary(calc_suite_specs):
@@ -455,17 +921,174 @@ def submit_mult_calcs(calc_suite_specs, exec_options=None):
         - prompt_verify : (default False) If True, print summary of
               calculations to be performed and prompt user to confirm before
               submitting for execution.
+        - plan_only : (default False) If True, do not execute the
+              calculations; instead, resolve their input files through their
+              DataLoaders, estimate their run times and memory use, and check
+              which of their outputs already exist and are current.  Print
+              and return the resulting
+              :py:class:`aospy.planning.ExecutionPlan`, which includes the
+              total and distinct bytes to be read and the input files shared
+              between calculations.  No manifest entries are written.
+        - lazy : (default False) If True, create each calculation's
+              :py:class:`aospy.Calc` only when it is executed (on the worker,
+              if executing in parallel), rather than all of them up front,
+              which speeds up starting very large suites and reduces the
+              data sent to the workers.  See
+              :py:meth:`aospy.automate.CalcSuite.create_calcs`.  The
+              schedule, locality, memory_budget, and resume options are not
+              supported, and calculations are only added to the manifest
+              once they start.
         - parallelize : (default False) If True, submit calculations in
               parallel.
         - client : distributed.Client or None (default None) The
               dask.distributed Client used to schedule computations.  If None
               and parallelize is True, a LocalCluster will be started.
+        - executor : (default None) If 'processes', execute calculations in
+              parallel in a pool of local worker processes, which avoids the
+              startup and scheduling overhead of a distributed cluster.  If
+              'distributed' (or None and parallelize is True), use
+              distributed.  If 'pipeline', execute calculations one at a
+              time in a single process, but load the input of the next
+              calculations in one thread and write the output of the
+              previous ones in another while computing the current one, so
+              that reading, computing, and writing overlap.
+        - max_workers : (default None) The number of worker processes used
+              if executor is 'processes', which is also the maximum number of
+              calculations in flight at once.  If None, the smaller of the
+              number of CPUs and the number of calculations.
+        - schedule : (default True) When executing in parallel, estimate
+              the cost of each calculation from the sizes of its input files
+              and its time resolution, vertical, and regional options, log
+              the estimates, and submit the calculations longest first.
+        - locality : (default False) When executing in parallel, execute
+              calculations of the same Run that read the same input files on
+              the same worker, one after the other, so that the files are read
+              from the page cache after the first time.
+        - memory_budget : (default None) When executing in parallel, the
+              total memory, in bytes or as a string such as '16GB', that the
+              calculations executing at once are estimated to use may not
+              exceed.  Each calculation's peak memory is estimated from the
+              shapes and data types of its input data and from its
+              reductions, calibrated by the peak memory measured for earlier
+              calculations.  With the 'processes' executor, calculations are
+              only started once their estimated memory is available; with a
+              distributed LocalCluster, the number of workers is limited
+              accordingly.
+        - max_threads : (default 1) The number of threads each calculation
+              uses to load its input variables concurrently.  When
+              executing in parallel, this is limited such that the threads
+              of all of the calculations executing at once do not exceed the
+              number of CPUs.
+        - weights_cache : (default None) Directory in which the weights of
+              each Region on each grid are saved, such that they are only
+              computed once for all of the calculations on the same grid,
+              in any process; see :py:class:`aospy.region.WeightsCache`.
+        - instrument : (default False) If True, record the wall time, bytes
+              read, files opened, and peak resident memory of each phase of
+              each calculation (see :py:class:`aospy.instrument.Recorder`),
+              in the ``phases`` attribute of each :py:class:`aospy.Calc`
+              returned, and print a report of them summed over all of the
+              calculations (see :py:class:`aospy.instrument.SuiteReport`).
+              If a string, the report is also written to that path as JSON
+              lines, one per calculation.
+        - profile : (default False) If True, profile the execution of each
+              calculation with cProfile, including when executing in
+              parallel (see :py:class:`aospy.instrument.Profiler`).  Each
+              profile is written to a file with the same name as the
+              calculation's output files but the extension '.prof', along
+              with a summary of the functions taking the most time.  If a
+              dict, its optional keys are 'calcs', a function of an
+              :py:class:`aospy.Calc` returning whether to profile it; 'dir',
+              the directory to write the profiles to instead of each
+              calculation's output directory; 'top', the number of functions
+              in the summary; and 'sort', the key they are sorted by.
+        - timeout : (default None) If given, execute each calculation in
+              its own process, which is killed if the calculation takes
+              longer than this many seconds, so that e.g. a read from a
+              stuck filesystem cannot stall the suite.
+        - memory_limit : (default None) If given, execute each calculation
+              in its own process, in which allocating more than this many
+              bytes (or e.g. '4GB') fails, so that one calculation cannot
+              exhaust the memory of its worker.
+        - retries : (default 0) The number of times a calculation that timed
+              out, exceeded the memory limit, or whose process was killed is
+              retried in a new process; calculations that raise any other
+              exception are not retried.  The kind of each failure
+              ('timeout', 'memory', 'killed', or 'error') is recorded in the
+              manifest.
+        - retry_backoff : (default 1) Seconds to wait before the first retry
+              of a calculation, doubling with each further retry.
+        - prefetch, write_behind : (default 1) If executor is
+              'pipeline', the number of calculations whose input may be
+              loaded ahead of the one being computed, and the number of
+              computed calculations whose output may be waiting to be
+              written, respectively.  Larger values overlap more reading,
+              computing, and writing, at the cost of holding the data of
+              more calculations in memory at once.
+        - compact : (default False) If True, when executing in parallel,
+              send each calculation to the workers as a compact
+              specification referencing the objects of the object library
+              by name (see :py:class:`aospy.specs.CompactCalcSpec`), rather
+              than the :py:class:`aospy.Calc` along with its Proj, Model
+              (including its grid data), Run, DataLoader, and Regions.  Each
+              worker imports the library by name and creates the
+              calculations from it, loading each Model's grid data only
+              once.  The library must be importable by the workers and
+              equivalent there to the one used to specify the suite.
+        - shard : (default None) If given, as 'i/N' or (i, N) with
+              0 <= i < N, only perform the calculations of the i-th of N
+              shards of the suite, so that N separate processes or batch
+              jobs, e.g. the tasks of a job array, can each perform one
+              shard without any scheduler (see
+              :py:mod:`aospy.sharding`).  Each shard records its
+              calculations in its own manifest, named after the manifest
+              of the whole suite, and adds their output to its own tar
+              files.  Once all of the shards have finished, combine these
+              via :py:func:`aospy.automate.merge_shards`.
+        - shard_balance : (default True) If True, assign the calculations
+              to shards such that the shards' total estimated costs (see
+              :py:func:`aospy.scheduling.estimate_cost`) are balanced.
+              Otherwise, or if the lazy option is True, assign each
+              calculation by a stable hash of its parameters.
+        - queue : (default None) If given, a directory: rather than
+              performing the calculations, add them to the work queue in
+              that directory on a shared filesystem (see
+              :py:class:`aospy.workqueue.WorkQueue`), from which any number
+              of worker processes, on any machines sharing the filesystem,
+              started via ``python -m aospy.worker <queue_dir>``, take and
+              perform them.  The calculations are added as compact
+              specifications if the object library can be imported by the
+              workers by name.  Of the other options, only the manifest and
+              resume options, and those passed to
+              :py:meth:`aospy.Calc.compute` (write_to_tar, output_backend,
+              output_format, output_encoding, max_threads, and
+              weights_cache), apply.
+        - queue_options : (default None) Dict of options of the work queue,
+              e.g. ``stale_after``, ``heartbeat``, and ``max_attempts``;
+              see :py:meth:`aospy.workqueue.WorkQueue.configure`.
         - write_to_tar : (default True) If True, write results of calculations
               to .tar files, one for each :py:class:`aospy.Run` object.
               These tar files have an identical directory structures the
               standard output relative to their root directory, which is
               specified via the `tar_direc_out` argument of each Proj
               object's instantiation.
+        - output_backend, output_format, output_encoding : (default None)
+              If given, override the output backend ('netcdf', 'zarr', or
+              'consolidated'), the netCDF format, and the compression,
+              chunking, and quantization options of the output, which are
+              otherwise taken from each :py:class:`aospy.Proj`.  See
+              :py:func:`aospy.utils.io.netcdf_encoding`.
+        - manifest : (default True) Where to record the status, timing,
+              output paths, and any error traceback of each calculation.  If
+              True, a JSON manifest is written within the output directory of
+              the first calculation's :py:class:`aospy.Proj`, with a file name
+              that is unique to the set of calculations requested.  If a
+              string, it is used as the path to the manifest.  If False, no
+              manifest is written.
+        - resume : (default False) If True, only perform the calculations
+              that have not already completed successfully according to the
+              manifest, e.g. those that failed or had not yet run when a prior
+              submission of the same suite was interrupted.
 
     Returns
     -------
@@ -478,12 +1101,20 @@ def submit_mult_calcs(calc_suite_specs, exec_options=None):
         result.
 
     If any error occurred during a calculation, the return value is None.
+    If ``plan_only`` is True, the :py:class:`aospy.planning.ExecutionPlan`
+    of the calculations is returned instead.
+    If ``resume`` is True, calculations that had already completed are not
+    included.
+    If ``queue`` is given, the :py:class:`aospy.workqueue.WorkQueue` to
+    which the calculations were added is returned instead.
 
     Raises
     ------
     AospyException
         If the ``prompt_verify`` option is set to True and the user does not
-        respond affirmatively to the prompt.
+        respond affirmatively to the prompt, or if the ``resume`` option is
+        True but the ``manifest`` option is False or the ``lazy`` option is
+        True.
 
     """
     if exec_options is None:
@@ -492,11 +1123,176 @@ def submit_mult_calcs(calc_suite_specs, exec_options=None):
         print(_print_suite_summary(calc_suite_specs))
         _user_verify()
     calc_suite = CalcSuite(calc_suite_specs)
-    calcs = calc_suite.create_calcs()
+    lazy = exec_options.pop('lazy', False)
+    calcs = calc_suite.create_calcs(lazy=lazy)
     if not calcs:
         raise AospyException(
             "The specified combination of parameters yielded zero "
             "calculations.  Most likely, one of the parameters is "
             "inadvertently empty."
         )
-    return _exec_calcs(calcs, **exec_options)
+    plan_only = exec_options.pop('plan_only', False)
+    shard = exec_options.pop('shard', None)
+    shard_balance = exec_options.pop('shard_balance', True)
+    manifest = _get_manifest(calcs, exec_options.pop('manifest', True),
+                             shard=shard)
+    if shard is not None:
+        calcs = sharding.select_shard(calcs, shard, balance=shard_balance)
+        exec_options['shard'] = shard
+        if not calcs and not plan_only:
+            return []
+    if manifest is not None and not plan_only and not lazy:
+        manifest.register(calcs)
+    if exec_options.pop('resume', False):
+        if manifest is None:
+            raise AospyException("The 'resume' option requires a manifest, "
+                                 "but the 'manifest' option is False.")
+        if lazy:
+            raise AospyException("The 'resume' option requires creating the "
+                                 "Calcs up front, so it cannot be combined "
+                                 "with the 'lazy' option.")
+        n_total = len(calcs)
+        calcs = manifest.pending(calcs)
+        logging.info('Resuming from manifest {0}: {1} of {2} calculations '
+                     'remain.'.format(manifest.path, len(calcs), n_total))
+        if not calcs and not plan_only:
+            return []
+    if plan_only:
+        plan = planning.plan_calcs(calcs, _planned_n_workers(calcs,
+                                                             exec_options))
+        print(plan)
+        return plan
+    queue_dir = exec_options.pop('queue', None)
+    if queue_dir is not None:
+        return _enqueue(calcs, queue_dir, calc_suite_specs[_OBJ_LIB_STR],
+                        manifest, exec_options)
+    instrumentation = exec_options.pop('instrument', False)
+    if instrumentation:
+        exec_options['instrument'] = True
+    profiler = _get_profiler(exec_options.pop('profile', False))
+    if exec_options.pop('compact', False):
+        exec_options['library'] = calc_suite_specs[_OBJ_LIB_STR]
+    result = _exec_calcs(calcs, manifest=manifest, profiler=profiler,
+                         **exec_options)
+    if instrumentation:
+        report = instrument.SuiteReport(result)
+        print(report)
+        if isinstance(instrumentation, str):
+            report.to_jsonl(instrumentation)
+    return result
+
+
+def _enqueue(calcs, queue_dir, library, manifest, exec_options):
+    """Add the Calcs to the WorkQueue in the given directory."""
+    queue = workqueue.WorkQueue(queue_dir)
+    compute_kwargs = {name: exec_options[name] for name in
+                      _QUEUE_COMPUTE_OPTIONS if name in exec_options}
+    queue.configure(compute_kwargs=compute_kwargs,
+                    manifest=manifest and manifest.path,
+                    **exec_options.get('queue_options', {}))
+    tasks, = _compact_tasks([list(calcs)], library)
+    n_added = queue.put(tasks)
+    logging.info('Added {0} of {1} calculations to {2}'.format(
+        n_added, len(calcs), queue))
+    return queue
+
+
+def merge_shards(calc_suite_specs, exec_options=None):
+    """Combine the manifests and tar files of the shards of a suite.
+
+    Once every shard of a suite has been performed via
+    :py:func:`submit_mult_calcs` with the ``shard`` option, the manifests of
+    the shards are merged into the manifest of the whole suite, and the tar
+    files of the shards are merged into the tar file of each Run and then
+    removed.  Shards that have not been performed, or that are performed
+    again later, can be merged later on.
+
+    Parameters
+    ----------
+    calc_suite_specs : dict
+        The specifications of the suite, as given to
+        :py:func:`submit_mult_calcs`
+    exec_options : dict or None (default None)
+        The exec options given to :py:func:`submit_mult_calcs` for the
+        shards.  Only the ``lazy`` and ``manifest`` options, which determine
+        the path of the manifest, are used; the others are ignored.
+
+    Returns
+    -------
+    list of str
+        The paths of the merged manifest, if any, and tar files
+    """
+    exec_options = exec_options or dict()
+    calc_suite = CalcSuite(calc_suite_specs)
+    lazy = exec_options.get('lazy', False)
+    calcs = calc_suite.create_calcs(lazy=lazy)
+    merged = []
+    manifest = _get_manifest(calcs, exec_options.get('manifest', True))
+    if manifest is not None:
+        paths = sharding.shard_paths(manifest.path)
+        if paths:
+            manifest.merge(paths)
+            merged.append(manifest.path)
+    if lazy:
+        calcs = calcs.materialize()
+    tar_paths = sorted(set(calc.path_tar_out for calc in calcs
+                           if calc.proj.tar_direc_out))
+    for tar_path in tar_paths:
+        paths = sharding.shard_paths(tar_path)
+        if not paths:
+            continue
+        utils.io.dmget([tar_path])
+        utils.archive.merge_tars(tar_path, paths)
+        for path in paths:
+            for sidecar in [path, utils.archive.index_path(path),
+                            utils.io.lock_path(path)]:
+                if os.path.exists(sidecar):
+                    os.remove(sidecar)
+        merged.append(tar_path)
+    logging.info('Merged the shards of {} files'.format(len(merged)))
+    return merged
+
+
+def _planned_n_workers(calcs, exec_options):
+    """The number of workers the exec options would execute Calcs on."""
+    executor = exec_options.get('executor')
+    if executor == 'processes':
+        return (exec_options.get('max_workers') or
+                _n_workers_for_local_cluster(calcs))
+    if exec_options.get('client') is not None:
+        return _n_workers_of_client(exec_options['client'])
+    if executor == 'distributed' or exec_options.get('parallelize'):
+        return _n_workers_for_local_cluster(calcs)
+    return 1
+
+
+def _get_manifest(calcs, manifest_option, shard=None):
+    """Create the Manifest specified by the 'manifest' exec option.
+
+    If a shard is given, the shard's own counterpart of the manifest of the
+    whole suite is used.
+    """
+    if not manifest_option:
+        return None
+    if manifest_option is True:
+        if isinstance(calcs, CalcSpecs):
+            path = default_manifest_path(calcs, key=lambda spec: spec.key)
+        else:
+            path = default_manifest_path(calcs)
+    else:
+        path = manifest_option
+    if shard is not None:
+        path = sharding.shard_path(path, shard)
+    return Manifest(path)
+
+
+def _get_profiler(profile_option):
+    """Create the Profiler specified by the 'profile' exec option."""
+    if not profile_option:
+        return None
+    if profile_option is True:
+        return instrument.Profiler()
+    options = dict(profile_option)
+    if 'dir' in options:
+        options['direc'] = options.pop('dir')
+    return instrument.Profiler(**options)
@@ -1,10 +1,8 @@
 """Functionality for performing user-specified calculations on aospy data."""
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
-import shutil
-import subprocess
-import tarfile
 from time import ctime
 
 import numpy as np
@@ -12,7 +10,10 @@ import xarray as xr
 
 from ._constants import GRAV_EARTH
 from .var import Var
+from . import instrument
 from . import internal_names
+from . import region as _region
+from .instrument import Recorder
 from . import utils
 
 logging.basicConfig(level=logging.INFO)
@@ -96,6 +97,21 @@ class Calc(object):
     def _path_tar_out(self):
         return os.path.join(self.dir_tar_out, 'data.tar')
 
+    def _zarr_store(self):
+        """Create string of the path to the Run's Zarr output store."""
+        return os.path.join(self.proj.direc_out, self.proj.name,
+                            self.model.name, self.run.name + '.zarr')
+
+    def _consolidated_store(self):
+        """Create string of the path to the Run's consolidated netCDF file."""
+        return os.path.join(self.proj.direc_out, self.proj.name,
+                            self.model.name, self.run.name + '.nc')
+
+    def _store_group(self, dtype_out_time):
+        """Name of the group within the Run's store holding the output."""
+        return '/'.join([self.name,
+                         os.path.splitext(self.file_name[dtype_out_time])[0]])
+
     @staticmethod
     def _print_verbose(*args):
         """Print diagnostic message."""
@@ -235,6 +251,9 @@ class Calc(object):
             self.end_date = utils.times.ensure_datetime(date_range[-1])
 
         self.time_offset = time_offset
+        self.output_backend = self.proj.output_backend
+        self.output_format = self.proj.output_format
+        self.output_encoding = self.proj.output_encoding
         self.data_loader_attrs = dict(
             domain=self.domain, intvl_in=self.intvl_in,
             dtype_in_vert=self.dtype_in_vert,
@@ -248,7 +267,12 @@ class Calc(object):
         self.path_out = {d: self._path_out(d)
                          for d in self.dtype_out_time}
         self.path_tar_out = self._path_tar_out()
+        self.zarr_store = self._zarr_store()
+        self.consolidated_store = self._consolidated_store()
 
+        self.max_threads = 1
+        self.weights_cache = None
+        self.phases = None
         self.data_out = {}
 
     def _to_desired_dates(self, arr):
@@ -328,11 +352,25 @@ class Calc(object):
         else:
             return data
 
+    def _map(self, func, items):
+        """Apply the function to each item, in threads if enabled.
+
+        Up to ``max_threads`` items are processed concurrently.  The results
+        are returned in the same order as the items.
+        """
+        items = list(items)
+        if self.max_threads > 1 and len(items) > 1:
+            func = instrument.propagate(func)
+            with ThreadPoolExecutor(min(self.max_threads,
+                                        len(items))) as executor:
+                return list(executor.map(func, items))
+        return [func(item) for item in items]
+
     def _get_all_data(self, start_date, end_date):
         """Get the needed data from all of the vars in the calculation."""
-        return [self._get_input_data(var, start_date, end_date)
-                for var in _replace_pressure(self.variables,
-                                             self.dtype_in_vert)]
+        return self._map(
+            lambda var: self._get_input_data(var, start_date, end_date),
+            _replace_pressure(self.variables, self.dtype_in_vert))
 
     def _local_ts(self, *data):
         """Perform the computation at each gridpoint and time index."""
@@ -340,7 +378,8 @@ class Calc(object):
 
     def _compute(self, data):
         """Perform the calculation."""
-        local_ts = self._local_ts(*data)
+        with instrument.phase('local_ts'):
+            local_ts = self._local_ts(*data)
         dt = local_ts[internal_names.TIME_WEIGHTS_STR]
         # Convert dt to units of days to prevent overflow
         dt = dt / np.timedelta64(1, 'D')
@@ -353,20 +392,22 @@ class Calc(object):
         # Vertically integrate.
         vert_types = ('vert_int', 'vert_av')
         if self.dtype_out_vert in vert_types and self.var.def_vert:
-            dp = self._get_input_data(_DP_VARS[self.dtype_in_vert],
-                                      self.start_date, self.end_date)
-            full_ts = utils.vertcoord.int_dp_g(full_ts, dp)
-            if self.dtype_out_vert == 'vert_av':
-                ps = self._get_input_data(utils.vertcoord.ps,
+            with instrument.phase('vertical'):
+                dp = self._get_input_data(_DP_VARS[self.dtype_in_vert],
                                           self.start_date, self.end_date)
-                full_ts *= (GRAV_EARTH / ps)
+                full_ts = utils.vertcoord.int_dp_g(full_ts, dp)
+                if self.dtype_out_vert == 'vert_av':
+                    ps = self._get_input_data(utils.vertcoord.ps,
+                                              self.start_date, self.end_date)
+                    full_ts *= (GRAV_EARTH / ps)
         return full_ts, dt
 
     def _full_to_yearly_ts(self, arr, dt):
         """Average the full timeseries within each year."""
         time_defined = self.def_time and not ('av' in self.dtype_in_time)
         if time_defined:
-            arr = utils.times.yearly_average(arr, dt)
+            with instrument.phase('yearly_average'):
+                arr = utils.times.yearly_average(arr, dt)
         return arr
 
     def _time_reduce(self, arr, reduction):
@@ -385,10 +426,25 @@ class Calc(object):
                              "supported".format(reduction))
 
     def region_calcs(self, arr, func):
-        """Perform a calculation for all regions."""
-        # Get pressure values for data output on hybrid vertical coordinates.
-        bool_pfull = (self.def_vert and self.dtype_in_vert ==
-                      internal_names.ETA_STR and self.dtype_out_vert is False)
+        """Perform a calculation for all regions.
+
+        The regional averages of all of the regions are computed at once,
+        by contracting the data with the stacked weights of the regions
+        (see :py:func:`aospy.region.regions_reduce`), and then stored as
+        one variable per region.
+        """
+        regions = list(self.region)
+        # Just pass along the data if averaged already.
+        if 'av' in self.dtype_in_time:
+            func = 'ts'
+        reduced = _region.regions_reduce(regions, arr, func,
+                                         cache=self.weights_cache)
+
+        # Get pressure values for data output on hybrid vertical coordinates,
+        # unless the data is averaged already.
+        bool_pfull = ('av' not in self.dtype_in_time and self.def_vert and
+                      self.dtype_in_vert == internal_names.ETA_STR and
+                      self.dtype_out_vert is False)
         if bool_pfull:
             pfull_data = self._get_input_data(_P_VARS[self.dtype_in_vert],
                                               self.start_date,
@@ -396,26 +452,24 @@ class Calc(object):
             pfull = self._full_to_yearly_ts(
                 pfull_data, arr[internal_names.TIME_WEIGHTS_STR]
             ).rename('pressure')
-        # Loop over the regions, performing the calculation.
-        reg_dat = {}
-        for reg in self.region:
-            # Just pass along the data if averaged already.
-            if 'av' in self.dtype_in_time:
-                data_out = reg.ts(arr)
-            # Otherwise perform the calculation.
-            else:
-                method = getattr(reg, func)
-                data_out = method(arr)
-                if bool_pfull:
-                    # Don't apply e.g. standard deviation to coordinates.
-                    if func not in ['av', 'ts']:
-                        method = reg.ts
-                    # Convert Pa to hPa
-                    coord = method(pfull) * 1e-2
-                    data_out = data_out.assign_coords(
-                        **{reg.name + '_pressure': coord}
-                    )
-            reg_dat.update(**{reg.name: data_out})
+            # Don't apply e.g. standard deviation to coordinates, and
+            # convert Pa to hPa.
+            pressure = _region.regions_reduce(
+                regions, pfull, func if func in ['av', 'ts'] else 'ts',
+                cache=self.weights_cache) * 1e-2
+
+        reg_dat = dict()
+        for i, reg in enumerate(regions):
+            data_out = reduced.isel(**{internal_names.REGION_STR: i}).drop(
+                internal_names.REGION_STR)
+            if bool_pfull:
+                coord = pressure.isel(
+                    **{internal_names.REGION_STR: i}).drop(
+                        internal_names.REGION_STR)
+                data_out = data_out.assign_coords(
+                    **{reg.name + '_pressure': coord}
+                )
+            reg_dat[reg.name] = data_out
         return xr.Dataset(reg_dat)
 
     def _apply_all_time_reductions(self, data):
@@ -427,48 +481,201 @@ class Calc(object):
         for reduc, specs in zip(self.dtype_out_time, reduc_specs):
             func = specs[-1]
             if 'reg' in specs:
-                reduced.update({reduc: self.region_calcs(data, func)})
+                with instrument.phase('region_calcs'):
+                    reduced.update({reduc: self.region_calcs(data, func)})
             else:
-                reduced.update({reduc: self._time_reduce(data, func)})
+                with instrument.phase('time_reduce'):
+                    reduced.update({reduc: self._time_reduce(data, func)})
         return OrderedDict(sorted(reduced.items(), key=lambda t: t[0]))
 
-    def compute(self, write_to_tar=True):
-        """Perform all desired calculations on the data and save externally."""
-        data = self._get_all_data(self.start_date, self.end_date)
+    def compute(self, write_to_tar=True, output_backend=None,
+                output_format=None, output_encoding=None, max_threads=None,
+                instrument=False, weights_cache=None):
+        """Perform all desired calculations on the data and save externally.
+
+        Parameters
+        ----------
+        write_to_tar : bool, optional
+            Whether to also add the output to the Run's .tar archive (default
+            True)
+        output_backend, output_format, output_encoding : optional
+            If given, override the output backend, the netCDF format, and the
+            compression, chunking, and quantization options of the output
+            that are otherwise taken from the parent ``Proj``.  See
+            :py:class:`aospy.Proj`.
+        max_threads : int, optional
+            If greater than 1, the number of threads used to load the data of
+            the input variables concurrently.  Default 1.
+        instrument : bool, optional
+            Whether to record the wall time, bytes read, files opened, and
+            peak resident memory of each phase of the calculation, e.g.
+            finding ('discover'), opening ('open'), and reading ('read') the
+            input files, and saving the output ('save').  If True, they are
+            stored in the ``phases`` attribute; see
+            :py:class:`aospy.instrument.Recorder`.  Default False.
+        weights_cache : str, optional
+            Directory in which the weights of each Region on each grid are
+            saved once computed, and from which they are loaded by any
+            later calculation on the same grid, in this or any other
+            process.  See :py:class:`aospy.region.WeightsCache`.  By default
+            the weights are only cached in the memory of this process, by
+            ``aospy.region.weights_cache``.
+
+        """
+        if not instrument:
+            return self._compute_and_save(write_to_tar, output_backend,
+                                          output_format, output_encoding,
+                                          max_threads, weights_cache)
+        recorder = Recorder()
+        with recorder.recording():
+            self._compute_and_save(write_to_tar, output_backend,
+                                   output_format, output_encoding,
+                                   max_threads, weights_cache)
+        self.phases = recorder.to_dict()
+        return self
+
+    def _compute_and_save(self, write_to_tar, output_backend, output_format,
+                          output_encoding, max_threads, weights_cache=None):
+        """Perform all desired calculations and save the output."""
+        self._configure(output_backend, output_format, output_encoding,
+                        max_threads, weights_cache)
+        reduced = self._reduce(self._load_inputs())
+        self._write_outputs(reduced, write_to_tar)
+        return self
+
+    def _configure(self, output_backend=None, output_format=None,
+                   output_encoding=None, max_threads=None,
+                   weights_cache=None):
+        """Override the given options of the calculation."""
+        if weights_cache is not None:
+            self.weights_cache = _region.WeightsCache(weights_cache)
+        if max_threads is not None:
+            self.max_threads = max_threads
+        if output_backend is not None:
+            self.output_backend = output_backend
+        if output_format is not None:
+            self.output_format = output_format
+        if output_encoding is not None:
+            self.output_encoding = output_encoding
+
+    def _load_inputs(self):
+        """Load the data of all of the input variables."""
+        return self._get_all_data(self.start_date, self.end_date)
+
+    def _reduce(self, data):
+        """Compute all of the desired reductions of the loaded data."""
         logging.info('Computing timeseries for {0} -- '
                      '{1}.'.format(self.start_date, self.end_date))
         full, full_dt = self._compute_full_ts(data)
         full_out = self._full_to_yearly_ts(full, full_dt)
-        reduced = self._apply_all_time_reductions(full_out)
+        return self._apply_all_time_reductions(full_out)
+
+    def _write_outputs(self, reduced, write_to_tar):
+        """Save each of the reductions, and add them to the tar file."""
         logging.info("Writing desired gridded outputs to disk.")
         for dtype_time, data in reduced.items():
             data = _add_metadata_as_attrs(data, self.var.units,
                                           self.var.description,
                                           self.dtype_out_vert)
             self.save(data, dtype_time, dtype_out_vert=self.dtype_out_vert,
-                      save_files=True, write_to_tar=write_to_tar)
-        return self
+                      save_files=True, write_to_tar=False)
+        if write_to_tar and self.proj.tar_direc_out:
+            with instrument.phase('tar'):
+                self._write_to_tar()
 
     def _save_files(self, data, dtype_out_time):
         """Save the data to netcdf files in direc_out."""
+        if self.output_backend == 'zarr':
+            return self._save_zarr(data, dtype_out_time)
+        if self.output_backend == 'consolidated':
+            return self._save_consolidated(data, dtype_out_time)
         path = self.path_out[dtype_out_time]
         if not os.path.isdir(self.dir_out):
             os.makedirs(self.dir_out)
+        if isinstance(data, xr.DataArray):
+            data = xr.Dataset({self.name: data})
+        encoding = utils.io.netcdf_encoding(data, self.output_format,
+                                            **self.output_encoding)
         if 'reg' in dtype_out_time:
-            try:
-                reg_data = xr.open_dataset(path)
-            except (EOFError, RuntimeError, IOError):
-                reg_data = xr.Dataset()
-            reg_data.update(data)
-            data_out = reg_data
+            # Multiple Calcs can write different regions to the same file.
+            with utils.io.path_lock(path):
+                utils.io.upsert_to_netcdf(data, path, engine='netcdf4',
+                                          format=self.output_format,
+                                          encoding=encoding)
         else:
-            data_out = data
-        if isinstance(data_out, xr.DataArray):
-            data_out = xr.Dataset({self.name: data_out})
-        data_out.to_netcdf(path, engine='netcdf4', format='NETCDF3_64BIT')
+            data.to_netcdf(path, engine='netcdf4', format=self.output_format,
+                           encoding=encoding)
 
-    def _write_to_tar(self, dtype_out_time):
-        """Add the data to the tar file in tar_out_direc."""
+    def _save_consolidated(self, data, dtype_out_time):
+        """Save the data to its own group within the Run's netCDF4 file.
+
+        Writes by separate Calcs of the same Run are serialized via a lock
+        on the file, and each replaces the file atomically (see
+        :py:func:`aospy.utils.io.upsert_to_netcdf`), such that a Calc
+        killed while writing leaves the other Calcs' groups intact.
+        """
+        if isinstance(data, xr.DataArray):
+            data = xr.Dataset({self.name: data})
+        encoding = utils.io.netcdf_encoding(data, 'NETCDF4',
+                                            **self.output_encoding)
+        with utils.io.path_lock(self.consolidated_store):
+            utils.io.upsert_to_netcdf(
+                data, self.consolidated_store,
+                group=self._store_group(dtype_out_time), engine='netcdf4',
+                format='NETCDF4', encoding=encoding)
+
+    def _open_zarr(self, dtype_out_time):
+        """Lazily open the output in the Run's Zarr store."""
+        try:
+            return xr.open_zarr(self.zarr_store,
+                                group=self._store_group(dtype_out_time))
+        except (KeyError, ValueError):
+            raise IOError("No output for '{0}' found in Zarr store "
+                          "{1}".format(self._store_group(dtype_out_time),
+                                       self.zarr_store))
+
+    def _save_zarr(self, data, dtype_out_time):
+        """Save the data to its own group within the Run's Zarr store.
+
+        Each output is written to a distinct group, so that Calcs executing
+        in parallel can write to the same store without any locking.
+        """
+        if isinstance(data, xr.DataArray):
+            data = xr.Dataset({self.name: data})
+        group = self._store_group(dtype_out_time)
+        if 'reg' in dtype_out_time:
+            # Regions computed by separate Calcs share a group.
+            with utils.io.path_lock(os.path.join(self.zarr_store, group)):
+                try:
+                    reg_data = self._open_zarr(dtype_out_time).load()
+                except IOError:
+                    reg_data = xr.Dataset()
+                reg_data.update(data)
+                encoding = utils.io.zarr_encoding(reg_data,
+                                                  **self.output_encoding)
+                reg_data.to_zarr(self.zarr_store, mode='w', group=group,
+                                 encoding=encoding)
+        else:
+            encoding = utils.io.zarr_encoding(data, **self.output_encoding)
+            data.to_zarr(self.zarr_store, mode='w', group=group,
+                         encoding=encoding)
+
+    def _tar_members(self, dtypes_out_time=None):
+        """Map the name of each output within the tar file to its path."""
+        if dtypes_out_time is None:
+            dtypes_out_time = self.dtype_out_time
+        return {self.file_name[d]: self.path_out[d] for d in dtypes_out_time}
+
+    def _write_to_tar(self, dtype_out_time=None):
+        """Add the data to the tar file in tar_out_direc.
+
+        If ``dtype_out_time`` is None, all of the Calc's outputs are added at
+        once, which requires rewriting the tar file only once.
+        """
+        if self.output_backend != 'netcdf':
+            logging.info("Output saved via the '{}' backend is not added to "
+                         "tar archives.".format(self.output_backend))
+            return
         # When submitted in parallel and the directory does not exist yet
         # multiple processes may try to create a new directory; this leads
         # to an OSError for all processes that tried to make the
@@ -477,41 +684,9 @@ class Calc(object):
             os.makedirs(self.dir_tar_out)
         except OSError:
             pass
-        # tarfile 'append' mode won't overwrite the old file, which we want.
-        # So open in 'read' mode, extract the file, and then delete it.
-        # But 'read' mode throws OSError if file doesn't exist: make it first.
+        dtypes = None if dtype_out_time is None else [dtype_out_time]
         utils.io.dmget([self.path_tar_out])
-        with tarfile.open(self.path_tar_out, 'a') as tar:
-            pass
-        with tarfile.open(self.path_tar_out, 'r') as tar:
-            old_data_path = os.path.join(self.dir_tar_out,
-                                         self.file_name[dtype_out_time])
-            try:
-                tar.extract(self.file_name[dtype_out_time],
-                            path=old_data_path)
-            except KeyError:
-                pass
-            else:
-                # The os module treats files on archive as non-empty
-                # directories, so can't use os.remove or os.rmdir.
-                shutil.rmtree(old_data_path)
-                retcode = subprocess.call([
-                    "tar", "--delete", "--file={}".format(self.path_tar_out),
-                    self.file_name[dtype_out_time]
-                ])
-                if retcode:
-                    msg = ("The 'tar' command to save your aospy output "
-                           "exited with an error.  Most likely, this is due "
-                           "to using an old version of 'tar' (especially if "
-                           "you are on a Mac).  Consider installing a newer "
-                           "version of 'tar' or disabling tar output by "
-                           "setting `write_to_tar=False` in the "
-                           "`calc_exec_options` argument of "
-                           "`submit_mult_calcs`.")
-                    logging.warn(msg)
-        with tarfile.open(self.path_tar_out, 'a') as tar:
-            tar.add(self.path_out[dtype_out_time],
-                    arcname=self.file_name[dtype_out_time])
+        utils.archive.add_to_tar(self.path_tar_out, self._tar_members(dtypes))
 
     def _update_data_out(self, data, dtype):
         """Append the data of the given dtype_out to the data_out attr."""
@@ -525,15 +700,26 @@ class Calc(object):
         """Save aospy data to data_out attr and to an external file."""
         self._update_data_out(data, dtype_out_time)
         if save_files:
-            self._save_files(data, dtype_out_time)
+            with instrument.phase('save'):
+                self._save_files(data, dtype_out_time)
         if write_to_tar and self.proj.tar_direc_out:
-            self._write_to_tar(dtype_out_time)
+            with instrument.phase('tar'):
+                self._write_to_tar(dtype_out_time)
         logging.info('\t{}'.format(self.path_out[dtype_out_time]))
 
-    def _load_from_disk(self, dtype_out_time, dtype_out_vert=False,
-                        region=False):
-        """Load aospy data saved as netcdf files on the file system."""
-        ds = xr.open_dataset(self.path_out[dtype_out_time])
+    def _read_output(self, dtype_out_time):
+        """Read the entire file holding the given output into memory."""
+        if self.output_backend == 'zarr':
+            with self._open_zarr(dtype_out_time) as ds:
+                return ds.load()
+        if self.output_backend == 'consolidated':
+            return utils.io.load_netcdf(
+                self.consolidated_store,
+                group=self._store_group(dtype_out_time))
+        return utils.io.load_netcdf(self.path_out[dtype_out_time])
+
+    def _select_output(self, ds, dtype_out_vert=False, region=False):
+        """Select this Calc's (possibly regional) output from its Dataset."""
         if region:
             arr = ds[region.name]
             # Use region-specific pressure values if available.
@@ -554,15 +740,23 @@ class Calc(object):
             return arr
         return ds[self.name]
 
+    def _load_from_disk(self, dtype_out_time, dtype_out_vert=False,
+                        region=False):
+        """Load aospy data saved as netcdf files on the file system."""
+        if self.output_backend == 'zarr':
+            ds = self._open_zarr(dtype_out_time)
+        elif self.output_backend == 'consolidated':
+            # Writers replace the store atomically, so it is read without
+            # a lock.
+            ds = xr.open_dataset(self.consolidated_store,
+                                 group=self._store_group(dtype_out_time))
+        else:
+            ds = xr.open_dataset(self.path_out[dtype_out_time])
+        return self._select_output(ds, dtype_out_vert, region)
+
     def _load_from_tar(self, dtype_out_time, dtype_out_vert=False):
-        """Load data save in tarball form on the file system."""
-        path = os.path.join(self.dir_tar_out, 'data.tar')
-        utils.io.dmget([path])
-        with tarfile.open(path, 'r') as data_tar:
-            ds = xr.open_dataset(
-                data_tar.extractfile(self.file_name[dtype_out_time])
-            )
-            return ds[self.name]
+        """Load data saved in tarball form on the file system."""
+        return load_from_tar([self], dtype_out_time)[0]
 
     def load(self, dtype_out_time, dtype_out_vert=False, region=False,
              plot_units=False, mask_unphysical=False):
@@ -591,6 +785,152 @@ class Calc(object):
         return data
 
 
+def _tar_datasets(calcs, dtype_out_time, map_func=map):
+    """Read the archived output files of multiple Calcs into memory.
+
+    Each tar archive is opened once, and ``map_func`` is used to map over the
+    archives, such that they can be read concurrently.
+    """
+    by_archive = OrderedDict()
+    for i, calc in enumerate(calcs):
+        by_archive.setdefault(calc.path_tar_out, []).append(i)
+    utils.io.dmget(list(by_archive))
+
+    def read_archive(item):
+        path, indices = item
+        names = [calcs[i].file_name[dtype_out_time] for i in indices]
+        members = utils.archive.read_tar_members(path, set(names))
+        datasets = {name: utils.io.dataset_from_bytes(members[name])
+                    for name in set(names)}
+        return [(i, datasets[name]) for i, name in zip(indices, names)]
+
+    results = [None] * len(calcs)
+    for archive in map_func(read_archive, by_archive.items()):
+        for i, ds in archive:
+            results[i] = ds
+    return results
+
+
+def load_from_tar(calcs, dtype_out_time):
+    """Load the archived results of multiple Calcs.
+
+    The Calcs are grouped by the tar archive in which their output is stored,
+    and each archive is opened only once, with each requested member read
+    directly from its byte range using the archive's member index.
+
+    Parameters
+    ----------
+    calcs : sequence of aospy.Calc
+        The Calcs whose results are to be loaded
+    dtype_out_time : str
+        The time reduction of the results to load
+
+    Returns
+    -------
+    list of xarray.DataArray
+        The result of each Calc, in the same order as ``calcs``
+    """
+    return [ds[calc.name] for calc, ds
+            in zip(calcs, _tar_datasets(calcs, dtype_out_time))]
+
+
+def _output_key(calc, dtype_out_time):
+    """Identify the physical file (or store group) holding a Calc's output."""
+    if calc.output_backend == 'zarr':
+        return calc.zarr_store, calc._store_group(dtype_out_time)
+    if calc.output_backend == 'consolidated':
+        return calc.consolidated_store, calc._store_group(dtype_out_time)
+    return calc.path_out[dtype_out_time],
+
+
+def _read_output_if_exists(calc, dtype_out_time):
+    try:
+        return calc._read_output(dtype_out_time)
+    except IOError:
+        return None
+
+
+def _label_result(arr, calc, region=None):
+    """Add dimensions identifying the origin of a result."""
+    labels = OrderedDict([('model', calc.model.name), ('run', calc.run.name)])
+    if region is not None:
+        labels['region'] = region.name
+    arr = arr.expand_dims(list(labels))
+    arr = arr.assign_coords(**{dim: [label] for dim, label in labels.items()})
+    return arr.to_dataset(name=calc.name)
+
+
+def load_results(calcs, dtype_out_time, regions=None, max_workers=None):
+    """Load the results of multiple Calcs into a single Dataset.
+
+    Rather than opening an output file once per Calc and region, as repeated
+    calls to :py:meth:`Calc.load` do, the requested results are grouped by
+    the file in which they are stored, and each file is read only once.  The
+    files are read concurrently using a pool of threads.  Results not found
+    in the output directory are read from the tar archives, each archive
+    again being opened only once.
+
+    Parameters
+    ----------
+    calcs : sequence of aospy.Calc
+        The Calcs whose results are to be loaded.  Calcs of the same
+        variable should differ only in their model, run, and regions.
+    dtype_out_time : str
+        The time reduction of the results to load, e.g. 'av' or 'reg.av'
+    regions : sequence of aospy.Region, optional
+        For regional reductions, the regions whose results are to be loaded.
+        By default, the regions of each Calc are used.
+    max_workers : int, optional
+        The maximum number of files to read at once.  Defaults to the
+        default of ``concurrent.futures.ThreadPoolExecutor``.
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset with one data variable per variable name, each with
+        dimensions ``model`` and ``run`` (plus ``region`` for regional
+        reductions) in addition to those of the results themselves.
+
+    Raises
+    ------
+    ValueError
+        If ``regions`` is specified for a non-regional reduction
+    """
+    regional = 'reg' in dtype_out_time
+    if regions is not None and not regional:
+        raise ValueError("Regions can only be specified for regional "
+                         "reductions; got dtype_out_time "
+                         "'{}'".format(dtype_out_time))
+    by_file = OrderedDict()
+    for calc in calcs:
+        by_file.setdefault(_output_key(calc, dtype_out_time), []).append(calc)
+    keys = list(by_file)
+    first_calcs = [by_file[key][0] for key in keys]
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        datasets = list(executor.map(
+            lambda calc: _read_output_if_exists(calc, dtype_out_time),
+            first_calcs))
+        missing = [i for i, ds in enumerate(datasets) if ds is None]
+        if missing:
+            archived = _tar_datasets([first_calcs[i] for i in missing],
+                                     dtype_out_time, map_func=executor.map)
+            for i, ds in zip(missing, archived):
+                datasets[i] = ds
+
+    results = []
+    for key, ds in zip(keys, datasets):
+        for calc in by_file[key]:
+            if not regional:
+                results.append(_label_result(ds[calc.name], calc))
+                continue
+            calc_regions = calc.region or [] if regions is None else regions
+            for region in calc_regions:
+                arr = calc._select_output(ds, calc.dtype_out_vert, region)
+                results.append(_label_result(arr, calc, region))
+    return xr.merge(results)
+
+
 def _add_metadata_as_attrs(data, units, description, dtype_out_vert):
     """Add metadata attributes to Dataset or DataArray"""
     if isinstance(data, xr.DataArray):
@@ -0,0 +1,262 @@
+"""The ``aospy`` command-line interface.
+
+``aospy run <spec>`` submits the suite of calculations specified by
+``<spec>``, which is either a Python module defining the dicts
+``calc_suite_specs`` and, optionally, ``calc_exec_options`` (as in
+``examples/aospy_main.py``), given by its path or importable name, or a
+YAML file with those two mappings, in which the library is given by its
+importable name and its objects by their names.  Options given on the
+command line take precedence over those in ``calc_exec_options``.
+
+``aospy merge <spec>`` merges the manifests and tar files of the shards of
+a suite performed via ``aospy run --shard i/N``.
+
+The command imports the aospy package, and so xarray and dask, before it
+parses its arguments, so that even ``aospy --help`` takes as long as
+``import aospy``; the command itself imports nothing beyond that.
+"""
+import argparse
+import datetime
+import importlib
+import logging
+import os
+import sys
+
+from .automate import merge_shards, submit_mult_calcs
+from .specs import ObjectLibrary
+
+
+_SUITE_STR = 'calc_suite_specs'
+_EXEC_STR = 'calc_exec_options'
+_YAML_EXTENSIONS = ('.yml', '.yaml')
+# The specs of a YAML file given by name, and the kind of their objects.
+_YAML_OBJECT_SPECS = [('projects', 'proj'), ('models', 'model'),
+                      ('variables', 'var'), ('regions', 'region')]
+
+
+def _import_file(path):
+    """Import the Python file at the given path as a module.
+
+    Its directory is added to the module search path, so that, as when
+    executing it as a script, it can import e.g. an object library
+    alongside it.
+    """
+    import importlib.util
+    direc = os.path.dirname(os.path.abspath(path))
+    if direc not in sys.path:
+        sys.path.insert(0, direc)
+    name = os.path.splitext(os.path.basename(path))[0]
+    module_spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    return module
+
+
+def _to_datetime(value):
+    # YAML parses dates as datetime.date, which aospy does not accept.
+    if (isinstance(value, datetime.date) and
+            not isinstance(value, datetime.datetime)):
+        return datetime.datetime(value.year, value.month, value.day)
+    return value
+
+
+def _resolve_yaml_specs(specs):
+    """Replace the names of the library and its objects with the objects."""
+    specs = dict(specs)
+    library = importlib.import_module(specs['library'])
+    specs['library'] = library
+    obj_lib = ObjectLibrary(library)
+    for name, kind in _YAML_OBJECT_SPECS:
+        if isinstance(specs.get(name), list):
+            specs[name] = [obj_lib.find(kind, obj) if isinstance(obj, str)
+                           else obj for obj in specs[name]]
+    if isinstance(specs.get('runs'), list):
+        models = specs.get('models')
+        if not isinstance(models, list):
+            models = None
+        runs = []
+        for run in specs['runs']:
+            found = obj_lib.find_runs(run, models)
+            if not found:
+                raise KeyError("Object library '{0}' has no Run named "
+                               "'{1}'".format(obj_lib.name, run))
+            runs.extend(found)
+        specs['runs'] = runs
+    if isinstance(specs.get('date_ranges'), list):
+        specs['date_ranges'] = [tuple(_to_datetime(date) for date in dates)
+                                for dates in specs['date_ranges']]
+    return specs
+
+
+def _load_yaml(path):
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError('Reading suite specifications from YAML requires '
+                          'PyYAML, which is not installed')
+    with open(path) as f:
+        contents = yaml.safe_load(f) or {}
+    direc = os.path.dirname(os.path.abspath(path))
+    if direc not in sys.path:
+        sys.path.insert(0, direc)
+    return (_resolve_yaml_specs(contents[_SUITE_STR]),
+            dict(contents.get(_EXEC_STR) or {}))
+
+
+def load_spec(spec):
+    """Load the specifications of a suite of calculations.
+
+    Parameters
+    ----------
+    spec : str
+        The path to a YAML file (with extension '.yml' or '.yaml') or to a
+        Python file, or the importable name of a Python module.  The Python
+        module must define the dict ``calc_suite_specs`` and may define the
+        dict ``calc_exec_options``, which are given to
+        :py:func:`aospy.submit_mult_calcs`.  The YAML file must have a
+        mapping ``calc_suite_specs`` and may have a mapping
+        ``calc_exec_options``.  In it, ``library`` is the importable name of
+        the object library, and the ``projects``, ``models``, ``runs``,
+        ``variables``, and ``regions`` may be lists of the names of the
+        library's objects.
+
+    Returns
+    -------
+    calc_suite_specs, calc_exec_options : dict
+    """
+    if spec.endswith(_YAML_EXTENSIONS):
+        return _load_yaml(spec)
+    if spec.endswith('.py') or os.path.isfile(spec):
+        module = _import_file(spec)
+    else:
+        module = importlib.import_module(spec)
+    try:
+        suite_specs = getattr(module, _SUITE_STR)
+    except AttributeError:
+        raise AttributeError("The module '{0}' does not define "
+                             "'{1}'".format(spec, _SUITE_STR))
+    return suite_specs, dict(getattr(module, _EXEC_STR, None) or {})
+
+
+def _exec_options(args):
+    """The exec options set by the command-line arguments."""
+    options = dict()
+    if args.yes:
+        options['prompt_verify'] = False
+    for name in ['executor', 'max_workers', 'memory_budget', 'shard',
+                 'queue']:
+        value = getattr(args, name)
+        if value is not None:
+            options[name] = value
+    if args.plan:
+        options['plan_only'] = True
+    if args.resume:
+        options['resume'] = True
+    if args.lazy:
+        options['lazy'] = True
+    if args.no_tar:
+        options['write_to_tar'] = False
+    if args.profile is not None:
+        options['profile'] = dict(dir=args.profile) if args.profile else True
+    if args.instrument is not None:
+        options['instrument'] = args.instrument or True
+    return options
+
+
+def _run(args):
+    suite_specs, exec_options = load_spec(args.spec)
+    exec_options.update(_exec_options(args))
+    executes = not (exec_options.get('plan_only') or
+                    exec_options.get('queue'))
+    result = submit_mult_calcs(suite_specs, exec_options)
+    if not executes:
+        return 0
+    n_failed = sum(calc is None for calc in result)
+    if n_failed:
+        logging.error('{0} of {1} calculations failed'.format(n_failed,
+                                                              len(result)))
+        return 1
+    return 0
+
+
+def _merge(args):
+    suite_specs, exec_options = load_spec(args.spec)
+    if args.lazy:
+        exec_options['lazy'] = True
+    for path in merge_shards(suite_specs, exec_options):
+        print(path)
+    return 0
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog='aospy', description='Automated gridded climate data analysis '
+        'and management.')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='log progress')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run = commands.add_parser(
+        'run', help='perform a suite of calculations',
+        description='Perform the suite of calculations specified by a '
+        'Python module or YAML file.')
+    run.add_argument('spec', help='path to a YAML or Python file, or name '
+                     'of a Python module, specifying the suite')
+    run.add_argument('-y', '--yes', action='store_true',
+                     help="don't prompt for confirmation")
+    run.add_argument('--executor',
+                     choices=['distributed', 'processes', 'pipeline'],
+                     help='how to execute the calculations')
+    run.add_argument('-n', '--max-workers', type=int,
+                     help='number of worker processes')
+    run.add_argument('--memory-budget', metavar='BYTES',
+                     help="total memory of the calculations executing at "
+                     "once, e.g. '16GB'")
+    run.add_argument('--plan', '--dry-run', action='store_true',
+                     help='only plan the calculations, without performing '
+                     'them')
+    run.add_argument('--resume', action='store_true',
+                     help='only perform the calculations not completed '
+                     'according to the manifest')
+    run.add_argument('--lazy', action='store_true',
+                     help='create each calculation only when it is executed')
+    run.add_argument('--profile', nargs='?', const='', metavar='DIR',
+                     help='profile the calculations, writing the profiles '
+                     'to DIR or alongside their output')
+    run.add_argument('--instrument', nargs='?', const='', metavar='PATH',
+                     help='report the time, I/O, and memory of each phase of '
+                     'the calculations, also writing them to PATH')
+    run.add_argument('--shard', metavar='I/N',
+                     help='only perform the I-th of N shards of the suite')
+    run.add_argument('--queue', metavar='DIR',
+                     help='add the calculations to the work queue in DIR '
+                     'rather than performing them')
+    run.add_argument('--no-tar', action='store_true',
+                     help="don't write the output to tar files")
+    run.set_defaults(func=_run)
+
+    merge = commands.add_parser(
+        'merge', help='merge the manifests and tar files of shards',
+        description='Merge the manifests and tar files of the shards of the '
+        'suite specified by a Python module or YAML file.')
+    merge.add_argument('spec', help='path to a YAML or Python file, or name '
+                       'of a Python module, specifying the suite')
+    merge.add_argument('--lazy', action='store_true',
+                       help='the shards were performed with --lazy')
+    merge.set_defaults(func=_merge)
+    return parser
+
+
+def main(argv=None):
+    """Execute the ``aospy`` command with the given arguments.
+
+    Returns
+    -------
+    int
+        The exit status: 0 on success, 1 if any calculation failed
+    """
+    args = _parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else
+                        logging.WARNING)
+    return args.func(args)
@@ -2,6 +2,7 @@
 import logging
 import os
 import pprint
+import threading
 
 import numpy as np
 import xarray as xr
@@ -12,8 +13,15 @@ from .internal_names import (
     TIME_STR,
     TIME_BOUNDS_STR,
 )
+from . import instrument
 from .utils import times, io
 
+# xarray's options are global, so setting them temporarily in concurrent
+# threads (e.g. of a distributed worker) would otherwise race.  Any
+# computation while the lock is held runs synchronously, so that it cannot
+# wait on another thread that is itself waiting for the lock.
+_XR_OPTIONS_LOCK = threading.Lock()
+
 
 def _preprocess_and_rename_grid_attrs(func, **kwargs):
     """Call a custom preprocessing method first then rename grid attrs.
@@ -186,7 +194,8 @@ def _prep_time_data(ds):
                         "values in time, even though this may not be "
                         "the case")
         ds = times.add_uniform_time_weights(ds)
-    with xr.set_options(enable_cftimeindex=True):
+    with _XR_OPTIONS_LOCK, io.synchronous_dask(), \
+            xr.set_options(enable_cftimeindex=True):
         ds = xr.decode_cf(ds, decode_times=True, decode_coords=False,
                           mask_and_scale=True)
     return ds
@@ -217,11 +226,18 @@ def _load_data_from_disk(file_set, preprocess_func=lambda ds: ds,
     Dataset
     """
     apply_preload_user_commands(file_set)
+    instrument.count_files(file_set)
     func = _preprocess_and_rename_grid_attrs(preprocess_func, **kwargs)
-    return xr.open_mfdataset(file_set, preprocess=func, concat_dim=TIME_STR,
-                             decode_times=False, decode_coords=False,
-                             mask_and_scale=True, data_vars=data_vars,
-                             coords=coords)
+    # Opening the files reads from them outside of the lock used for reading
+    # their data, so the lock is also held while opening them.  Any data
+    # computed while opening them is then computed in this thread, which
+    # already holds the lock.
+    with io._NETCDF4_LOCK, io.synchronous_dask():
+        return xr.open_mfdataset(file_set, preprocess=func,
+                                 concat_dim=TIME_STR, decode_times=False,
+                                 decode_coords=False, mask_and_scale=True,
+                                 data_vars=data_vars, coords=coords,
+                                 lock=io._NETCDF4_LOCK)
 
 
 def apply_preload_user_commands(file_set, cmd=io.dmget):
@@ -270,15 +286,19 @@ class DataLoader(object):
         da : DataArray
              DataArray for the specified variable, date range, and interval in
         """
-        file_set = self._generate_file_set(var=var, start_date=start_date,
-                                           end_date=end_date, **DataAttrs)
-        ds = _load_data_from_disk(
-            file_set, self.preprocess_func, data_vars=self.data_vars,
-            coords=self.coords, start_date=start_date, end_date=end_date,
-            time_offset=time_offset, **DataAttrs
-        )
+        with instrument.phase('discover'):
+            file_set = self._generate_file_set(
+                var=var, start_date=start_date, end_date=end_date,
+                **DataAttrs)
+        with instrument.phase('open'):
+            ds = _load_data_from_disk(
+                file_set, self.preprocess_func, data_vars=self.data_vars,
+                coords=self.coords, start_date=start_date, end_date=end_date,
+                time_offset=time_offset, **DataAttrs
+            )
         if var.def_time:
-            ds = _prep_time_data(ds)
+            with instrument.phase('decode'):
+                ds = _prep_time_data(ds)
             start_date = times.maybe_convert_to_index_date_type(
                 ds.indexes[TIME_STR], start_date)
             end_date = times.maybe_convert_to_index_date_type(
@@ -287,8 +307,8 @@ class DataLoader(object):
         da = _sel_var(ds, var, self.upcast_float32)
         if var.def_time:
             da = self._maybe_apply_time_shift(da, time_offset, **DataAttrs)
-            return times.sel_time(da, start_date, end_date).load()
-        else:
+            da = times.sel_time(da, start_date, end_date)
+        with instrument.phase('read'):
             return da.load()
 
     def _load_or_get_from_model(self, var, start_date=None, end_date=None,
@@ -121,6 +121,11 @@ calc_exec_options = dict(
     # standard output relative to their root directory, which is specified via
     # the `tar_direc_out` argument of each Proj object's instantiation.
     write_to_tar=True,
+
+    # Only perform the calculations that did not complete successfully the
+    # last time this same suite was submitted, according to the manifest that
+    # is written to each Proj object's `direc_out`.
+    resume=False,
 )
 
 
@@ -0,0 +1,450 @@
+"""Lightweight executors for running suites of calculations in parallel."""
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import logging
+from multiprocessing import cpu_count
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import traceback
+
+import cloudpickle
+import psutil
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .utils.io import synchronous_dask
+
+
+DONE = 'done'
+ERROR = 'error'
+MEMORY = 'memory'
+TIMEOUT = 'timeout'
+KILLED = 'killed'
+
+
+class _PeakMemory(object):
+    """Context manager measuring the peak increase in resident memory.
+
+    The resident memory of the process is sampled in a background thread
+    every ``interval`` seconds, relative to that on entering the context.
+    """
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+
+    def _sample(self):
+        rss = self._process.memory_info().rss
+        self.peak = max(self.peak, rss - self._baseline)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._baseline = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def _call_pickled(payload):
+    """Call a cloudpickled function on its argument; pickle the result.
+
+    The worker processes are themselves the unit of parallelism, and dask's
+    default thread pool, if already created in the parent process, does not
+    survive being forked into the worker, so dask is run synchronously.
+
+    The result is returned along with the peak increase in the worker's
+    resident memory during the call if ``measure`` is True, or otherwise
+    None, so that no sampling thread is started unless it is needed.
+    """
+    func, arg, measure = cloudpickle.loads(payload)
+    peak = None
+    with synchronous_dask():
+        if measure:
+            with _PeakMemory() as memory:
+                result = func(arg)
+            peak = memory.peak
+        else:
+            result = func(arg)
+    return cloudpickle.dumps((result, peak))
+
+
+class _Waiting(object):
+    """Items waiting for submission, in order.
+
+    If an admission controller is given, the next item is only submitted
+    once the controller admits it.
+    """
+    def __init__(self, indices, admission=None):
+        self._queue = deque(indices)
+        self.admission = admission
+
+    def __len__(self):
+        return len(self._queue)
+
+    def pop(self, force=False):
+        """Remove and return the next item if admitted, otherwise None."""
+        if not self._queue:
+            return None
+        if (self.admission is not None and
+                not self.admission.admit(self._queue[0], force=force)):
+            return None
+        return self._queue.popleft()
+
+
+def _map_until_broken(executor, func, items, queue, results, max_workers,
+                      admission=None):
+    """Submit items from the queue, at most ``max_workers`` at a time.
+
+    Returns once all items are finished, or as soon as the pool is broken
+    (e.g. by a worker being killed), in which case the items in flight are
+    recorded as failed.
+    """
+    in_flight = {}
+    try:
+        while queue or in_flight:
+            while queue and len(in_flight) < max_workers:
+                i = queue.pop(force=not in_flight)
+                if i is None:
+                    break
+                payload = cloudpickle.dumps((func, items[i],
+                                             admission is not None))
+                in_flight[executor.submit(_call_pickled, payload)] = i
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = in_flight.pop(future)
+                peak = None
+                try:
+                    results[i], peak = cloudpickle.loads(future.result())
+                except BrokenProcessPool:
+                    raise
+                except Exception:
+                    logging.warning('Unable to retrieve the result for '
+                                    '{0}'.format(items[i]), exc_info=True)
+                finally:
+                    if admission is not None:
+                        admission.release(i, peak)
+    except BrokenProcessPool:
+        failed = [items[i] for i in in_flight]
+        logging.warning('A worker process died unexpectedly; no results '
+                        'for {0}.  Restarting the process '
+                        'pool.'.format(failed))
+        if admission is not None:
+            for i in in_flight.values():
+                admission.release(i)
+        in_flight.clear()
+    return queue
+
+
+def map_on_process_pool(func, items, max_workers=None, admission=None):
+    """Apply a function to each item in a pool of worker processes.
+
+    At most ``max_workers`` items are in flight at any time: each item is
+    only serialized and submitted once a worker is free for it, so that the
+    memory used at once is bounded by that of ``max_workers`` items.  The
+    function and items are serialized with cloudpickle, so they need not be
+    picklable by the standard library.
+
+    If a worker process dies (e.g. is killed for using too much memory), the
+    items it and the other workers were processing are recorded as failed,
+    and the remaining items are processed in a new pool.
+
+    If an admission controller is given, an item is only submitted once the
+    controller admits it, e.g. once enough memory is available for it, in
+    the order given by the controller's queue of waiting items.  If no item
+    is in flight, the next item is submitted regardless.  The peak memory
+    of each item is only measured, in a thread sampling the worker's
+    resident memory, if an admission controller is given.
+
+    Parameters
+    ----------
+    func : callable
+        The function to apply to each item
+    items : sequence
+        The items to which the function is applied
+    max_workers : int, optional
+        The number of worker processes.  Defaults to the number of CPUs.
+    admission : object, optional
+        An admission controller, such as
+        :py:class:`aospy.scheduling.AdmissionController`, with methods
+        ``waiting(indices)``, returning the queue of the items waiting for
+        admission, from which ``pop(force=False)`` admits and returns the
+        next item, or returns None if none is admitted, and
+        ``release(i, peak=None)``, called with the peak increase in the
+        worker's resident memory, in bytes, once the i-th item is finished.
+
+    Returns
+    -------
+    list
+        The result of applying ``func`` to each item, in the same order as
+        ``items``, or None for any item whose result could not be obtained
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if max_workers is None:
+        max_workers = cpu_count()
+    max_workers = max(1, min(max_workers, len(items)))
+    if admission is None:
+        queue = _Waiting(range(len(items)))
+    else:
+        queue = admission.waiting(range(len(items)))
+    while queue:
+        with ProcessPoolExecutor(max_workers) as executor:
+            queue = _map_until_broken(executor, func, items, queue, results,
+                                      max_workers, admission)
+    return results
+
+
+class ResourceLimits(object):
+    """Limits on the execution of each calculation in its own process.
+
+    Parameters
+    ----------
+    timeout : float, optional
+        Wall-clock time, in seconds, after which the process is killed.
+        By default there is no limit.
+    memory_limit : int, optional
+        Number of bytes by which the process's virtual address space may
+        grow while executing, enforced via ``RLIMIT_AS``, beyond which
+        allocations fail with a MemoryError.  Not supported on platforms
+        without the :py:mod:`resource` module.  By default there is no
+        limit.
+    retries : int, optional
+        Number of times an execution that timed out, exceeded the memory
+        limit, or was killed is retried.  Default 0.
+    backoff : float, optional
+        Seconds to wait before the first retry; the wait doubles with each
+        further retry.  Default 1.
+    """
+    def __init__(self, timeout=None, memory_limit=None, retries=0,
+                 backoff=1.):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.retries = retries
+        self.backoff = backoff
+
+    def delay(self, attempt):
+        """Seconds to wait before the given (1-based) retry."""
+        return self.backoff * 2 ** (attempt - 1)
+
+
+def _limit_memory(nbytes):
+    """Limit the growth of the process's address space to ``nbytes``."""
+    if resource is None:
+        logging.warning('Memory limits are not supported on this platform')
+        return
+    baseline = psutil.Process().memory_info().vms
+    limit = baseline + int(nbytes)
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _run_isolated(result_path, memory_limit=None):
+    """Call the cloudpickled function on its argument read from stdin.
+
+    Entry point of the process started by :py:func:`call_isolated`; the
+    outcome is cloudpickled to ``result_path``.
+    """
+    func, arg = cloudpickle.loads(sys.stdin.buffer.read())
+    try:
+        if memory_limit is not None:
+            _limit_memory(memory_limit)
+        with synchronous_dask():
+            outcome = DONE, func(arg)
+    except MemoryError:
+        outcome = MEMORY, traceback.format_exc()
+    except Exception:
+        outcome = ERROR, traceback.format_exc()
+    payload = cloudpickle.dumps(outcome)
+    if resource is not None:
+        # Pickling the result must not itself fail against the limit.
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (hard, hard))
+    with open(result_path + '.part', 'wb') as f:
+        f.write(payload)
+    os.replace(result_path + '.part', result_path)
+
+
+def call_isolated(func, arg, timeout=None, memory_limit=None):
+    """Apply a function to an argument in a separate Python process.
+
+    A new interpreter is started for each call, rather than forking, so that
+    this can also be used from within the daemonic worker processes of
+    process pools and distributed clusters.  The function and argument are
+    serialized with cloudpickle.
+
+    Parameters
+    ----------
+    func : callable
+    arg : object
+    timeout : float, optional
+        Wall-clock time, in seconds, after which the process is killed
+    memory_limit : int, optional
+        Number of bytes by which the process's address space may grow while
+        calling the function (see :py:class:`ResourceLimits`)
+
+    Returns
+    -------
+    outcome : {'done', 'error', 'memory', 'timeout', 'killed'}
+        'done' if the function returned; 'error' if it raised an exception;
+        'memory' if it raised a MemoryError; 'timeout' if it was killed
+        after ``timeout`` seconds; 'killed' if the process died otherwise,
+        e.g. by being killed by the operating system for using too much
+        memory.
+    value : object
+        The value returned if 'done', the traceback if 'error' or 'memory',
+        or else a description of how the process ended
+    """
+    payload = cloudpickle.dumps((func, arg))
+    fd, result_path = tempfile.mkstemp(prefix='aospy-result-')
+    os.close(fd)
+    code = ('from aospy.executors import _run_isolated; '
+            '_run_isolated({0!r}, {1!r})'.format(result_path, memory_limit))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path)
+    try:
+        process = subprocess.Popen([sys.executable, '-c', code],
+                                   stdin=subprocess.PIPE, env=env)
+        try:
+            process.communicate(payload, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            return TIMEOUT, 'Killed after {} seconds'.format(timeout)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        if os.path.getsize(result_path):
+            with open(result_path, 'rb') as f:
+                return cloudpickle.loads(f.read())
+        return KILLED, 'Exited with code {}'.format(process.returncode)
+    finally:
+        for path in (result_path, result_path + '.part'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+_END = object()
+
+
+class _StageFailure(object):
+    """Exception raised by a stage, passed along to the following stages."""
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def _put(queue_, item, stop, poll=0.1):
+    """Put the item into the queue; return False if stopped first."""
+    while not stop.is_set():
+        try:
+            queue_.put(item, timeout=poll)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _drain(queue_, stop, poll=0.1):
+    """Yield the items put into the queue until the end of the stream.
+
+    An exception raised by an earlier stage is re-raised.
+    """
+    while not stop.is_set():
+        try:
+            item = queue_.get(timeout=poll)
+        except queue.Empty:
+            continue
+        if item is _END:
+            return
+        if isinstance(item, _StageFailure):
+            raise item.exception
+        yield item
+
+
+def _run_stage(func, source, queue_, stop):
+    """Apply the function to each item from the source, in order."""
+    try:
+        for item in source:
+            if not _put(queue_, func(item), stop):
+                return
+    except BaseException as e:
+        _put(queue_, _StageFailure(e), stop)
+    else:
+        _put(queue_, _END, stop)
+
+
+def map_pipelined(stages, items, depths=None):
+    """Apply a sequence of functions to each item, in a pipeline of threads.
+
+    The result of each stage (function) for an item is passed to the next
+    stage.  Each stage but the last executes in its own thread, processing
+    the items in order, so that e.g. reading the input of the next items
+    overlaps with computing on the current one and with writing the output
+    of the previous ones.  The last stage executes in the calling thread.
+
+    Parameters
+    ----------
+    stages : sequence of callable
+        The functions applied in turn to each item
+    items : iterable
+        The items to which the first function is applied
+    depths : sequence of int, optional
+        For each stage but the last, the number of its results that may wait
+        to be processed by the following stage, which bounds the memory used
+        by results computed ahead.  By default 1 for each stage.
+
+    Returns
+    -------
+    list
+        The result of the last stage for each item, in the same order as
+        ``items``
+
+    Raises
+    ------
+    Exception
+        Any exception raised by a stage, after stopping all of the stages
+    """
+    stages = list(stages)
+    if depths is None:
+        depths = [1] * (len(stages) - 1)
+    if len(depths) != len(stages) - 1:
+        raise ValueError('One depth is required for each stage but the '
+                         'last; got {0} for {1} stages'.format(len(depths),
+                                                               len(stages)))
+    stop = threading.Event()
+    threads = []
+    source = iter(items)
+    for func, depth in zip(stages[:-1], depths):
+        queue_ = queue.Queue(maxsize=max(1, depth))
+        thread = threading.Thread(target=_run_stage,
+                                  args=(func, source, queue_, stop))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+        source = _drain(queue_, stop)
+    try:
+        return [stages[-1](item) for item in source]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
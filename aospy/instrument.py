@@ -0,0 +1,365 @@
+"""Recording the time, I/O, and memory of each phase of a calculation."""
+from collections import OrderedDict
+import cProfile
+import glob
+import json
+import os
+import pstats
+import threading
+import time
+
+import psutil
+
+from .utils.io import _format_bytes, synchronous_dask
+
+
+PHASES = ('discover', 'open', 'decode', 'read', 'local_ts', 'vertical',
+          'yearly_average', 'time_reduce', 'region_calcs', 'save', 'tar')
+TOTAL = 'total'
+
+_state = threading.local()
+
+
+class _NullPhase(object):
+    """Phase recording nothing, used when instrumentation is disabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+def _new_stats():
+    return OrderedDict([('calls', 0), ('seconds', 0.), ('bytes_read', 0),
+                        ('files_opened', 0), ('peak_rss', 0)])
+
+
+def _bytes_read(process):
+    """The number of bytes the process has read, or None if unavailable.
+
+    On Linux this includes reads served from the page cache.
+    """
+    try:
+        counters = process.io_counters()
+    except (AttributeError, NotImplementedError, psutil.Error, OSError):
+        return None
+    return getattr(counters, 'read_chars', counters.read_bytes)
+
+
+class _Phase(object):
+    """Context manager adding one execution of a phase to a Recorder."""
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self._bytes_read = _bytes_read(self.recorder._process)
+        self._files_opened = self.recorder._files_opened
+        self._peak_rss = 0
+        with self.recorder._lock:
+            self.recorder._active.append(self)
+        self.recorder._update_peaks(self.recorder._rss())
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.time() - self._start
+        bytes_read = _bytes_read(self.recorder._process)
+        self.recorder._update_peaks(self.recorder._rss())
+        with self.recorder._lock:
+            self.recorder._active.remove(self)
+            stats = self.recorder.phases.setdefault(self.name, _new_stats())
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            if bytes_read is not None and self._bytes_read is not None:
+                stats['bytes_read'] += bytes_read - self._bytes_read
+            stats['files_opened'] += (self.recorder._files_opened -
+                                      self._files_opened)
+            stats['peak_rss'] = max(stats['peak_rss'], self._peak_rss)
+
+
+class Recorder(object):
+    """Records the cost of each phase of the execution of a calculation.
+
+    For each phase, the number of times it was executed ('calls'), and in
+    total over those executions the wall time in seconds ('seconds'), the
+    bytes read by the process ('bytes_read'), and the number of input files
+    opened ('files_opened'), as well as the peak resident memory of the
+    process in bytes ('peak_rss'), are recorded in the ``phases`` attribute.
+    Phases may be nested, e.g. loading the pressure thickness within
+    vertical integration, in which case the outer phase includes the inner.
+    The 'total' phase spans the entire recording.
+
+    The bytes read and the resident memory are those of the whole process,
+    so they also include those of anything else executing concurrently in
+    other threads of the same process.
+
+    Parameters
+    ----------
+    interval : float, optional
+        How often, in seconds, to sample the resident memory.  Default 0.05.
+    """
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.phases = OrderedDict()
+        self._process = psutil.Process()
+        self._lock = threading.Lock()
+        self._active = []
+        self._files_opened = 0
+
+    def _rss(self):
+        try:
+            return self._process.memory_info().rss
+        except psutil.Error:
+            return 0
+
+    def _update_peaks(self, rss):
+        with self._lock:
+            for phase in self._active:
+                phase._peak_rss = max(phase._peak_rss, rss)
+
+    def _sample(self, stop):
+        while not stop.wait(self.interval):
+            self._update_peaks(self._rss())
+
+    def phase(self, name):
+        """Context manager recording one execution of the named phase."""
+        return _Phase(self, name)
+
+    def count_files(self, n):
+        """Add to the number of files opened by the active phases."""
+        with self._lock:
+            self._files_opened += n
+
+    def recording(self):
+        """Context manager under which :py:func:`phase` records into this
+        Recorder, in the current thread."""
+        return _Recording(self)
+
+    def to_dict(self):
+        """The recorded phases as a JSON-serializable dict."""
+        return OrderedDict((name, dict(stats)) for name, stats
+                           in self.phases.items())
+
+
+class _Recording(object):
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def __enter__(self):
+        self._previous = getattr(_state, 'recorder', None)
+        _state.recorder = self.recorder
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self.recorder._sample,
+                                         args=(self._stop,))
+        self._sampler.daemon = True
+        self._sampler.start()
+        self._total = self.recorder.phase(TOTAL).__enter__()
+        return self.recorder
+
+    def __exit__(self, *exc):
+        self._total.__exit__(*exc)
+        self._stop.set()
+        self._sampler.join()
+        _state.recorder = self._previous
+
+
+def phase(name):
+    """Context manager recording one execution of the named phase.
+
+    The phase is recorded by the Recorder recording in the current thread,
+    if any; otherwise nothing is done, at the cost of one attribute lookup.
+    """
+    recorder = getattr(_state, 'recorder', None)
+    if recorder is None:
+        return _NULL_PHASE
+    return recorder.phase(name)
+
+
+def count_files(file_set):
+    """Count the files opened, if recording in the current thread.
+
+    Parameters
+    ----------
+    file_set : list or str
+        List of paths to files or glob-string
+    """
+    recorder = getattr(_state, 'recorder', None)
+    if recorder is None:
+        return
+    if isinstance(file_set, str):
+        file_set = glob.glob(file_set)
+    recorder.count_files(len(file_set))
+
+
+def propagate(func):
+    """Wrap the function to record into the current thread's Recorder.
+
+    Used for functions executed in other threads on behalf of the current
+    one, e.g. by a thread pool.
+    """
+    recorder = getattr(_state, 'recorder', None)
+    if recorder is None:
+        return func
+
+    def recorded(*args, **kwargs):
+        previous = getattr(_state, 'recorder', None)
+        _state.recorder = recorder
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _state.recorder = previous
+    return recorded
+
+
+class SuiteReport(object):
+    """The phases recorded for each of a suite of calculations.
+
+    Parameters
+    ----------
+    calcs : sequence of aospy.Calc
+        The calculations, as returned by :py:meth:`aospy.Calc.compute` or
+        :py:func:`aospy.submit_mult_calcs`.  Any that are None (i.e. that
+        failed) or that were executed without instrumentation are omitted.
+    """
+    def __init__(self, calcs):
+        self.calcs = [calc for calc in calcs
+                      if getattr(calc, 'phases', None) is not None]
+
+    def __len__(self):
+        return len(self.calcs)
+
+    @property
+    def totals(self):
+        """The statistics of each phase summed over all of the calculations,
+        except for 'peak_rss', which is the largest of any of them."""
+        totals = OrderedDict()
+        names = [name for name in PHASES + (TOTAL,)
+                 if any(name in calc.phases for calc in self.calcs)]
+        names += sorted(set(name for calc in self.calcs
+                            for name in calc.phases) - set(names))
+        for name in names:
+            total = _new_stats()
+            for calc in self.calcs:
+                stats = calc.phases.get(name)
+                if stats is None:
+                    continue
+                for key, value in stats.items():
+                    if key == 'peak_rss':
+                        total[key] = max(total[key], value)
+                    else:
+                        total[key] += value
+            totals[name] = total
+        return totals
+
+    def records(self):
+        """One JSON-serializable dict per calculation."""
+        for calc in self.calcs:
+            yield OrderedDict([('calc', str(calc)),
+                               ('phases', OrderedDict(
+                                   (name, dict(stats)) for name, stats
+                                   in calc.phases.items()))])
+
+    def to_jsonl(self, path):
+        """Write the report to a file as JSON lines, one per calculation."""
+        with open(path, 'w') as f:
+            for record in self.records():
+                f.write(json.dumps(record) + '\n')
+
+    def __str__(self):
+        totals = self.totals
+        overall = totals.get(TOTAL, _new_stats())['seconds']
+        lines = [
+            'Instrumentation of {} calculations:'.format(len(self)),
+            '  {0:<15} {1:>6} {2:>10} {3:>6} {4:>10} {5:>6} {6:>10}'.format(
+                'phase', 'calls', 'seconds', '%', 'read', 'files',
+                'peak RSS')]
+        for name, stats in totals.items():
+            share = 100. * stats['seconds'] / overall if overall else 0.
+            lines.append(
+                '  {0:<15} {1:>6} {2:>10.2f} {3:>6.1f} {4:>10} {5:>6} '
+                '{6:>10}'.format(name, stats['calls'], stats['seconds'],
+                                 share, _format_bytes(stats['bytes_read']),
+                                 stats['files_opened'],
+                                 _format_bytes(stats['peak_rss'])))
+        return '\n'.join(lines)
+
+
+class Profiler(object):
+    """Profiles the execution of selected calculations with cProfile.
+
+    The profile of each selected calculation is written to a file whose name
+    is derived from the names of the calculation's output files, with the
+    extension '.prof', which can be read with :py:mod:`pstats` or viewed
+    e.g. as a flame graph with tools such as snakeviz.  A summary of the
+    functions taking the most time is written alongside it, with the
+    extension '.prof.txt'.  The profile is also written if the calculation
+    fails.
+
+    Only the thread executing the calculation is profiled, so any dask
+    computations are executed synchronously within it; work done in the
+    threads of a calculation's ``max_threads`` is not included.
+
+    Parameters
+    ----------
+    calcs : callable, optional
+        Function of an :py:class:`aospy.Calc` returning whether to profile
+        it.  By default all calculations are profiled.
+    direc : str, optional
+        Directory in which to write the profiles, within subdirectories for
+        each Proj, Model, and Run.  By default each profile is written to the
+        output directory of its calculation.
+    top : int, optional
+        Number of functions included in the summary.  Default 25.
+    sort : str, optional
+        Key by which the functions in the summary are sorted; see
+        :py:meth:`pstats.Stats.sort_stats`.  Default 'cumulative'.
+    """
+    def __init__(self, calcs=None, direc=None, top=25, sort='cumulative'):
+        self.calcs = calcs
+        self.direc = direc
+        self.top = top
+        self.sort = sort
+
+    def selects(self, calc):
+        """Whether the given Calc is profiled."""
+        return self.calcs is None or bool(self.calcs(calc))
+
+    def path(self, calc):
+        """Path of the profile of the given Calc."""
+        if self.direc is None:
+            direc = calc.dir_out
+        else:
+            direc = os.path.join(self.direc, calc.proj.name, calc.model.name,
+                                 calc.run.name)
+        return os.path.join(direc, calc._file_name(None, extension='prof'))
+
+    def profile(self, calc, func, *args, **kwargs):
+        """Call the function, profiling it as the execution of the Calc."""
+        profiler = cProfile.Profile()
+        try:
+            with synchronous_dask():
+                profiler.enable()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler.disable()
+        finally:
+            self._write(calc, profiler)
+
+    def _write(self, calc, profiler):
+        path = self.path(calc)
+        direc = os.path.dirname(path)
+        if not os.path.isdir(direc):
+            try:
+                os.makedirs(direc)
+            except OSError:
+                pass
+        profiler.dump_stats(path)
+        with open(path + '.txt', 'w') as f:
+            f.write('Profile of {}\n'.format(calc))
+            stats = pstats.Stats(profiler, stream=f)
+            stats.sort_stats(self.sort).print_stats(self.top)
@@ -47,6 +47,9 @@ SUBSET_START_DATE_STR = 'subset_start_date'
 SUBSET_END_DATE_STR = 'subset_end_date'
 TIME_VAR_STRS = [TIME_STR, TIME_BOUNDS_STR, TIME_WEIGHTS_STR]
 
+# Regions
+REGION_STR = 'region'
+
 # All attributes associated with data's spatiotemporal grid.
 GRID_ATTRS = OrderedDict(
     [(LAT_STR, ('lat', 'latitude', 'LATITUDE', 'y', 'yto', 'XLAT')),
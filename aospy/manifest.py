@@ -0,0 +1,216 @@
+"""Functionality for persistently recording the status of a suite of Calcs."""
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+
+from .utils.io import path_lock, tmp_path_for
+
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+_STATUSES = (PENDING, RUNNING, DONE, FAILED)
+
+
+def calc_key(calc):
+    """Create a string uniquely identifying a Calc within a suite.
+
+    The key is built from the same components used to name the Calc's output
+    files, plus the requested time/regional reductions and regions, so that it
+    is stable across separate invocations of the same suite.
+
+    Parameters
+    ----------
+    calc : aospy.Calc
+
+    Returns
+    -------
+    str
+    """
+    base = os.path.splitext(calc._file_name(None))[0]
+    reductions = ','.join(str(d) for d in calc.dtype_out_time)
+    regions = ','.join(sorted(getattr(reg, 'name', str(reg))
+                              for reg in (calc.region or []) if reg))
+    return '/'.join([calc.proj.name, calc.model.name, calc.run.name,
+                     calc.name, base, reductions, regions])
+
+
+def default_manifest_path(calcs, key=calc_key):
+    """Default location of the manifest for the given Calcs.
+
+    The manifest is placed within the output directory of the first Calc's
+    ``Proj``, and its file name includes a hash of all of the Calcs' keys,
+    such that re-running the same suite finds the same manifest.  The keys
+    are created by the function ``key``, which defaults to
+    :py:func:`calc_key`.
+    """
+    keys = sorted(key(calc) for calc in calcs)
+    digest = hashlib.sha1('\n'.join(keys).encode('utf-8')).hexdigest()[:12]
+    proj = calcs[0].proj
+    return os.path.join(proj.direc_out, proj.name,
+                        'aospy_manifest.{}.json'.format(digest))
+
+
+class Manifest(object):
+    """Persistent, on-disk record of the status of each Calc in a suite.
+
+    Each entry of the manifest is keyed by :py:func:`calc_key` and records
+    the Calc's status (one of 'pending', 'running', 'done', or 'failed'),
+    when it started and finished, its output paths, the number of attempts,
+    and, if it failed, the traceback of the error.
+
+    The manifest is stored as a JSON file.  All modifications are performed
+    via a read-modify-write cycle under an exclusive file lock followed by an
+    atomic rename, so that it can be safely updated concurrently from
+    multiple worker processes.
+
+    Attributes
+    ----------
+    path : str
+        The path to the manifest file
+
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+            The path to the manifest file.  It need not exist yet.
+
+        """
+        self.path = path
+
+    def __str__(self):
+        return 'aospy.Manifest instance "{}"'.format(self.path)
+
+    __repr__ = __str__
+
+    def _locked(self):
+        """Hold an exclusive lock on the manifest for the enclosed block."""
+        return path_lock(self.path)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError):
+            return {}
+        except ValueError:
+            logging.warning('Unable to parse manifest {}; starting from an '
+                            'empty manifest.'.format(self.path))
+            return {}
+
+    def _write(self, entries):
+        tmp_path = tmp_path_for(self.path)
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def entries(self):
+        """Dict of all manifest entries, keyed by Calc key."""
+        return self._read()
+
+    def status(self, calc):
+        """Status of the given Calc, or None if it is not in the manifest."""
+        return self._read().get(calc_key(calc), {}).get('status')
+
+    def register(self, calcs):
+        """Add a 'pending' entry for each Calc not already in the manifest."""
+        with self._locked():
+            entries = self._read()
+            for calc in calcs:
+                key = calc_key(calc)
+                if key not in entries:
+                    entries[key] = dict(status=PENDING, attempts=0,
+                                        paths=sorted(calc.path_out.values()))
+            self._write(entries)
+
+    def update(self, calc, status, increment_attempts=False, **fields):
+        """Update the entry of the given Calc.
+
+        Parameters
+        ----------
+        calc : aospy.Calc
+        status : {'pending', 'running', 'done', 'failed'}
+            The new status of the Calc
+        increment_attempts : bool, optional
+            Whether to increment the Calc's number of attempts.  This is
+            done while the manifest is locked, so that no increment is lost
+            when multiple processes start the same Calc at once.  Default
+            False.
+        **fields
+            Any other (JSON-serializable) values to store in the entry
+
+        """
+        if status not in _STATUSES:
+            raise ValueError("Manifest status must be one of {0}; got "
+                             "'{1}'".format(_STATUSES, status))
+        key = calc_key(calc)
+        with self._locked():
+            entries = self._read()
+            entry = entries.setdefault(key, dict(attempts=0))
+            entry['status'] = status
+            if increment_attempts:
+                entry['attempts'] = entry.get('attempts', 0) + 1
+            entry.update(fields)
+            self._write(entries)
+
+    def mark_running(self, calc):
+        """Record that the given Calc has started executing."""
+        self.update(calc, RUNNING, increment_attempts=True,
+                    started=time.time(), finished=None, elapsed=None,
+                    traceback=None, host=socket.gethostname(),
+                    pid=os.getpid())
+
+    def mark_finished(self, calc, started, traceback=None, failure=None):
+        """Record that the given Calc has finished, successfully or not.
+
+        If it failed, i.e. if a ``traceback`` is given, the kind of failure
+        is recorded as ``failure``: 'error' (the default) for an exception,
+        or e.g. 'timeout', 'memory', or 'killed' for a Calc that exceeded
+        its resource limits (see :py:class:`aospy.executors.ResourceLimits`).
+        """
+        finished = time.time()
+        if traceback is None:
+            status, failure = DONE, None
+        else:
+            status, failure = FAILED, failure or 'error'
+        self.update(calc, status, finished=finished,
+                    elapsed=finished - started, traceback=traceback,
+                    failure=failure, paths=sorted(calc.path_out.values()))
+
+    def merge(self, paths):
+        """Merge the entries of the manifests at the given paths into this one.
+
+        Where several manifests, including this one, have entries for the
+        same Calc, a completed entry takes precedence over any other, and
+        otherwise the most recently started one is kept.  This is used to
+        combine the manifests of the shards of a suite (see
+        :py:mod:`aospy.sharding`).
+        """
+        def rank(entry):
+            return entry.get('status') == DONE, entry.get('started') or 0.
+        with self._locked():
+            entries = self._read()
+            for path in paths:
+                for key, entry in Manifest(path)._read().items():
+                    if key not in entries or rank(entry) > rank(entries[key]):
+                        entries[key] = entry
+            self._write(entries)
+
+    def pending(self, calcs):
+        """The subset of the given Calcs that have not completed successfully.
+
+        Calcs that are pending, that failed, that are absent from the
+        manifest, or that were left 'running' by an interrupted suite are all
+        included.
+        """
+        entries = self._read()
+        return [calc for calc in calcs
+                if entries.get(calc_key(calc), {}).get('status') != DONE]
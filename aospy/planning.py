@@ -0,0 +1,252 @@
+"""Planning the execution of a suite of calculations without executing it."""
+from collections import OrderedDict
+import os
+
+from . import scheduling
+from .specs import materialize
+from .utils.io import netcdf_groups
+
+
+MISSING = 'missing'
+STALE = 'stale'
+CURRENT = 'current'
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _output_mtime(calc, dtype_out_time, groups_cache):
+    """Modification time of a Calc's output, or None if it does not exist."""
+    if calc.output_backend == 'zarr':
+        return _mtime(os.path.join(calc.zarr_store,
+                                   calc._store_group(dtype_out_time)))
+    if calc.output_backend == 'consolidated':
+        store = calc.consolidated_store
+        if store not in groups_cache:
+            try:
+                groups_cache[store] = set(netcdf_groups(store))
+            except (IOError, OSError, RuntimeError, ValueError):
+                groups_cache[store] = set()
+        if calc._store_group(dtype_out_time) not in groups_cache[store]:
+            return None
+        return _mtime(store)
+    return _mtime(calc.path_out[dtype_out_time])
+
+
+def output_status(calc, files, groups_cache=None):
+    """The status of each of a Calc's outputs with respect to its inputs.
+
+    Parameters
+    ----------
+    calc : aospy.Calc
+    files : sequence of str
+        The paths of the Calc's input files
+    groups_cache : dict, optional
+        Cache of the groups within each consolidated output store, shared
+        across calls so that each store is only read once
+
+    Returns
+    -------
+    OrderedDict
+        Mapping of each of the Calc's ``dtype_out_time`` to 'missing' if its
+        output does not exist, 'stale' if it is older than any of the input
+        files, or 'current' otherwise
+    """
+    if groups_cache is None:
+        groups_cache = {}
+    input_mtimes = [mtime for mtime in map(_mtime, files) if mtime is not None]
+    newest_input = max(input_mtimes) if input_mtimes else None
+    status = OrderedDict()
+    for dtype in calc.dtype_out_time:
+        mtime = _output_mtime(calc, dtype, groups_cache)
+        if mtime is None:
+            status[dtype] = MISSING
+        elif newest_input is not None and mtime < newest_input:
+            status[dtype] = STALE
+        else:
+            status[dtype] = CURRENT
+    return status
+
+
+class ExecutionPlan(object):
+    """The inputs, outputs, and estimated costs of a suite of calculations.
+
+    Attributes
+    ----------
+    calcs : list of aospy.Calc
+        The calculations planned
+    entries : list of dict
+        For each calculation, its input files ('files'), the total size of
+        those files in bytes ('bytes'), its estimated run time in seconds
+        ('seconds') and peak memory in bytes ('memory'), and the status of
+        each of its outputs ('outputs'; see :py:func:`output_status`)
+    n_workers : int
+        The number of workers the calculations would be executed on
+    """
+    def __init__(self, calcs, entries, n_workers=1):
+        self.calcs = list(calcs)
+        self.entries = list(entries)
+        self.n_workers = max(1, n_workers)
+
+    def __len__(self):
+        return len(self.calcs)
+
+    @property
+    def total_bytes(self):
+        """The number of bytes read by all of the calculations together."""
+        return sum(entry['bytes'] for entry in self.entries)
+
+    @property
+    def unique_files(self):
+        """The sorted paths of all of the distinct input files."""
+        return sorted(set(path for entry in self.entries
+                          for path in entry['files']))
+
+    @property
+    def unique_bytes(self):
+        """The total size of the distinct input files, in bytes."""
+        return sum(scheduling._file_size(path) for path in self.unique_files)
+
+    @property
+    def shared_inputs(self):
+        """Mapping of each input file read by multiple calculations to the
+        indices of those calculations."""
+        readers = OrderedDict()
+        for i, entry in enumerate(self.entries):
+            for path in entry['files']:
+                readers.setdefault(path, []).append(i)
+        return OrderedDict((path, indices) for path, indices
+                           in sorted(readers.items()) if len(indices) > 1)
+
+    def _count_outputs(self, *statuses):
+        return sum(1 for entry in self.entries
+                   for status in entry['outputs'].values()
+                   if status in statuses)
+
+    @property
+    def n_outputs(self):
+        """The number of outputs of all of the calculations together."""
+        return self._count_outputs(MISSING, STALE, CURRENT)
+
+    @property
+    def n_existing(self):
+        """The number of outputs that already exist, current or not."""
+        return self._count_outputs(STALE, CURRENT)
+
+    @property
+    def n_current(self):
+        """The number of outputs newer than all of their inputs."""
+        return self._count_outputs(CURRENT)
+
+    @property
+    def total_seconds(self):
+        """The estimated run time of all of the calculations together."""
+        return sum(entry['seconds'] for entry in self.entries)
+
+    @property
+    def wall_seconds(self):
+        """The estimated wall-clock run time on ``n_workers`` workers."""
+        if not self.entries:
+            return 0.
+        assignments = scheduling.pack_longest_first(self.entries,
+                                                    self.n_workers)
+        return max(sum(self.entries[i]['seconds'] for i in assigned)
+                   for assigned in assignments)
+
+    @property
+    def max_memory(self):
+        """The largest estimated peak memory of any one calculation."""
+        return max([entry['memory'] for entry in self.entries] or [0.])
+
+    @property
+    def concurrent_memory(self):
+        """The estimated peak memory of the ``n_workers`` largest
+        calculations executing at once."""
+        memories = sorted((entry['memory'] for entry in self.entries),
+                          reverse=True)
+        return sum(memories[:self.n_workers])
+
+    def to_dict(self):
+        """The plan as a JSON-serializable dict."""
+        return dict(
+            n_calcs=len(self), n_workers=self.n_workers,
+            total_bytes=self.total_bytes, unique_bytes=self.unique_bytes,
+            n_unique_files=len(self.unique_files),
+            shared_inputs=self.shared_inputs, n_outputs=self.n_outputs,
+            n_existing=self.n_existing, n_current=self.n_current,
+            total_seconds=self.total_seconds,
+            wall_seconds=self.wall_seconds, max_memory=self.max_memory,
+            concurrent_memory=self.concurrent_memory,
+            calcs=[dict(entry, calc=str(calc)) for calc, entry
+                   in zip(self.calcs, self.entries)])
+
+    def __str__(self):
+        fmt = scheduling._format_bytes
+        shared = self.shared_inputs
+        lines = [
+            'Execution plan for {0} calculations on {1} '
+            'workers:'.format(len(self), self.n_workers),
+            '  Input: {0} to read in total; {1} distinct files totaling '
+            '{2}'.format(fmt(self.total_bytes), len(self.unique_files),
+                         fmt(self.unique_bytes)),
+            '  Shared input: {0} files are read by more than one '
+            'calculation'.format(len(shared)),
+            '  Output: {0} of {1} outputs already exist, of which {2} are '
+            'current'.format(self.n_existing, self.n_outputs,
+                             self.n_current),
+            '  Estimated run time: {0:.1f} s in total, {1:.1f} s '
+            'wall-clock'.format(self.total_seconds, self.wall_seconds),
+            '  Estimated peak memory: {0} for the largest calculation, {1} '
+            'for the {2} largest at once'.format(
+                fmt(self.max_memory), fmt(self.concurrent_memory),
+                min(self.n_workers, len(self)))]
+        for path, indices in shared.items():
+            lines.append('    {0}: read by {1} calculations'.format(
+                path, len(indices)))
+        lines.append('  Calculations (run time, input, peak memory, outputs), '
+                     'longest first:')
+        for i in scheduling.longest_first(self.entries):
+            entry = self.entries[i]
+            n_current = sum(1 for status in entry['outputs'].values()
+                            if status == CURRENT)
+            lines.append('    {0:>10.1f} s {1:>10} {2:>10}  {3}/{4} current  '
+                         '{5}'.format(entry['seconds'], fmt(entry['bytes']),
+                                      fmt(entry['memory']), n_current,
+                                      len(entry['outputs']), self.calcs[i]))
+        return '\n'.join(lines)
+
+
+def plan_calcs(calcs, n_workers=1):
+    """Resolve the inputs and outputs of Calcs and estimate their costs.
+
+    Each Calc's input files are resolved through its DataLoader, but no data
+    is loaded (only the files' metadata is read, to estimate memory use) and
+    nothing is executed or written.  Memory estimates are calibrated by any
+    peak memory measured for earlier calculations in this session (see
+    :py:class:`aospy.scheduling.MemoryModel`).
+
+    Parameters
+    ----------
+    calcs : sequence of aospy.Calc or aospy.specs.CalcSpec
+        Any CalcSpecs are materialized into their Calcs.
+    n_workers : int, optional
+        The number of workers the Calcs would be executed on.  Default 1.
+
+    Returns
+    -------
+    ExecutionPlan
+    """
+    calcs = [materialize(calc) for calc in calcs]
+    groups_cache = {}
+    entries = []
+    for calc in calcs:
+        entry = scheduling.estimate_cost(calc)
+        entry['memory'] = scheduling._MEMORY_MODEL.calibrate(
+            calc, scheduling.estimate_memory(calc))
+        entry['outputs'] = output_status(calc, entry['files'], groups_cache)
+        entries.append(entry)
+    return ExecutionPlan(calcs, entries, n_workers)
@@ -2,6 +2,11 @@
 import logging
 import time
 
+from .utils.io import DEFAULT_NETCDF_FORMAT
+
+
+_OUTPUT_BACKENDS = ('netcdf', 'zarr', 'consolidated')
+
 
 class Proj(object):
     """An object that describes a single project that will use aospy.
@@ -27,6 +32,13 @@ class Proj(object):
     direc_out, tar_direc_out : str
         The paths to the root directories of, respectively, the standard and
         .tar versions of the output of aospy calculations saved to disk.
+    output_backend : {'netcdf', 'zarr', 'consolidated'}
+        How the output of aospy calculations is saved to disk
+    output_format : str
+        The netCDF format of the output of aospy calculations saved to disk
+    output_encoding : dict
+        Compression, chunking, and quantization options for the output of
+        aospy calculations saved to disk
     models : dict
         A dictionary with entries of the form ``{model_obj.name: model_obj}``,
         for each of this ``Proj``'s child model objects
@@ -40,7 +52,8 @@ class Proj(object):
 
     def __init__(self, name, description=None, models=None,
                  default_models=None, regions=None, direc_out='',
-                 tar_direc_out=''):
+                 tar_direc_out='', output_backend='netcdf',
+                 output_format=DEFAULT_NETCDF_FORMAT, output_encoding=None):
         """
         Parameters
         ----------
@@ -61,6 +74,33 @@ class Proj(object):
         direc_out, tar_direc_out : str
             Path to the root directories of where, respectively, regular output
             and a .tar-version of the output will be saved to disk.
+        output_backend : {'netcdf', 'zarr', 'consolidated'}, optional
+            How the output of aospy calculations is saved to disk:
+
+            - 'netcdf' : (default) one netCDF file per calculation and
+              reduction, within `direc_out`
+            - 'zarr' : one Zarr store per `Run`, within `direc_out`, with one
+              group per calculation and reduction.  Requires the ``zarr``
+              package.  Output is loaded lazily, and parallel calculations
+              write their output concurrently without locking.
+            - 'consolidated' : one netCDF4 file per `Run`, within
+              `direc_out`, with one group per calculation and reduction,
+              named after the file that the 'netcdf' backend would write.
+              This avoids creating large numbers of small files.  Output is
+              always saved in the 'NETCDF4' format, and is not added to the
+              .tar archives.
+
+        output_format : str, optional
+            The netCDF format with which output is saved to disk.  Default
+            'NETCDF3_64BIT'.  Use 'NETCDF4' or 'NETCDF4_CLASSIC' in order to
+            compress, chunk, or quantize the output via `output_encoding`.
+        output_encoding : {None, dict}, optional
+            Keyword arguments passed to
+            :py:func:`aospy.utils.io.netcdf_encoding` (or, for the 'zarr'
+            backend, :py:func:`aospy.utils.io.zarr_encoding`) specifying how
+            the output is compressed, chunked, and quantized, e.g.
+            ``dict(zlib=True, shuffle=True, chunking='time')``.  Default None,
+            meaning none of these are applied.
 
         Note
         ----
@@ -78,6 +118,13 @@ class Proj(object):
         self.description = '' if description is None else description
         self.direc_out = direc_out
         self.tar_direc_out = tar_direc_out
+        if output_backend not in _OUTPUT_BACKENDS:
+            raise ValueError("`output_backend` must be one of {0}; got "
+                             "'{1}'".format(_OUTPUT_BACKENDS, output_backend))
+        self.output_backend = output_backend
+        self.output_format = output_format
+        self.output_encoding = ({} if output_encoding is None
+                                else output_encoding)
 
         if models is None:
             self.models = []
@@ -1,16 +1,22 @@
 """Functionality pertaining to aggregating data over geographical regions."""
 from collections import namedtuple
+import hashlib
 import logging
+import os
+import threading
 
 import numpy as np
+import xarray as xr
 
 from .internal_names import (
     LAND_MASK_STR,
     LAT_STR,
     LON_STR,
+    REGION_STR,
     SFC_AREA_STR,
     YEAR_STR
 )
+from .utils.io import tmp_path_for
 from .utils.longitude import _maybe_cast_to_lon
 
 
@@ -46,6 +52,102 @@ def _get_land_mask(data, do_land_mask, land_mask_str=LAND_MASK_STR):
     raise ValueError(msg)
 
 
+def _hash_values(*arrays):
+    """Hash of the shapes, data types, and values of the given arrays."""
+    digest = hashlib.sha1()
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        digest.update('{0}{1}'.format(arr.shape, arr.dtype).encode('utf-8'))
+        digest.update(arr.tobytes())
+    return digest.hexdigest()
+
+
+class WeightsCache(object):
+    """Cache of the weights of Regions on the grids of the data they reduce.
+
+    The weights are kept in memory, and, if ``direc`` is set, are also
+    saved to that directory, one .npy file per Region and grid, from which
+    they are loaded by any process using the same directory, e.g. all of
+    the workers executing a suite of calculations.
+
+    Parameters
+    ----------
+    direc : str, optional
+        The directory in which the weights are saved.  By default they are
+        only kept in memory.
+    """
+    def __init__(self, direc=None):
+        self.direc = direc
+        self._weights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._weights)
+
+    def __getstate__(self):
+        # Only the directory is pickled, e.g. with the Calc using the cache.
+        return dict(direc=self.direc)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def clear(self):
+        """Remove all of the weights from memory."""
+        with self._lock:
+            self._weights.clear()
+
+    def _load(self, path):
+        try:
+            return np.load(path)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _save(self, path, values):
+        try:
+            os.makedirs(self.direc, exist_ok=True)
+            tmp_path = tmp_path_for(path)
+            with open(tmp_path, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp_path, path)
+        except (IOError, OSError):
+            logging.warning('Unable to save region weights to '
+                            '{}'.format(path))
+
+    def get(self, key, build):
+        """The weights with the given key, built by ``build`` if absent.
+
+        Parameters
+        ----------
+        key : str
+        build : callable
+            Function of no arguments returning the weights, as a
+            numpy.ndarray
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        with self._lock:
+            values = self._weights.get(key)
+        if values is not None:
+            return values
+        path = None
+        if self.direc is not None:
+            path = os.path.join(self.direc, key + '.npy')
+            values = self._load(path)
+        if values is None:
+            values = build()
+            if path is not None:
+                self._save(path, values)
+        with self._lock:
+            self._weights[key] = values
+        return values
+
+
+# The cache of Region weights used by default in this process.
+weights_cache = WeightsCache()
+
+
 class BoundsRect(namedtuple('BoundsRect', ['west', 'east', 'south', 'north'])):
     """Bounding longitudes and latitudes of a given lat-lon rectangle."""
     def __new__(cls, west, east, south, north):
@@ -228,6 +330,66 @@ class Region(object):
             mask |= mask_lon & mask_lat
         return mask
 
+    def _weights_key(self, data, lon_str, lat_str, land_mask_str,
+                     sfc_area_str):
+        """Key identifying this Region's weights on the grid of the data."""
+        region = repr((self.mask_bounds, self.do_land_mask)).encode('utf-8')
+        grid = _hash_values(data[lat_str].values, data[lon_str].values,
+                            data[sfc_area_str].transpose(lat_str,
+                                                         lon_str).values)
+        land_mask = None
+        if self.do_land_mask and land_mask_str in data.coords:
+            land_mask = _hash_values(
+                data[land_mask_str].transpose(lat_str, lon_str).values)
+        return hashlib.sha1(b'/'.join([
+            region, grid.encode('utf-8'),
+            str(land_mask).encode('utf-8')])).hexdigest()
+
+    def weights(self, data, lon_str=LON_STR, lat_str=LAT_STR,
+                land_mask_str=LAND_MASK_STR, sfc_area_str=SFC_AREA_STR,
+                cache=None):
+        """The weights of each grid point of the data within this Region.
+
+        The weight of each point is its surface area, times its land (or
+        ocean) fraction if the Region applies a land mask, within the
+        Region, and zero outside of it.  The weights depend only on the
+        Region, the grid, and its land mask, so they are computed once per
+        grid and land mask and then taken from the cache.
+
+        Parameters
+        ----------
+        data : xarray.DataArray
+            Data with the latitude, longitude, surface area, and (if used)
+            land mask coordinates of the grid
+        lat_str, lon_str, land_mask_str, sfc_area_str : str, optional
+            The name of the latitude, longitude, land mask, and surface area
+            coordinates, respectively, in ``data``.  Defaults are the
+            corresponding values in ``aospy.internal_names``.
+        cache : WeightsCache, optional
+            By default, ``aospy.region.weights_cache``.
+
+        Returns
+        -------
+        xarray.DataArray
+            The weights, with dimensions ``(lat_str, lon_str)``
+
+        """
+        if cache is None:
+            cache = weights_cache
+
+        def build():
+            mask = self._make_mask(data, lon_str=lon_str, lat_str=lat_str)
+            land_mask = _get_land_mask(data, self.do_land_mask,
+                                       land_mask_str=land_mask_str)
+            weights = (data[sfc_area_str].where(mask) * land_mask).fillna(0.)
+            return weights.transpose(lat_str, lon_str).values
+
+        key = self._weights_key(data, lon_str, lat_str, land_mask_str,
+                                sfc_area_str)
+        return xr.DataArray(cache.get(key, build), dims=[lat_str, lon_str],
+                            coords={lat_str: data[lat_str].values,
+                                    lon_str: data[lon_str].values})
+
     def mask_var(self, data, lon_cyclic=True, lon_str=LON_STR,
                  lat_str=LAT_STR):
         """Mask the given data outside this region.
@@ -286,20 +448,18 @@ class Region(object):
             year, one value per year.
 
         """
-        data_masked = self.mask_var(data, lon_cyclic=lon_cyclic,
-                                    lon_str=lon_str, lat_str=lat_str)
-        sfc_area = data[sfc_area_str]
-        sfc_area_masked = self.mask_var(sfc_area, lon_cyclic=lon_cyclic,
-                                        lon_str=lon_str, lat_str=lat_str)
-        land_mask = _get_land_mask(data, self.do_land_mask,
-                                   land_mask_str=land_mask_str)
-        weights = sfc_area_masked * land_mask
-        # Mask weights where data values are initially invalid in addition
-        # to applying the region mask.
-        weights = weights.where(np.isfinite(data))
-        weights_reg_sum = weights.sum(lon_str).sum(lat_str)
-        data_reg_sum = (data_masked * sfc_area_masked *
-                        land_mask).sum(lat_str).sum(lon_str)
+        if not lon_cyclic:
+            # Raises if the Region requires wraparound longitudes.
+            self.mask_var(data[sfc_area_str], lon_cyclic=lon_cyclic,
+                          lon_str=lon_str, lat_str=lat_str)
+        weights = self.weights(data, lon_str=lon_str, lat_str=lat_str,
+                               land_mask_str=land_mask_str,
+                               sfc_area_str=sfc_area_str)
+        dims = [lat_str, lon_str]
+        # Points where the data is invalid are excluded from both the
+        # weighted sum and the total weight, at each time separately.
+        data_reg_sum = xr.dot(data.fillna(0.), weights, dims=dims)
+        weights_reg_sum = xr.dot(data.notnull(), weights, dims=dims)
         return data_reg_sum / weights_reg_sum
 
     def av(self, data, lon_str=LON_STR, lat_str=LAT_STR,
@@ -353,3 +513,92 @@ class Region(object):
             return ts
         else:
             return ts.std(YEAR_STR)
+
+
+def stack_weights(regions, data, lon_str=LON_STR, lat_str=LAT_STR,
+                  land_mask_str=LAND_MASK_STR, sfc_area_str=SFC_AREA_STR,
+                  cache=None):
+    """The weights of each of the Regions on the grid of the data, stacked.
+
+    Parameters
+    ----------
+    regions : sequence of Region
+    data : xarray.DataArray
+        Data with the latitude, longitude, surface area, and (if used)
+        land mask coordinates of the grid
+    lat_str, lon_str, land_mask_str, sfc_area_str : str, optional
+        The name of the latitude, longitude, land mask, and surface area
+        coordinates, respectively, in ``data``.  Defaults are the
+        corresponding values in ``aospy.internal_names``.
+    cache : WeightsCache, optional
+        By default, ``aospy.region.weights_cache``.
+
+    Returns
+    -------
+    xarray.DataArray
+        The weights, with dimensions ``('region', lat_str, lon_str)`` and
+        the names of the Regions as the 'region' coordinate
+
+    See Also
+    --------
+    Region.weights
+    """
+    weights = [region.weights(data, lon_str=lon_str, lat_str=lat_str,
+                              land_mask_str=land_mask_str,
+                              sfc_area_str=sfc_area_str, cache=cache)
+               for region in regions]
+    return xr.DataArray(
+        np.stack([w.values for w in weights]),
+        dims=[REGION_STR, lat_str, lon_str],
+        coords={REGION_STR: [region.name for region in regions],
+                lat_str: data[lat_str].values,
+                lon_str: data[lon_str].values})
+
+
+def regions_reduce(regions, data, func='ts', lon_str=LON_STR,
+                   lat_str=LAT_STR, land_mask_str=LAND_MASK_STR,
+                   sfc_area_str=SFC_AREA_STR, cache=None):
+    """Reduce the data over each of the Regions at once.
+
+    Equivalent to calling the ``ts``, ``av``, or ``std`` method of each
+    Region, but the region averages of all of the Regions are computed by
+    the same two contractions of the data with the stacked weights of the
+    Regions (see :py:func:`stack_weights`), such that the data is only
+    passed over once rather than once per Region.
+
+    Parameters
+    ----------
+    regions : sequence of Region
+    data : xarray.DataArray
+        The data to reduce
+    func : {'ts', 'av', 'std'}, optional
+        The reduction: the timeseries of the region averages (default), or
+        their average or standard deviation over years
+    lat_str, lon_str, land_mask_str, sfc_area_str : str, optional
+        The name of the latitude, longitude, land mask, and surface area
+        coordinates, respectively, in ``data``.  Defaults are the
+        corresponding values in ``aospy.internal_names``.
+    cache : WeightsCache, optional
+        By default, ``aospy.region.weights_cache``.
+
+    Returns
+    -------
+    xarray.DataArray
+        The reduced data, with a 'region' dimension whose coordinate is the
+        names of the Regions
+    """
+    if func not in ('ts', 'av', 'std'):
+        raise ValueError("Specified regional reduction '{}' is not "
+                         "supported".format(func))
+    weights = stack_weights(regions, data, lon_str=lon_str, lat_str=lat_str,
+                            land_mask_str=land_mask_str,
+                            sfc_area_str=sfc_area_str, cache=cache)
+    dims = [lat_str, lon_str]
+    # As in Region.ts, invalid points are excluded at each time separately.
+    ts = (xr.dot(data.fillna(0.), weights, dims=dims) /
+          xr.dot(data.notnull(), weights, dims=dims))
+    if func == 'ts' or YEAR_STR not in ts.coords:
+        return ts
+    if func == 'av':
+        return ts.mean(YEAR_STR)
+    return ts.std(YEAR_STR)
@@ -0,0 +1,571 @@
+"""Estimating the cost of calculations and scheduling them accordingly."""
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import glob
+import heapq
+import logging
+import os
+
+import numpy as np
+import xarray as xr
+
+from .calc import _replace_pressure
+from .utils.io import _format_bytes
+from .utils.times import infer_year
+
+
+# Number of input time steps per year for each ``intvl_in``.
+_TIMESTEPS_PER_YEAR = {'annual': 1, 'monthly': 12, 'daily': 365,
+                       '6hr': 4 * 365, '3hr': 8 * 365}
+# Nominal sizes used when the sizes of the input files cannot be determined.
+_NOMINAL_BYTES_PER_TIMESTEP = 2 ** 20
+_NOMINAL_LEVELS = 30
+# Approximate rates at which input data is read and processed.
+_BYTES_PER_SECOND = 50e6
+_SECONDS_PER_TIMESTEP = 1e-3
+_OVERHEAD_SECONDS = 1.
+# Relative cost of the extra work done for vertically defined data, for
+# vertical reductions, and for each regional reduction, which passes over the
+# data once for all of the regions, plus a smaller cost per region.
+_VERT_FACTOR = 0.5
+_VERT_REDUCTION_FACTOR = 0.5
+_REGIONAL_FACTOR = 0.5
+_REGION_FACTOR = 0.02
+# Peak resident memory of a Calc relative to the in-memory size of its input
+# data, and the extra relative memory used for vertically defined data, for
+# the regional reductions, and for each of their regions.
+_PEAK_FACTOR = 2.
+_VERT_PEAK_FACTOR = 1.
+_REGIONAL_PEAK_FACTOR = 1.
+_REGION_PEAK_FACTOR = 0.01
+# Relative change in a recorded ratio of measured to estimated peak memory
+# beyond which the tasks waiting for admission are reordered.
+_RATIO_TOLERANCE = 0.1
+
+
+def _native_vars(variables):
+    """The Vars that are loaded from disk to compute the given Vars."""
+    native = []
+    for var in variables:
+        if isinstance(var, (int, float)):
+            continue
+        if getattr(var, 'variables', None) is None:
+            native.append(var)
+        else:
+            native.extend(_native_vars(var.variables))
+    return native
+
+
+def _input_file_sets(calc):
+    """Pairs of each Var loaded from disk by a Calc and its input files."""
+    try:
+        variables = _replace_pressure(calc.variables, calc.dtype_in_vert)
+    except KeyError:
+        variables = calc.variables
+    for var in _native_vars(variables):
+        try:
+            file_set = calc.data_loader._generate_file_set(
+                var=var, start_date=calc.start_date, end_date=calc.end_date,
+                **calc.data_loader_attrs)
+        except (KeyError, IOError, OSError, AttributeError, ValueError,
+                NotImplementedError):
+            continue
+        if isinstance(file_set, str):
+            file_set = glob.glob(file_set) or [file_set]
+        yield var, list(file_set)
+
+
+def input_files(calc):
+    """The input files read by a Calc, as resolved by its DataLoader.
+
+    Parameters
+    ----------
+    calc : aospy.Calc
+
+    Returns
+    -------
+    list of str
+        The sorted paths of the input files.  Vars whose files cannot be
+        resolved (e.g. because they are grid attributes taken from the
+        ``Model``) are skipped.
+    """
+    files = set()
+    for _, file_set in _input_file_sets(calc):
+        files.update(file_set)
+    return sorted(files)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _n_timesteps(calc):
+    n_years = (infer_year(calc.end_date) - infer_year(calc.start_date) + 1)
+    return _TIMESTEPS_PER_YEAR.get(calc.intvl_in, 12) * n_years
+
+
+def estimate_cost(calc):
+    """Estimate the cost of executing a Calc.
+
+    The cost is dominated by the total size of the Calc's input files.  If
+    their sizes cannot be determined, a nominal size is used based on the
+    number of input time steps (i.e. ``intvl_in`` and the date range) and on
+    whether the data is defined vertically.  This is scaled up for
+    vertically defined data, for vertical reductions, and for each region
+    of each regional reduction.  The number of input time steps also adds a
+    per-time-step overhead.
+
+    The estimated run time is only meant to rank Calcs relative to one
+    another, not to predict their absolute run times.
+
+    Parameters
+    ----------
+    calc : aospy.Calc
+
+    Returns
+    -------
+    dict
+        With keys 'files' (the paths of the input files), 'bytes' (the
+        total size of the input files, in bytes), and 'seconds' (the
+        estimated run time)
+    """
+    files = input_files(calc)
+    n_timesteps = _n_timesteps(calc)
+    nbytes = sum(_file_size(path) for path in files)
+    if not nbytes:
+        nbytes = n_timesteps * _NOMINAL_BYTES_PER_TIMESTEP
+        if calc.def_vert:
+            nbytes *= _NOMINAL_LEVELS
+    factor = 1.
+    if calc.def_vert:
+        factor += _VERT_FACTOR
+        if calc.dtype_out_vert:
+            factor += _VERT_REDUCTION_FACTOR
+    n_regions = len([region for region in (calc.region or []) if region])
+    n_regional = len([dtype for dtype in calc.dtype_out_time
+                      if dtype and 'reg' in dtype])
+    if n_regions:
+        factor += n_regional * (_REGIONAL_FACTOR + _REGION_FACTOR * n_regions)
+    seconds = (_OVERHEAD_SECONDS + n_timesteps * _SECONDS_PER_TIMESTEP +
+               factor * nbytes / _BYTES_PER_SECOND)
+    return dict(files=files, bytes=nbytes, seconds=seconds)
+
+
+def longest_first(costs):
+    """Order items from the longest to the shortest estimated run time.
+
+    Parameters
+    ----------
+    costs : sequence of dict
+        The estimated cost of each item, as returned by
+        :py:func:`estimate_cost`
+
+    Returns
+    -------
+    list of int
+        The indices of the items, longest first.  Items with equal costs
+        retain their original order.
+    """
+    return sorted(range(len(costs)), key=lambda i: -costs[i]['seconds'])
+
+
+def pack_longest_first(costs, n_workers):
+    """Assign items to workers via the longest-processing-time-first rule.
+
+    Items are taken in order of decreasing estimated run time, each being
+    assigned to the worker with the least total run time so far.
+
+    Parameters
+    ----------
+    costs : sequence of dict
+        The estimated cost of each item, as returned by
+        :py:func:`estimate_cost`
+    n_workers : int
+        The number of workers
+
+    Returns
+    -------
+    list of lists of int
+        The indices of the items assigned to each worker, longest first
+    """
+    n_workers = max(1, n_workers)
+    loads = [(0., worker) for worker in range(n_workers)]
+    assignments = [[] for _ in range(n_workers)]
+    for i in longest_first(costs):
+        load, worker = heapq.heappop(loads)
+        assignments[worker].append(i)
+        heapq.heappush(loads, (load + costs[i]['seconds'], worker))
+    return assignments
+
+
+def partition_by_inputs(calcs, costs, n_workers=1):
+    """Partition Calcs such that those reading the same inputs run together.
+
+    Calcs of the same Run that read the same set of input files are placed
+    in the same partition, so that, when each partition is executed by a
+    single worker, the files are read from the operating system's page cache
+    after the first Calc reads them.  Calcs whose input files cannot be
+    resolved each form their own partition.
+
+    So that locality does not come at the cost of parallelism, a partition
+    whose total estimated run time would exceed an equal share of that of
+    all of the Calcs across ``n_workers`` is split into multiple partitions.
+
+    Parameters
+    ----------
+    calcs : sequence of aospy.Calc
+    costs : sequence of dict
+        The estimated cost of each Calc, as returned by
+        :py:func:`estimate_cost`
+    n_workers : int, optional
+        The number of workers executing the partitions in parallel.
+        Default 1.
+
+    Returns
+    -------
+    list of lists of int
+        The indices of the Calcs in each partition, ordered longest first
+        both within and across partitions
+    """
+    groups = OrderedDict()
+    for i, (calc, cost) in enumerate(zip(calcs, costs)):
+        key = (calc.proj.name, calc.model.name, calc.run.name,
+               tuple(cost['files']) or i)
+        groups.setdefault(key, []).append(i)
+    share = sum(cost['seconds'] for cost in costs) / max(1, n_workers)
+    partitions = []
+    for indices in groups.values():
+        partition, partition_cost = [], 0.
+        for i in sorted(indices, key=lambda i: -costs[i]['seconds']):
+            if partition and partition_cost + costs[i]['seconds'] > share:
+                partitions.append(partition)
+                partition, partition_cost = [], 0.
+            partition.append(i)
+            partition_cost += costs[i]['seconds']
+        partitions.append(partition)
+    return sorted(partitions,
+                  key=lambda p: -sum(costs[i]['seconds'] for i in p))
+
+
+def _array_nbytes(path, names):
+    """In-memory size of the first of the named variables in a file.
+
+    Only the file's metadata is read.  Packed (scaled integer) data is sized
+    as the floats it is unpacked into.
+    """
+    try:
+        with xr.open_dataset(path, decode_cf=False,
+                             decode_times=False) as ds:
+            for name in names:
+                if name in ds.variables:
+                    arr = ds.variables[name]
+                    itemsize = arr.dtype.itemsize
+                    if {'scale_factor', 'add_offset'} & set(arr.attrs):
+                        itemsize = np.dtype('float64').itemsize
+                    return arr.size * itemsize
+    except (IOError, OSError, ValueError, RuntimeError, KeyError):
+        pass
+    return 0
+
+
+def _input_nbytes(calc):
+    """In-memory size of the data a Calc loads from its input files."""
+    nbytes = 0
+    for var, file_set in _input_file_sets(calc):
+        names = getattr(var, 'names', (var.name,))
+        nbytes += sum(_array_nbytes(path, names) for path in file_set)
+    return nbytes
+
+
+def estimate_memory(calc):
+    """Estimate the peak resident memory used in executing a Calc.
+
+    This is based on the in-memory size of the data loaded from the Calc's
+    input files, determined from the shapes and data types recorded in the
+    files' metadata.  If that cannot be determined, the nominal size used by
+    :py:func:`estimate_cost` is used instead.  The size is then scaled by the
+    number of copies of the data that are held at once, which is larger for
+    vertically defined data and for regional reductions.
+
+    Parameters
+    ----------
+    calc : aospy.Calc
+
+    Returns
+    -------
+    float
+        The estimated peak memory, in bytes
+    """
+    nbytes = _input_nbytes(calc)
+    if not nbytes:
+        nbytes = _n_timesteps(calc) * _NOMINAL_BYTES_PER_TIMESTEP
+        if calc.def_vert:
+            nbytes *= _NOMINAL_LEVELS
+    factor = _PEAK_FACTOR
+    if calc.def_vert:
+        factor += _VERT_PEAK_FACTOR
+    if any(dtype and 'reg' in dtype for dtype in calc.dtype_out_time):
+        n_regions = len([region for region in (calc.region or []) if region])
+        if n_regions:
+            factor += _REGIONAL_PEAK_FACTOR + _REGION_PEAK_FACTOR * n_regions
+    return factor * nbytes
+
+
+class MemoryModel(object):
+    """Calibrates estimates of the peak memory of Calcs by measurements.
+
+    Estimates made via :py:func:`estimate_memory` are scaled by the ratio of
+    the measured to the estimated peak memory most recently recorded for
+    Calcs of the same kind, i.e. of the same variable, input data types, and
+    vertical reduction.  If none has been recorded, the largest ratio
+    recorded for any kind of Calc is used.
+
+    The ``version`` is incremented whenever a ratio is recorded for a new
+    kind of Calc, or differs from the previous one by more than
+    ``_RATIO_TOLERANCE``, i.e. whenever the calibrated estimates may have
+    changed materially.
+    """
+    def __init__(self):
+        self.ratios = {}
+        self.version = 0
+
+    @staticmethod
+    def _kind(calc):
+        return (calc.name, calc.intvl_in, calc.dtype_in_time,
+                calc.dtype_in_vert, calc.dtype_out_vert)
+
+    def calibrate(self, calc, estimate):
+        """Scale the estimated peak memory of a Calc by the measurements."""
+        ratio = self.ratios.get(self._kind(calc))
+        if ratio is None:
+            ratio = max(self.ratios.values()) if self.ratios else 1.
+        return ratio * estimate
+
+    def record(self, calcs, estimate, measured):
+        """Record the measured peak memory of executing the given Calcs.
+
+        Parameters
+        ----------
+        calcs : sequence of aospy.Calc
+            The Calcs, which were executed one after the other
+        estimate : float
+            The largest of their peak memories as estimated by
+            :py:func:`estimate_memory`, in bytes
+        measured : float
+            The measured peak memory, in bytes
+        """
+        if not estimate or not measured:
+            return
+        ratio = measured / estimate
+        for calc in calcs:
+            kind = self._kind(calc)
+            previous = self.ratios.get(kind)
+            if (previous is None or
+                    abs(ratio - previous) > _RATIO_TOLERANCE * previous):
+                self.version += 1
+            self.ratios[kind] = ratio
+
+
+# Shared so that measurements made in executing one suite of Calcs improve
+# the estimates for subsequent suites.
+_MEMORY_MODEL = MemoryModel()
+
+
+class _WaitingTasks(object):
+    """Tasks waiting for admission, ordered by their estimated memory.
+
+    The estimates are sorted once, and again only when the controller's
+    ``MemoryModel`` has changed materially since, so that each admission
+    takes logarithmic time in the number of waiting tasks (plus that of
+    removing the admitted one from the underlying list).
+    """
+    def __init__(self, controller, indices):
+        self.controller = controller
+        self._indices = list(indices)
+        self._version = None
+
+    def __len__(self):
+        return len(self._indices)
+
+    def _sort(self):
+        order = sorted((self.controller.estimate(i), i)
+                       for i in self._indices)
+        self._estimates = [estimate for estimate, _ in order]
+        self._indices = [i for _, i in order]
+        self._version = self.controller.model.version
+
+    def pop(self, force=False):
+        """Admit and remove the largest waiting task that fits, if any.
+
+        Among tasks with the same estimate, the first one given is chosen.
+        If none fits and ``force`` is True, the smallest is admitted
+        regardless; otherwise None is returned.
+        """
+        if not self._indices:
+            return None
+        if self._version != self.controller.model.version:
+            self._sort()
+        free = self.controller.budget - self.controller.in_use
+        n = bisect_right(self._estimates, free)
+        if n:
+            k = bisect_left(self._estimates, self._estimates[n - 1])
+        elif force:
+            k = 0
+        else:
+            return None
+        i = self._indices[k]
+        # The controller checks the current estimate, which may differ
+        # slightly from the sorted one.
+        if not self.controller.admit(i, force=force):
+            return None
+        del self._estimates[k]
+        del self._indices[k]
+        return i
+
+
+class AdmissionController(object):
+    """Admit tasks for execution while their memory fits within a budget.
+
+    Each task is a sequence of Calcs executed one after the other, whose
+    peak memory is estimated as the largest estimate of its Calcs.  A task
+    is admitted only if the sum of the estimates of the tasks currently
+    executing and its own estimate is within the budget.  When a task
+    finishes, its measured peak memory, if any, is recorded in the
+    ``MemoryModel``, improving the estimates for the tasks yet to be
+    admitted.
+
+    Parameters
+    ----------
+    budget : float
+        The memory budget, in bytes
+    tasks : sequence of sequences of aospy.Calc
+    model : MemoryModel, optional
+        The model calibrating the estimated memory of each Calc.  Defaults
+        to one shared by all suites of Calcs executed in this session.
+    """
+    def __init__(self, budget, tasks, model=None):
+        self.budget = budget
+        self.tasks = list(tasks)
+        self.model = _MEMORY_MODEL if model is None else model
+        self.in_use = 0.
+        self._admitted = {}
+        self._estimates = {}
+
+    def _raw_estimates(self, i):
+        if i not in self._estimates:
+            self._estimates[i] = [estimate_memory(calc)
+                                  for calc in self.tasks[i]]
+        return self._estimates[i]
+
+    def estimate(self, i):
+        """Estimate the peak memory of the i-th task, in bytes."""
+        return max([self.model.calibrate(calc, estimate) for calc, estimate
+                    in zip(self.tasks[i], self._raw_estimates(i))] or [0.])
+
+    def admit(self, i, force=False):
+        """Admit the i-th task if it fits within the budget.
+
+        Parameters
+        ----------
+        i : int
+        force : bool, default False
+            Admit the task even if it does not fit, e.g. because no other
+            task is executing.
+
+        Returns
+        -------
+        bool
+            Whether the task was admitted
+        """
+        estimate = self.estimate(i)
+        if self.in_use + estimate > self.budget:
+            if not force:
+                return False
+            logging.warning('Estimated memory of {0} ({1}) exceeds the '
+                            'memory budget of {2}'.format(
+                                self.tasks[i], _format_bytes(estimate),
+                                _format_bytes(self.budget)))
+        self.in_use += estimate
+        self._admitted[i] = estimate
+        return True
+
+    def waiting(self, indices):
+        """The given tasks waiting for admission, ordered by size.
+
+        Parameters
+        ----------
+        indices : sequence of int
+
+        Returns
+        -------
+        object
+            Supporting ``len`` and ``pop(force=False)``, which admits and
+            returns the largest waiting task that fits within the budget,
+            or the smallest one if none fits and ``force`` is True, or
+            otherwise returns None.
+        """
+        return _WaitingTasks(self, indices)
+
+    def release(self, i, peak=None):
+        """Release the memory of a finished task, recording its peak."""
+        self.in_use -= self._admitted.pop(i)
+        if peak:
+            self.model.record(self.tasks[i],
+                              max(self._raw_estimates(i) or [0.]), peak)
+
+    def max_concurrency(self, n_workers):
+        """The number of the largest tasks that fit within the budget at once.
+
+        Parameters
+        ----------
+        n_workers : int
+            The upper bound on the number of tasks
+
+        Returns
+        -------
+        int
+            At least 1 and at most ``n_workers``
+        """
+        estimates = sorted((self.estimate(i) for i in range(len(self.tasks))),
+                           reverse=True)
+        total = 0.
+        for n, estimate in enumerate(estimates[:n_workers]):
+            total += estimate
+            if total > self.budget:
+                return max(1, n)
+        return max(1, min(n_workers, len(estimates)))
+
+
+def format_schedule(calcs, costs, n_workers):
+    """Summarize the estimated costs of executing the given Calcs.
+
+    Parameters
+    ----------
+    calcs : sequence of aospy.Calc
+    costs : sequence of dict
+        The estimated cost of each Calc, as returned by
+        :py:func:`estimate_cost`
+    n_workers : int
+        The number of workers executing the Calcs in parallel
+
+    Returns
+    -------
+    str
+        The estimated total and wall-clock run times (the latter assuming
+        the Calcs are packed via :py:func:`pack_longest_first`), followed
+        by the estimated cost of each Calc, longest first
+    """
+    assignments = pack_longest_first(costs, n_workers)
+    makespan = max(sum(costs[i]['seconds'] for i in assigned)
+                   for assigned in assignments)
+    lines = ['Estimated cost of {0} calculations on {1} workers: {2:.1f} s '
+             'in total, {3:.1f} s wall-clock'.format(
+                 len(calcs), n_workers,
+                 sum(cost['seconds'] for cost in costs), makespan)]
+    for i in longest_first(costs):
+        lines.append('  {0:>10.1f} s {1:>10}  {2}'.format(
+            costs[i]['seconds'], _format_bytes(costs[i]['bytes']), calcs[i]))
+    return '\n'.join(lines)
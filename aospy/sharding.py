@@ -0,0 +1,154 @@
+"""Partitioning a suite of Calcs into shards executed independently.
+
+Each shard of a suite can be executed by a separate process or batch job,
+e.g. each task of a job array, without any scheduler: every shard creates
+the same Calcs and deterministically selects its own subset of them.  Each
+shard records its Calcs in its own manifest and adds their outputs to its
+own tar archives, which are afterwards combined via
+:py:func:`aospy.automate.merge_shards`.
+"""
+import glob
+import hashlib
+import logging
+import os
+
+from . import scheduling
+from .manifest import calc_key
+from .specs import CalcSpec
+
+
+def parse_shard(shard):
+    """Parse the specification of a shard.
+
+    Parameters
+    ----------
+    shard : str or tuple
+        Either a string 'i/N' or a tuple (i, N), specifying the shard i of N
+        shards, where 0 <= i < N.
+
+    Returns
+    -------
+    tuple of int
+        (i, N)
+
+    Raises
+    ------
+    ValueError
+        If the specification is invalid
+    """
+    try:
+        if isinstance(shard, str):
+            index, n_shards = shard.split('/')
+        else:
+            index, n_shards = shard
+        index, n_shards = int(index), int(n_shards)
+    except (TypeError, ValueError):
+        raise ValueError("A shard must be specified as 'i/N' or (i, N); "
+                         "got {!r}".format(shard))
+    if not 0 <= index < n_shards:
+        raise ValueError('The index of a shard must be at least 0 and less '
+                         'than the number of shards; got {0}/{1}'.format(
+                             index, n_shards))
+    return index, n_shards
+
+
+def shard_path(path, shard):
+    """The path of the given shard's counterpart of a file.
+
+    E.g. for shard (0, 4), 'data.tar' becomes 'data.shard-0-of-4.tar'.
+    """
+    index, n_shards = parse_shard(shard)
+    root, ext = os.path.splitext(path)
+    return '{0}.shard-{1}-of-{2}{3}'.format(root, index, n_shards, ext)
+
+
+def shard_paths(path):
+    """The paths of the existing counterparts of a file of all shards."""
+    root, ext = os.path.splitext(path)
+    return sorted(glob.glob('{0}.shard-*-of-*{1}'.format(glob.escape(root),
+                                                         ext)))
+
+
+def stable_hash(key):
+    """Hash of a string that is the same in every process and session.
+
+    Unlike the builtin ``hash``, this does not depend on the process's
+    hash seed.
+    """
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+def _key(calc):
+    if isinstance(calc, CalcSpec):
+        return calc.key
+    return calc_key(calc)
+
+
+def assign_shards(calcs, n_shards, balance=True):
+    """Assign each Calc to one of the given number of shards.
+
+    The assignment only depends on the Calcs, not on their order or on the
+    process, so every shard of a suite computes the same assignment.
+
+    If ``balance`` is True, the cost of each Calc is estimated via
+    :py:func:`aospy.scheduling.estimate_cost`, and the Calcs are assigned
+    longest first, each to the shard with the least total estimated cost so
+    far, such that the shards take similar times.  The estimates depend on
+    the sizes of the input files, so these must not change while the shards
+    are being started.  Otherwise, or for CalcSpecs (see
+    :py:meth:`aospy.automate.CalcSuite.create_calcs`), whose costs cannot
+    be estimated without creating them, each Calc is assigned by a stable
+    hash of its key (see :py:func:`aospy.manifest.calc_key` and
+    :py:attr:`aospy.specs.CalcSpec.key`), which is the same in every
+    process regardless of its hash seed.
+
+    Parameters
+    ----------
+    calcs : sequence of aospy.Calc or aospy.specs.CalcSpec
+    n_shards : int
+    balance : bool, optional
+        Whether to balance the estimated costs of the shards.  Default True.
+
+    Returns
+    -------
+    list of int
+        The shard of each Calc
+    """
+    keys = [_key(calc) for calc in calcs]
+    if not balance or any(isinstance(calc, CalcSpec) for calc in calcs):
+        return [stable_hash(key) % n_shards for key in keys]
+    # Order by key first, so that Calcs of equal cost are assigned in the
+    # same order regardless of the order given.
+    order = sorted(range(len(calcs)), key=lambda i: keys[i])
+    costs = [scheduling.estimate_cost(calcs[i]) for i in order]
+    shards = [None] * len(calcs)
+    for shard, indices in enumerate(scheduling.pack_longest_first(costs,
+                                                                  n_shards)):
+        for i in indices:
+            shards[order[i]] = shard
+    return shards
+
+
+def select_shard(calcs, shard, balance=True):
+    """The subset of the Calcs assigned to the given shard.
+
+    Parameters
+    ----------
+    calcs : sequence of aospy.Calc or aospy.specs.CalcSpec
+    shard : str or tuple
+        The shard, as 'i/N' or (i, N); see :py:func:`parse_shard`
+    balance : bool, optional
+        Whether to balance the estimated costs of the shards; see
+        :py:func:`assign_shards`.  Default True.
+
+    Returns
+    -------
+    list
+        The Calcs of the shard, in their given order
+    """
+    index, n_shards = parse_shard(shard)
+    shards = assign_shards(calcs, n_shards, balance=balance)
+    selected = [calc for calc, i in zip(calcs, shards) if i == index]
+    logging.info('Shard {0}/{1} comprises {2} of {3} calculations'.format(
+        index, n_shards, len(selected), len(calcs)))
+    return selected
@@ -0,0 +1,472 @@
+"""Lightweight specifications of Calcs, from which Calcs are created lazily."""
+from collections import OrderedDict
+import importlib
+import logging
+import threading
+import types
+
+from .calc import Calc, _TIME_DEFINED_REDUCTIONS
+from .model import Model
+from .proj import Proj
+from .region import Region
+from .var import Var
+
+
+def _prune_invalid_time_reductions(spec):
+    """Prune time reductions of spec with no time dimension."""
+    valid_reductions = []
+    if not spec['var'].def_time and spec['dtype_out_time'] is not None:
+        for reduction in spec['dtype_out_time']:
+            if reduction not in _TIME_DEFINED_REDUCTIONS:
+                valid_reductions.append(reduction)
+            else:
+                msg = ("Var {0} has no time dimension "
+                       "for the given time reduction "
+                       "{1} so this calculation will "
+                       "be skipped".format(spec['var'].name, reduction))
+                logging.info(msg)
+    else:
+        valid_reductions = spec['dtype_out_time']
+    return valid_reductions
+
+
+def _label(value):
+    """Label of a parameter that is the same in every process.
+
+    Objects are labeled by their names, and the members of sets, e.g. of
+    Regions, are sorted, since their order depends on the hash seed.
+    """
+    if isinstance(value, (set, frozenset)):
+        return ','.join(sorted(_label(member) for member in value))
+    if isinstance(value, (list, tuple)):
+        return ','.join(_label(member) for member in value)
+    return str(getattr(value, 'name', value))
+
+
+class CalcSpec(object):
+    """The parameters of a single Calc, from which the Calc is created.
+
+    Creating a Calc loads its Model's grid data and resolves its dates and
+    output paths; a CalcSpec defers all of that until :py:meth:`materialize`
+    is called, e.g. on the worker that executes the Calc.  Each parameter is
+    accessible as an attribute, e.g. ``spec.var`` or ``spec.intvl_in``.
+
+    Parameters
+    ----------
+    **params
+        The keyword arguments to :py:class:`aospy.Calc`
+    """
+    def __init__(self, **params):
+        self.params = params
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['params'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __str__(self):
+        """String representation of the object."""
+        return "<aospy.CalcSpec instance: " + ', '.join(
+            _label(self.params[name]) for name in
+            ('var', 'proj', 'model', 'run')) + ">"
+
+    __repr__ = __str__
+
+    @property
+    def key(self):
+        """String uniquely identifying the spec's parameters.
+
+        Like :py:func:`aospy.manifest.calc_key`, it is the same in every
+        process, such that e.g. the manifest of a suite of CalcSpecs is
+        found again when the suite is resumed.
+        """
+        return '/'.join('{0}={1}'.format(name, _label(value)) for name, value
+                        in sorted(self.params.items()))
+
+    def materialize(self):
+        """Create the Calc specified."""
+        return Calc(**self.params)
+
+    def compact(self, library):
+        """The equivalent CompactCalcSpec, referencing objects by name.
+
+        Parameters
+        ----------
+        library : ObjectLibrary
+
+        Returns
+        -------
+        CompactCalcSpec
+        """
+        return library.compact(self.params)
+
+
+def materialize(calc):
+    """The Calc itself, or the Calc created from it if it is a CalcSpec."""
+    if isinstance(calc, CalcSpec):
+        return calc.materialize()
+    return calc
+
+
+def _matches(spec, criteria):
+    for name, value in criteria.items():
+        actual = spec.params.get(name)
+        if isinstance(value, (list, tuple, set, frozenset)):
+            if actual not in value:
+                return False
+        elif actual != value:
+            return False
+    return True
+
+
+class CalcSpecs(object):
+    """Lazy sequence of the CalcSpecs of the Calcs of a suite.
+
+    Each CalcSpec is generated only when accessed, from one permutation of
+    the suite's core specifications (Proj, Model, and Run) and one of its
+    auxiliary specifications, so that the number of Calcs and the subset of
+    them satisfying given criteria are available without creating any Calc.
+
+    Parameters
+    ----------
+    core_specs : sequence of dict
+        The permutations of the core specifications
+    aux_specs : sequence of dict
+        The permutations of the auxiliary specifications
+    indices : sequence of int, optional
+        The indices of the permutations included, in the order of iteration
+        over ``core_specs`` and, within that, ``aux_specs``.  By default all
+        are included.
+    """
+    def __init__(self, core_specs, aux_specs, indices=None):
+        self.core_specs = list(core_specs)
+        self.aux_specs = list(aux_specs)
+        self._indices = indices
+
+    def _all_indices(self):
+        if self._indices is None:
+            return range(len(self.core_specs) * len(self.aux_specs))
+        return self._indices
+
+    def _spec(self, index):
+        core_index, aux_index = divmod(index, len(self.aux_specs))
+        params = dict(self.core_specs[core_index])
+        params.update(self.aux_specs[aux_index])
+        params['dtype_out_time'] = _prune_invalid_time_reductions(params)
+        return CalcSpec(**params)
+
+    def __len__(self):
+        return len(self._all_indices())
+
+    def __iter__(self):
+        for index in self._all_indices():
+            yield self._spec(index)
+
+    def __getitem__(self, key):
+        indices = self._all_indices()
+        if isinstance(key, slice):
+            return CalcSpecs(self.core_specs, self.aux_specs,
+                             list(indices[key]))
+        return self._spec(indices[key])
+
+    def __str__(self):
+        return '<aospy.CalcSpecs instance: {} Calcs>'.format(len(self))
+
+    __repr__ = __str__
+
+    def filter(self, func=None, **criteria):
+        """The subset of the CalcSpecs satisfying the given criteria.
+
+        Parameters
+        ----------
+        func : callable, optional
+            Function of a CalcSpec returning whether to include it
+        **criteria
+            Values of the Calc parameters to include, e.g.
+            ``var=precip`` or ``intvl_in=['monthly', 'daily']``.  A list,
+            tuple, or set matches any of its elements.
+
+        Returns
+        -------
+        CalcSpecs
+        """
+        indices = []
+        for index in self._all_indices():
+            spec = self._spec(index)
+            if _matches(spec, criteria) and (func is None or func(spec)):
+                indices.append(index)
+        return CalcSpecs(self.core_specs, self.aux_specs, indices)
+
+    def materialize(self):
+        """Create the Calc of each CalcSpec.
+
+        Returns
+        -------
+        list of aospy.Calc
+        """
+        return [spec.materialize() for spec in self]
+
+
+_CALC_PARAMS = ('proj', 'model', 'run', 'var', 'date_range', 'region',
+                'intvl_in', 'intvl_out', 'dtype_in_time', 'dtype_in_vert',
+                'dtype_out_time', 'dtype_out_vert', 'level', 'time_offset')
+_TYPES = OrderedDict([('proj', Proj), ('model', Model), ('var', Var),
+                      ('region', Region)])
+
+
+def _calc_params(calc):
+    """The keyword arguments from which an equivalent Calc is created."""
+    params = {name: getattr(calc, name) for name in _CALC_PARAMS
+              if name != 'date_range'}
+    params['date_range'] = (calc.start_date, calc.end_date)
+    return params
+
+
+class Reference(object):
+    """Reference by name to an object of an object library.
+
+    Parameters
+    ----------
+    name : str
+        The ``name`` attribute of the object referenced
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, Reference) and self.name == other.name
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return 'Reference({!r})'.format(self.name)
+
+
+class ObjectLibrary(object):
+    """Index by name of the aospy objects of an importable object library.
+
+    The Proj, Model, Var, and Region objects found among the attributes of
+    the library module and of its submodules (and the Models and Regions of
+    each Proj) are indexed by their names.  An object is only referenced by
+    name if no other object of the same type in the library has the same
+    name.  Runs are referenced by name among the runs of their Model.
+
+    Parameters
+    ----------
+    library : module
+        The object library, which must be importable by its ``__name__``
+    """
+    def __init__(self, library):
+        self.library = library
+        self.name = library.__name__
+        self._index = {kind: {} for kind in _TYPES}
+        visited = set()
+        self._scan(library, visited)
+
+    def _add(self, kind, obj):
+        objs = self._index[kind].setdefault(obj.name, [])
+        if not any(obj is other for other in objs):
+            objs.append(obj)
+
+    def _scan(self, module, visited):
+        visited.add(module.__name__)
+        for value in list(vars(module).values()):
+            if isinstance(value, types.ModuleType):
+                if (value.__name__.startswith(self.name + '.') and
+                        value.__name__ not in visited):
+                    self._scan(value, visited)
+                continue
+            for kind, type_ in _TYPES.items():
+                if isinstance(value, type_):
+                    self._add(kind, value)
+            if isinstance(value, Proj):
+                for model in value.models:
+                    self._add('model', model)
+                for region in value.regions:
+                    self._add('region', region)
+
+    def find(self, kind, name):
+        """The unique object of the given kind with the given name.
+
+        Parameters
+        ----------
+        kind : {'proj', 'model', 'var', 'region'}
+        name : str
+
+        Raises
+        ------
+        KeyError
+            If the library has no such object, or more than one
+        """
+        objs = self._index[kind].get(name, [])
+        if len(objs) != 1:
+            raise KeyError("Object library '{0}' has {1} {2} objects named "
+                           "'{3}'".format(self.name, len(objs), kind, name))
+        return objs[0]
+
+    def find_runs(self, name, models=None):
+        """The Runs with the given name among the runs of the given Models.
+
+        Parameters
+        ----------
+        name : str
+        models : sequence of aospy.Model, optional
+            By default, all of the Models of the library
+
+        Returns
+        -------
+        list of aospy.Run
+            Possibly empty
+        """
+        if models is None:
+            models = [model for objs in self._index['model'].values()
+                      for model in objs]
+        runs = []
+        for model in models:
+            for run in model.runs:
+                if run.name == name and not any(run is r for r in runs):
+                    runs.append(run)
+        return runs
+
+    def _reference(self, kind, obj):
+        """A Reference to the object, or the object itself if it is not
+        uniquely found in the library."""
+        try:
+            if self.find(kind, obj.name) is obj:
+                return Reference(obj.name)
+        except (AttributeError, KeyError):
+            pass
+        return obj
+
+    def _resolve(self, kind, value):
+        if isinstance(value, Reference):
+            return self.find(kind, value.name)
+        return value
+
+    def compact(self, params):
+        """Replace the objects among Calc parameters with References.
+
+        Parameters
+        ----------
+        params : dict
+            The keyword arguments to :py:class:`aospy.Calc`
+
+        Returns
+        -------
+        CompactCalcSpec
+        """
+        params = dict(params)
+        for kind in ('proj', 'model', 'var'):
+            params[kind] = self._reference(kind, params[kind])
+        if params.get('region') is not None:
+            params['region'] = type(params['region'])(
+                self._reference('region', region)
+                for region in params['region'])
+        # A Run is found among the runs of its Model.
+        if isinstance(params['model'], Reference):
+            runs = [run for run in self.find('model',
+                                             params['model'].name).runs
+                    if run.name == params['run'].name]
+            if len(runs) == 1 and runs[0] is params['run']:
+                params['run'] = Reference(params['run'].name)
+        return CompactCalcSpec(self.name, **params)
+
+    def resolve(self, params):
+        """Replace the References among Calc parameters with the objects.
+
+        Parameters
+        ----------
+        params : dict
+
+        Returns
+        -------
+        dict
+        """
+        params = dict(params)
+        for kind in ('proj', 'model', 'var'):
+            params[kind] = self._resolve(kind, params[kind])
+        if params.get('region') is not None:
+            params['region'] = type(params['region'])(
+                self._resolve('region', region)
+                for region in params['region'])
+        if isinstance(params['run'], Reference):
+            params['run'], = [run for run in params['model'].runs
+                              if run.name == params['run'].name]
+        return params
+
+
+_LIBRARIES = {}
+_LIBRARIES_LOCK = threading.Lock()
+
+
+def worker_library(name):
+    """The ObjectLibrary of the named library module in this process.
+
+    The library is imported and indexed once per process.  Its Models, and
+    therefore their grid data once loaded, are shared by all of the Calcs
+    subsequently created from CompactCalcSpecs in the process.
+    """
+    with _LIBRARIES_LOCK:
+        if name not in _LIBRARIES:
+            _LIBRARIES[name] = ObjectLibrary(importlib.import_module(name))
+        return _LIBRARIES[name]
+
+
+class CompactCalcSpec(CalcSpec):
+    """CalcSpec referencing the objects of an object library by name.
+
+    Unlike a Calc, or a CalcSpec holding the objects themselves, it is
+    pickled into a few hundred bytes, regardless of e.g. the grid data of
+    its Model or the functions of its Run's DataLoader.  The Calc is created
+    from the objects of the library as imported in the process in which it
+    is materialized (see :py:func:`worker_library`), which must therefore
+    be equivalent to the library from which the spec was created.
+
+    Parameters
+    ----------
+    library : str
+        The name of the object library module
+    **params
+        The keyword arguments to :py:class:`aospy.Calc`, in which any of
+        the Proj, Model, Run, Var, and Regions may be References
+    """
+    def __init__(self, library, **params):
+        self.library = library
+        self.params = params
+
+    def __str__(self):
+        """String representation of the object."""
+        return "<aospy.CompactCalcSpec instance: " + ', '.join(
+            _label(self.params[name]) for name in
+            ('var', 'proj', 'model', 'run')) + ">"
+
+    __repr__ = __str__
+
+    def materialize(self):
+        """Create the Calc specified, from the library in this process."""
+        return Calc(**worker_library(self.library).resolve(self.params))
+
+    def compact(self, library):
+        return self
+
+
+def compact(calc, library):
+    """A CompactCalcSpec of the Calc or CalcSpec.
+
+    Parameters
+    ----------
+    calc : aospy.Calc or CalcSpec
+    library : ObjectLibrary
+
+    Returns
+    -------
+    CompactCalcSpec
+    """
+    if isinstance(calc, CalcSpec):
+        return calc.compact(library)
+    return library.compact(_calc_params(calc))
@@ -7,7 +7,7 @@ import itertools
 import distributed
 import pytest
 
-from aospy import Var, Proj
+from aospy import Var, Proj, executors
 from aospy.automate import (_get_attr_by_tag, _permuted_dicts_of_specs,
                             _get_all_objs_of_type, _merge_dicts,
                             _input_func_py2_py3, AospyException,
@@ -15,7 +15,10 @@ from aospy.automate import (_get_attr_by_tag, _permuted_dicts_of_specs,
                             _VARIABLES_STR, _REGIONS_STR,
                             _compute_or_skip_on_error, submit_mult_calcs,
                             _n_workers_for_local_cluster,
-                            _prune_invalid_time_reductions)
+                            _prune_invalid_time_reductions, _tar_archives,
+                            _exec_calcs, _limit_nested_threads,
+                            _compute_within_limits, _compact_tasks)
+from aospy.manifest import Manifest, calc_key
 from .data.objects import examples as lib
 from .data.objects.examples import (
     example_proj, example_model, example_run, var_not_time_defined,
@@ -259,6 +262,14 @@ def test_submit_mult_calcs_external_client(calcsuite_init_specs_single_calc,
      dict(parallelize=True, write_to_tar=False),
      dict(parallelize=False, write_to_tar=True),
      dict(parallelize=True, write_to_tar=True),
+     dict(lazy=True, write_to_tar=True),
+     dict(executor='processes', max_threads=4, write_to_tar=False),
+     dict(lazy=True, executor='processes', max_workers=2,
+          write_to_tar=False),
+     dict(parallelize=True, compact=True, write_to_tar=False),
+     dict(lazy=True, executor='processes', compact=True,
+          write_to_tar=False),
+     dict(executor='pipeline', prefetch=2, write_to_tar=True),
      None])
 def test_submit_mult_calcs(calcsuite_init_specs_single_calc, exec_options):
     calcs = submit_mult_calcs(calcsuite_init_specs_single_calc, exec_options)
@@ -271,6 +282,12 @@ def test_submit_mult_calcs(calcsuite_init_specs_single_calc, exec_options):
         calcsuite_init_specs_single_calc['output_time_regional_reductions'])
 
 
+def test_submit_mult_calcs_lazy_resume(calcsuite_init_specs_single_calc):
+    with pytest.raises(AospyException):
+        submit_mult_calcs(calcsuite_init_specs_single_calc,
+                          dict(lazy=True, resume=True))
+
+
 def test_submit_mult_calcs_no_calcs(calcsuite_init_specs):
     specs = calcsuite_init_specs.copy()
     specs['input_vertical_datatypes'] = []
@@ -302,6 +319,7 @@ def test_submit_two_calcs_external_client(calcsuite_init_specs_two_calcs,
      dict(parallelize=True, write_to_tar=False),
      dict(parallelize=False, write_to_tar=True),
      dict(parallelize=True, write_to_tar=True),
+     dict(executor='processes', max_workers=2, write_to_tar=True),
      None])
 def test_submit_two_calcs(calcsuite_init_specs_two_calcs, exec_options):
     calcs = submit_mult_calcs(calcsuite_init_specs_two_calcs, exec_options)
@@ -314,6 +332,121 @@ def test_submit_two_calcs(calcsuite_init_specs_two_calcs, exec_options):
         calcsuite_init_specs_two_calcs['output_time_regional_reductions'])
 
 
+@pytest.mark.parametrize(
+    ('outcomes', 'retries', 'expected_delays', 'failure'),
+    [([executors.TIMEOUT, executors.KILLED, executors.DONE], 2, [0.5, 1.],
+      None),
+     ([executors.MEMORY, executors.TIMEOUT], 1, [0.5], executors.TIMEOUT),
+     ([executors.ERROR], 2, [], executors.ERROR)])
+def test_compute_within_limits(calc, monkeypatch, tmpdir, outcomes, retries,
+                               expected_delays, failure):
+    outcomes = list(outcomes)
+    delays = []
+
+    def call_isolated(func, arg, timeout=None, memory_limit=None):
+        assert (timeout, memory_limit) == (10, 100)
+        outcome = outcomes.pop(0)
+        return outcome, arg if outcome == executors.DONE else 'traceback'
+
+    monkeypatch.setattr(executors, 'call_isolated', call_isolated)
+    monkeypatch.setattr('time.sleep', delays.append)
+    manifest = Manifest(str(tmpdir.join('manifest.json')))
+    limits = executors.ResourceLimits(timeout=10, memory_limit=100,
+                                      retries=retries, backoff=0.5)
+    result = _compute_within_limits(calc, dict(write_to_tar=False), limits,
+                                    manifest=manifest)
+    assert not outcomes
+    assert delays == expected_delays
+    assert result is (calc if failure is None else None)
+    entry, = manifest.entries.values()
+    assert entry['attempts'] == len(expected_delays) + 1
+    assert entry['failure'] == failure
+
+
+def test_exec_calcs_resource_limits(calcsuite_init_specs_two_calcs):
+    calcs = CalcSuite(calcsuite_init_specs_two_calcs).create_calcs()
+    result = _exec_calcs(calcs, executor='processes', max_workers=2,
+                         write_to_tar=False, timeout=300,
+                         memory_limit='4GB', retries=1)
+    assert [calc.name for calc in result] == [calc.name for calc in calcs]
+    assert all(calc.data_out for calc in result)
+    assert _exec_calcs(calcs, write_to_tar=False, timeout=0.01) == [None,
+                                                                    None]
+
+
+def test_compact_tasks(calcsuite_init_specs_two_calcs, caplog):
+    calcs = CalcSuite(calcsuite_init_specs_two_calcs).create_calcs()
+    tasks = _compact_tasks([calcs[:1], calcs[1:]], lib)
+    assert [[str(spec) for spec in task] for task in tasks] == [
+        [str(calc).replace('Calc', 'CompactCalcSpec')] for calc in calcs]
+
+    tasks = [calcs]
+    assert _compact_tasks(tasks, object()) is tasks
+    assert 'cannot be imported by name' in caplog.record_tuples[-1][-1]
+
+
+def test_exec_calcs_pipeline(calcsuite_init_specs_two_calcs, tmpdir):
+    calcs = CalcSuite(calcsuite_init_specs_two_calcs).create_calcs()
+    manifest = Manifest(str(tmpdir.join('manifest.json')))
+    result = _exec_calcs(calcs, executor='pipeline', write_to_tar=False,
+                         manifest=manifest, instrument=True, prefetch=2)
+    assert [calc.name for calc in result] == [calc.name for calc in calcs]
+    assert all(calc.data_out for calc in result)
+    assert all('read' in calc.phases and 'save' in calc.phases
+               for calc in result)
+
+    def fail(data):
+        raise ValueError(data)
+    calcs[0]._reduce = fail
+    result = _exec_calcs(calcs, executor='pipeline', write_to_tar=False,
+                         manifest=manifest)
+    assert result[0] is None
+    assert result[1] is calcs[1]
+    entry = manifest.entries[calc_key(calcs[0])]
+    assert entry['failure'] == 'error'
+    assert 'ValueError' in entry['traceback']
+
+    with pytest.raises(ValueError):
+        _exec_calcs(calcs, executor='pipeline', timeout=10)
+
+
+def test_exec_calcs_invalid_executor(calcsuite_init_specs_two_calcs):
+    calcs = CalcSuite(calcsuite_init_specs_two_calcs).create_calcs()
+    with pytest.raises(ValueError):
+        _exec_calcs(calcs, executor='threads')
+
+
+def test_exec_calcs_preserves_order(calcsuite_init_specs_two_calcs):
+    calcs = CalcSuite(calcsuite_init_specs_two_calcs).create_calcs()
+    for schedule, locality in [(True, False), (False, False), (True, True),
+                               (False, True)]:
+        result = _exec_calcs(calcs, executor='processes', max_workers=2,
+                             write_to_tar=False, schedule=schedule,
+                             locality=locality)
+        assert [calc.name for calc in result] == [calc.name for calc in calcs]
+
+
+@pytest.mark.parametrize('memory_budget', [1, '100MB'])
+def test_exec_calcs_memory_budget(calcsuite_init_specs_two_calcs,
+                                  memory_budget):
+    calcs = CalcSuite(calcsuite_init_specs_two_calcs).create_calcs()
+    result = _exec_calcs(calcs, executor='processes', max_workers=2,
+                         write_to_tar=False, memory_budget=memory_budget)
+    assert [calc.name for calc in result] == [calc.name for calc in calcs]
+
+
+@pytest.mark.parametrize(
+    ('max_threads', 'n_workers', 'expected'),
+    [(None, 2, None),
+     (1, 2, 1),
+     (4, 1, min(4, cpu_count())),
+     (4, 2 * cpu_count(), 1)])
+def test_limit_nested_threads(max_threads, n_workers, expected):
+    compute_kwargs = dict(max_threads=max_threads)
+    _limit_nested_threads(compute_kwargs, n_workers)
+    assert compute_kwargs['max_threads'] == expected
+
+
 def test_n_workers_for_local_cluster(calcsuite_init_specs_two_calcs):
     calcs = CalcSuite(calcsuite_init_specs_two_calcs).create_calcs()
     expected = min(cpu_count(), len(calcs))
@@ -321,6 +454,14 @@ def test_n_workers_for_local_cluster(calcsuite_init_specs_two_calcs):
     assert result == expected
 
 
+def test_tar_archives(calcsuite_init_specs_two_calcs):
+    calcs = CalcSuite(calcsuite_init_specs_two_calcs).create_calcs()
+    archives = _tar_archives(calcs + [None])
+    assert list(archives) == [calcs[0].path_tar_out]
+    expected = {calc.file_name['av']: calc.path_out['av'] for calc in calcs}
+    assert archives[calcs[0].path_tar_out] == expected
+
+
 @pytest.fixture
 def calc_suite(calcsuite_init_specs):
     return CalcSuite(calcsuite_init_specs)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """Basic test of the Calc module on 2D data."""
 import datetime
+import os
 from os.path import isfile
 import shutil
 import unittest
@@ -11,9 +12,11 @@ import cftime
 import numpy as np
 import xarray as xr
 
-from aospy import Var
-from aospy.calc import Calc, _add_metadata_as_attrs, _replace_pressure
+from aospy import Var, utils
+from aospy.calc import (Calc, _add_metadata_as_attrs, _replace_pressure,
+                        load_from_tar, load_results)
 from aospy.internal_names import ETA_STR
+from aospy.region import weights_cache
 from aospy.utils.vertcoord import p_eta, dp_eta, p_level, dp_level
 from .data.objects.examples import (
     example_proj, example_model, example_run, var_not_time_defined,
@@ -142,6 +145,107 @@ def test_monthly_ts(test_params):
     _test_files_and_attrs(calc, 'ts')
 
 
+def test_annual_mean_compressed(test_params):
+    calc = Calc(intvl_out='ann', dtype_out_time='ts', **test_params)
+    encoding = dict(zlib=True, shuffle=True, chunking='map')
+    calc.compute(output_format='NETCDF4', output_encoding=encoding)
+    _test_files_and_attrs(calc, 'ts')
+    with xr.open_dataset(calc.path_out['ts']) as data:
+        assert data[calc.name].encoding['zlib']
+        assert data[calc.name].encoding['chunksizes'][0] == 1
+
+
+def test_zarr_output(test_params):
+    pytest.importorskip('zarr')
+    calc = Calc(intvl_out='ann', dtype_out_time=['av', 'reg.av'],
+                region=[globe], **test_params)
+    calc.compute(output_backend='zarr', output_encoding=dict(zlib=True))
+    assert not isfile(calc.path_out['av'])
+    assert not isfile(calc.path_tar_out)
+    expected = calc.data_out['av']
+    calc.data_out = {}
+    result = calc.load('av')
+    assert result.chunks is not None
+    xr.testing.assert_allclose(result.load(), expected)
+
+    # Regional output for additional regions is added to the same group.
+    calc = Calc(intvl_out='ann', dtype_out_time='reg.av', region=[sahel],
+                **test_params)
+    calc.compute(output_backend='zarr')
+    with xr.open_zarr(calc.zarr_store,
+                      group=calc._store_group('reg.av')) as data:
+        assert set(data.data_vars) == {globe.name, sahel.name}
+
+
+def test_consolidated_output(test_params):
+    calc = Calc(intvl_out='ann', dtype_out_time=['av', 'ts', 'reg.av'],
+                region=[globe], **test_params)
+    calc.compute(output_backend='consolidated')
+    assert isfile(calc.consolidated_store)
+    assert not isfile(calc.path_out['av'])
+    assert not isfile(calc.path_tar_out)
+    assert utils.io.netcdf_groups(calc.consolidated_store) == sorted(
+        calc._store_group(dtype) for dtype in calc.dtype_out_time)
+    expected = calc.data_out['ts']
+    calc.data_out = {}
+    xr.testing.assert_allclose(calc.load('ts'), expected)
+
+    # Regional output for additional regions is added to the same group.
+    calc = Calc(intvl_out='ann', dtype_out_time='reg.av', region=[sahel],
+                **test_params)
+    calc.compute(output_backend='consolidated')
+    result = load_results([calc], 'reg.av', regions=[globe, sahel])
+    assert list(result['region'].values) == [globe.name, sahel.name]
+
+
+@pytest.mark.parametrize('output_format', ['NETCDF3_64BIT', 'NETCDF4'])
+def test_load_from_tar(test_params, output_format):
+    calcs = [Calc(intvl_out='ann', dtype_out_time=dtype, **test_params)
+             for dtype in ['av', 'ts']]
+    for calc in calcs:
+        calc.compute(output_format=output_format)
+    expected = [calc.data_out[dtype] for calc, dtype
+                in zip(calcs, ['av', 'ts'])]
+    shutil.rmtree(example_proj.direc_out)
+
+    calc = Calc(intvl_out='ann', dtype_out_time='av', **test_params)
+    xr.testing.assert_allclose(calc.load('av'), expected[0])
+    results = load_from_tar([calcs[0], calcs[0]], 'av')
+    for result in results:
+        xr.testing.assert_allclose(result, expected[0])
+    result = load_from_tar([calcs[1]], 'ts')[0]
+    xr.testing.assert_allclose(result, expected[1])
+
+
+def test_load_results(test_params):
+    calcs = [Calc(intvl_out='ann', dtype_out_time=['av', 'reg.av'],
+                  region=[region], **test_params) for region in [globe, sahel]]
+    for calc in calcs:
+        calc.compute()
+    name = calcs[0].name
+    expected_av = calcs[0].data_out['av']
+    expected_reg = {region.name: calc.data_out['reg.av'][region.name]
+                    for calc, region in zip(calcs, [globe, sahel])}
+
+    result = load_results(calcs, 'reg.av')
+    assert result[name].dims[:3] == ('model', 'run', 'region')
+    assert list(result['region'].values) == [globe.name, sahel.name]
+    for region, expected in expected_reg.items():
+        actual = result[name].sel(model=example_model.name,
+                                  run=example_run.name, region=region)
+        np.testing.assert_allclose(actual.values, expected.values)
+    result = load_results(calcs, 'reg.av', regions=[sahel])
+    assert list(result['region'].values) == [sahel.name]
+
+    shutil.rmtree(example_proj.direc_out)
+    result = load_results(calcs, 'av')
+    assert result[name].dims[:2] == ('model', 'run')
+    np.testing.assert_allclose(result[name].isel(model=0, run=0).values,
+                               expected_av.values)
+    with pytest.raises(ValueError):
+        load_results(calcs, 'av', regions=[sahel])
+
+
 def test_simple_reg_av(test_params):
     calc = Calc(intvl_out='ann', dtype_out_time='reg.av', region=[globe],
                 **test_params)
@@ -149,6 +253,15 @@ def test_simple_reg_av(test_params):
     _test_files_and_attrs(calc, 'reg.av')
 
 
+def test_reg_av_multiple_calcs(test_params):
+    for region in [globe, sahel]:
+        calc = Calc(intvl_out='ann', dtype_out_time='reg.av',
+                    region=[region], **test_params)
+        calc.compute()
+    with xr.open_dataset(calc.path_out['reg.av']) as data:
+        assert set(data.data_vars) == {globe.name, sahel.name}
+
+
 def test_simple_reg_ts(test_params):
     calc = Calc(intvl_out='ann', dtype_out_time='reg.ts', region=[globe],
                 **test_params)
@@ -163,6 +276,60 @@ def test_complex_reg_av(test_params):
     _test_files_and_attrs(calc, 'reg.av')
 
 
+def test_compute_threaded(test_params):
+    dtypes = ['av', 'reg.av', 'reg.std']
+    calc = Calc(intvl_out='ann', dtype_out_time=dtypes,
+                region=[globe, sahel], **test_params)
+    calc.compute(write_to_tar=False)
+    expected = {dtype: calc._read_output(dtype) for dtype in dtypes}
+    _clean_test_direcs()
+    calc = Calc(intvl_out='ann', dtype_out_time=dtypes,
+                region=[globe, sahel], **test_params)
+    calc.compute(write_to_tar=False, max_threads=4)
+    assert calc.max_threads == 4
+    for dtype in dtypes:
+        xr.testing.assert_identical(calc._read_output(dtype),
+                                    expected[dtype])
+
+
+def test_compute_weights_cache(test_params, tmpdir):
+    direc = str(tmpdir.join('weights'))
+    calc = Calc(intvl_out='ann', dtype_out_time=['reg.av', 'reg.std'],
+                region=[globe, sahel], **test_params)
+    calc.compute(write_to_tar=False, weights_cache=direc)
+    assert calc.weights_cache.direc == direc
+    assert len(os.listdir(direc)) == 2
+    # The directory only applies to the Calc given it.
+    assert weights_cache.direc is None
+
+
+def test_region_calcs_av_input_eta(monkeypatch):
+    # Already time-averaged data is only region-averaged, without loading
+    # the pressure of the hybrid vertical coordinates.
+    calc = Calc(intvl_out='ann', dtype_out_time='reg.av', region=[globe],
+                var=sphum, proj=example_proj, model=example_model,
+                run=example_run, date_range=('0006', '0006'),
+                intvl_in='monthly', dtype_in_time='ts',
+                dtype_in_vert=ETA_STR, dtype_out_vert=None)
+    calc.dtype_in_time = 'av'
+    calc.dtype_out_vert = False
+
+    def fail(*args, **kwargs):
+        raise AssertionError('The pressure must not be loaded')
+    monkeypatch.setattr(calc, '_get_input_data', fail)
+
+    lat = [-45., 45.]
+    lon = [90., 270.]
+    arr = xr.DataArray([[1., 2.], [3., np.nan]], dims=['lat', 'lon'],
+                       coords={'lat': lat, 'lon': lon})
+    arr.coords['sfc_area'] = xr.DataArray([[1., 1.], [2., 2.]],
+                                          dims=['lat', 'lon'])
+    result = calc.region_calcs(arr, 'std')
+    assert globe.name + '_pressure' not in result.coords
+    xr.testing.assert_identical(result[globe.name],
+                                globe.ts(arr).rename(globe.name))
+
+
 test_params_not_time_defined = {
     'proj': example_proj,
     'model': example_model,
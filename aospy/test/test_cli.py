@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""Test suite for aospy.cli module."""
+import datetime
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from aospy import cli
+from aospy.automate import CalcSuite
+from aospy.sharding import shard_paths
+from .data.objects.examples import (
+    example_proj, example_model, example_run, condensation_rain,
+    convection_rain, globe
+)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+_PY_SPEC = """
+from aospy.test.data.objects import examples as lib
+
+calc_suite_specs = dict(
+    library=lib,
+    projects=[lib.example_proj],
+    models=[lib.example_model],
+    runs=[lib.example_run],
+    variables=[lib.condensation_rain, lib.convection_rain],
+    regions=[lib.globe],
+    date_ranges='default',
+    output_time_intervals=['ann'],
+    output_time_regional_reductions=['av', 'reg.av'],
+    output_vertical_reductions=[None],
+    input_time_intervals=['monthly'],
+    input_time_datatypes=['ts'],
+    input_time_offsets=[None],
+    input_vertical_datatypes=[False],
+)
+
+calc_exec_options = dict(prompt_verify=True, write_to_tar=True)
+"""
+
+_YAML_SPEC = """
+calc_suite_specs:
+  library: aospy.test.data.objects.examples
+  projects: [example_proj]
+  models: [example_model]
+  runs: [example_run]
+  variables: [condensation_rain, convection_rain]
+  regions: [globe]
+  date_ranges: default
+  output_time_intervals: [ann]
+  output_time_regional_reductions: [av, reg.av]
+  output_vertical_reductions: [null]
+  input_time_intervals: [monthly]
+  input_time_datatypes: [ts]
+  input_time_offsets: [null]
+  input_vertical_datatypes: [false]
+calc_exec_options:
+  prompt_verify: true
+"""
+
+
+@pytest.fixture(params=['spec.py', 'spec.yml'])
+def spec_path(request, tmpdir):
+    path = tmpdir.join(request.param)
+    path.write(_PY_SPEC if request.param.endswith('.py') else _YAML_SPEC)
+    yield str(path)
+    for direc in [example_proj.direc_out, example_proj.tar_direc_out]:
+        shutil.rmtree(direc, ignore_errors=True)
+
+
+def test_load_spec(spec_path):
+    suite_specs, exec_options = cli.load_spec(spec_path)
+    assert exec_options['prompt_verify']
+    assert suite_specs['models'] == [example_model]
+    assert suite_specs['runs'] == [example_run]
+    assert suite_specs['variables'] == [condensation_rain, convection_rain]
+    assert suite_specs['regions'] == [globe]
+    assert len(CalcSuite(suite_specs).create_calcs()) == 2
+
+
+def test_load_spec_module():
+    with pytest.raises(AttributeError):
+        cli.load_spec('aospy.test.data.objects.examples')
+
+
+def test_resolve_yaml_specs_invalid():
+    specs = dict(library='aospy.test.data.objects.examples',
+                 variables=['condensation_rain', 'nonexistent'])
+    with pytest.raises(KeyError):
+        cli._resolve_yaml_specs(specs)
+    specs = dict(library='aospy.test.data.objects.examples',
+                 runs=['nonexistent'])
+    with pytest.raises(KeyError):
+        cli._resolve_yaml_specs(specs)
+
+
+def test_resolve_yaml_date_ranges():
+    specs = cli._resolve_yaml_specs(dict(
+        library='aospy.test.data.objects.examples',
+        date_ranges=[[datetime.date(2000, 1, 1), '2001-12-31']]))
+    assert specs['date_ranges'] == [(datetime.datetime(2000, 1, 1),
+                                     '2001-12-31')]
+
+
+@pytest.mark.parametrize(('argv', 'expected'), [
+    ([], {}),
+    (['-y', '--executor', 'processes', '-n', '2', '--memory-budget', '1GB',
+      '--no-tar'],
+     dict(prompt_verify=False, executor='processes', max_workers=2,
+          memory_budget='1GB', write_to_tar=False)),
+    (['--dry-run', '--resume', '--lazy', '--shard', '1/2'],
+     dict(plan_only=True, resume=True, lazy=True, shard='1/2')),
+    (['--profile', '--instrument', 'out.jsonl', '--queue', 'q'],
+     dict(profile=True, instrument='out.jsonl', queue='q')),
+    (['--profile', 'profiles', '--instrument'],
+     dict(profile=dict(dir='profiles'), instrument=True))])
+def test_exec_options(argv, expected):
+    args = cli._parser().parse_args(['run', 'spec.py'] + argv)
+    assert cli._exec_options(args) == expected
+
+
+def test_main_run(spec_path, capsys):
+    assert cli.main(['run', spec_path, '-y', '--plan']) == 0
+    assert 'Execution plan for 2 calculations' in capsys.readouterr()[0]
+    calcs = CalcSuite(cli.load_spec(spec_path)[0]).create_calcs()
+    assert not any(os.path.exists(path) for calc in calcs
+                   for path in calc.path_out.values())
+
+    assert cli.main(['run', spec_path, '-y', '--executor', 'pipeline']) == 0
+    assert all(os.path.isfile(path) for calc in calcs
+               for path in calc.path_out.values())
+    assert os.path.isfile(calcs[0].path_tar_out)
+
+
+def test_main_run_shards(spec_path):
+    for shard in ['0/2', '1/2']:
+        assert cli.main(['run', spec_path, '-y', '--shard', shard]) == 0
+    calcs = CalcSuite(cli.load_spec(spec_path)[0]).create_calcs()
+    assert len(shard_paths(calcs[0].path_tar_out)) == 2
+    assert cli.main(['merge', spec_path]) == 0
+    assert shard_paths(calcs[0].path_tar_out) == []
+    assert os.path.isfile(calcs[0].path_tar_out)
+
+
+def test_main_usage():
+    with pytest.raises(SystemExit):
+        cli.main([])
+
+
+def _loaded_modules(code):
+    """The modules loaded after executing the code in a new interpreter."""
+    code += '; import sys; print(" ".join(sorted(sys.modules)))'
+    output = subprocess.check_output(
+        [sys.executable, '-W', 'ignore', '-c', code],
+        env=dict(os.environ, PYTHONPATH=_ROOT))
+    return set(output.decode().split())
+
+
+def test_cli_imports_nothing_beyond_aospy():
+    # The command necessarily imports the aospy package; building its parser
+    # must not import anything more, e.g. distributed.
+    loaded = _loaded_modules('from aospy import cli; cli._parser()')
+    assert loaded - _loaded_modules('import aospy') == {'aospy.cli'}
+    assert 'distributed' not in loaded
+    assert subprocess.call([sys.executable, '-m', 'aospy', '--help'],
+                           env=dict(os.environ, PYTHONPATH=_ROOT),
+                           stdout=subprocess.DEVNULL) == 0
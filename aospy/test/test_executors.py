@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""Test suite for aospy.executors module."""
+import os
+import signal
+import threading
+import time
+
+import cloudpickle
+import pytest
+
+from aospy import executors
+from aospy.executors import call_isolated, map_on_process_pool
+
+
+def _record_interval(item):
+    start = time.time()
+    time.sleep(0.2)
+    return item, start, time.time()
+
+
+def test_map_on_process_pool():
+    assert map_on_process_pool(lambda x: 2 * x, range(5), 2) == [
+        0, 2, 4, 6, 8]
+    assert map_on_process_pool(lambda x: x, []) == []
+
+
+def test_map_on_process_pool_bounds_in_flight():
+    results = map_on_process_pool(_record_interval, range(6), max_workers=2)
+    assert [item for item, _, _ in results] == list(range(6))
+    for _, start, _ in results:
+        in_flight = sum(1 for _, s, e in results if s <= start < e)
+        assert in_flight <= 2
+
+
+def test_map_on_process_pool_worker_dies():
+    def func(x):
+        if x == 1:
+            os._exit(1)
+        return x
+    assert map_on_process_pool(func, [0, 1, 2], max_workers=1) == [0, None, 2]
+
+
+class _OneAtATime(object):
+    def __init__(self):
+        self.in_flight = 0
+        self.peaks = {}
+
+    def admit(self, i, force=False):
+        if self.in_flight and not force:
+            return False
+        self.in_flight += 1
+        return True
+
+    def waiting(self, indices):
+        return executors._Waiting(indices, self)
+
+    def release(self, i, peak=None):
+        self.in_flight -= 1
+        self.peaks[i] = peak
+
+
+def test_map_on_process_pool_admission():
+    admission = _OneAtATime()
+    results = map_on_process_pool(_record_interval, range(4), max_workers=4,
+                                  admission=admission)
+    assert [item for item, _, _ in results] == list(range(4))
+    for _, start, _ in results:
+        assert sum(1 for _, s, e in results if s <= start < e) == 1
+    assert admission.in_flight == 0
+    assert sorted(admission.peaks) == list(range(4))
+    assert all(peak >= 0 for peak in admission.peaks.values())
+
+
+def _count_threads(_):
+    return threading.active_count()
+
+
+@pytest.mark.parametrize('measure', [False, True])
+def test_call_pickled_measures_only_if_needed(measure, monkeypatch):
+    started = []
+    enter = executors._PeakMemory.__enter__
+    monkeypatch.setattr(executors._PeakMemory, '__enter__',
+                        lambda self: started.append(self) or enter(self))
+    payload = cloudpickle.dumps((_count_threads, None, measure))
+    n_threads, peak = cloudpickle.loads(executors._call_pickled(payload))
+    assert bool(started) == measure
+    if measure:
+        assert peak >= 0
+    else:
+        assert peak is None
+        assert n_threads == threading.active_count()
+
+
+def test_map_on_process_pool_no_admission_no_peaks(monkeypatch):
+    assert map_on_process_pool(_count_threads, range(2), max_workers=1) == [
+        1, 1]
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _raise(x):
+    raise ValueError(x)
+
+
+def _allocate(nbytes):
+    return len(bytearray(nbytes))
+
+
+def _kill(x):
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+@pytest.mark.parametrize(
+    ('func', 'arg', 'kwargs', 'outcome'),
+    [(_sleep, 0, {}, executors.DONE),
+     (_raise, 'x', {}, executors.ERROR),
+     (_sleep, 60, dict(timeout=0.5), executors.TIMEOUT),
+     (_allocate, 2 * 10 ** 9, dict(memory_limit=10 ** 9), executors.MEMORY),
+     (_allocate, 10 ** 7, dict(memory_limit=10 ** 9), executors.DONE),
+     (_kill, 0, {}, executors.KILLED)])
+def test_call_isolated(func, arg, kwargs, outcome):
+    result = call_isolated(func, arg, **kwargs)
+    assert result[0] == outcome
+    if outcome == executors.DONE:
+        assert result[1] == func(arg)
+    elif outcome == executors.ERROR:
+        assert 'ValueError' in result[1]
+    elif outcome == executors.MEMORY:
+        assert 'MemoryError' in result[1]
+
+
+def test_resource_limits_delay():
+    limits = executors.ResourceLimits(retries=3, backoff=0.5)
+    assert [limits.delay(i) for i in (1, 2, 3)] == [0.5, 1., 2.]
+
+
+def _sleep_and_add(x):
+    time.sleep(0.1)
+    return x + 1
+
+
+def test_map_pipelined():
+    start = time.time()
+    results = executors.map_pipelined([_sleep_and_add] * 3, range(6),
+                                      depths=[2, 2])
+    assert results == [3, 4, 5, 6, 7, 8]
+    # Executed one stage at a time, this would take 1.8 s.
+    assert time.time() - start < 1.5
+    assert executors.map_pipelined([_sleep_and_add], [1]) == [2]
+    assert executors.map_pipelined([_sleep_and_add] * 2, []) == []
+
+
+def test_map_pipelined_stage_raises():
+    def func(x):
+        if x == 2:
+            raise ValueError(x)
+        return x
+    with pytest.raises(ValueError):
+        executors.map_pipelined([_sleep_and_add, func, _sleep_and_add],
+                                range(10))
+    with pytest.raises(ValueError):
+        executors.map_pipelined([_sleep_and_add] * 3, range(2), depths=[1])
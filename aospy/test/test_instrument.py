@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""Test suite for aospy.instrument module."""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import pstats
+import shutil
+
+import pytest
+
+from aospy import instrument
+from aospy.automate import CalcSuite, submit_mult_calcs
+from .data.objects import examples as lib
+from .data.objects.examples import (
+    example_proj, example_model, example_run, condensation_rain,
+    convection_rain, globe
+)
+
+
+@pytest.fixture
+def suite_specs():
+    specs = dict(
+        library=lib,
+        projects=[example_proj],
+        models=[example_model],
+        runs=[example_run],
+        variables=[condensation_rain, convection_rain],
+        regions=[globe],
+        date_ranges='default',
+        output_time_intervals=['ann'],
+        output_time_regional_reductions=['av', 'reg.av'],
+        output_vertical_reductions=[None],
+        input_time_intervals=['monthly'],
+        input_time_datatypes=['ts'],
+        input_time_offsets=[None],
+        input_vertical_datatypes=[False],
+    )
+    yield specs
+    for direc in [example_proj.direc_out, example_proj.tar_direc_out]:
+        shutil.rmtree(direc, ignore_errors=True)
+
+
+def test_phase_disabled():
+    assert instrument.phase('open') is instrument._NULL_PHASE
+    with instrument.phase('open'):
+        instrument.count_files(['a.nc'])
+
+
+def _read(_):
+    with instrument.phase('read'):
+        pass
+
+
+def test_recorder():
+    recorder = instrument.Recorder()
+    with recorder.recording():
+        with instrument.phase('open'):
+            instrument.count_files(['a.nc', 'b.nc'])
+            with instrument.phase('decode'):
+                pass
+        with ThreadPoolExecutor(2) as executor:
+            list(executor.map(instrument.propagate(_read), range(3)))
+    assert instrument.phase('open') is instrument._NULL_PHASE
+    phases = recorder.to_dict()
+    assert list(phases) == ['decode', 'open', 'read', 'total']
+    assert phases['open']['calls'] == 1
+    assert phases['open']['files_opened'] == 2
+    assert phases['decode']['files_opened'] == 0
+    assert phases['read']['calls'] == 3
+    assert phases['total']['files_opened'] == 2
+    assert phases['total']['seconds'] >= phases['open']['seconds']
+    assert phases['total']['peak_rss'] > 0
+
+
+def test_calc_compute_instrument(suite_specs):
+    calc = CalcSuite(suite_specs).create_calcs()[0]
+    calc.compute(write_to_tar=False)
+    assert calc.phases is None
+    calc.compute(write_to_tar=True, instrument=True)
+    expected = ['discover', 'open', 'decode', 'read', 'local_ts',
+                'yearly_average', 'time_reduce', 'region_calcs', 'save',
+                'tar', 'total']
+    assert set(calc.phases) == set(expected)
+    assert calc.phases['open']['files_opened'] == 3
+    assert calc.phases['save']['calls'] == 2
+    assert all(stats['seconds'] >= 0 for stats in calc.phases.values())
+
+
+@pytest.mark.parametrize('exec_options', [
+    dict(),
+    dict(executor='processes', max_workers=2)])
+def test_submit_mult_calcs_instrument(suite_specs, exec_options, tmpdir,
+                                      capsys):
+    path = str(tmpdir.join('instrument.jsonl'))
+    exec_options.update(instrument=path, write_to_tar=False)
+    calcs = submit_mult_calcs(suite_specs, exec_options)
+    assert all(calc.phases['open']['files_opened'] == 3 for calc in calcs)
+    assert 'Instrumentation of 2 calculations' in capsys.readouterr()[0]
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert [record['calc'] for record in records] == [str(calc)
+                                                      for calc in calcs]
+    assert records[0]['phases'] == calcs[0].phases
+
+    report = instrument.SuiteReport(calcs + [None])
+    assert len(report) == 2
+    totals = report.totals
+    assert list(totals)[-1] == 'total'
+    assert totals['open']['files_opened'] == 6
+    assert totals['read']['seconds'] == pytest.approx(
+        sum(calc.phases['read']['seconds'] for calc in calcs))
+    assert totals['total']['peak_rss'] == max(
+        calc.phases['total']['peak_rss'] for calc in calcs)
+
+
+def test_profiler(suite_specs, tmpdir):
+    calc = CalcSuite(suite_specs).create_calcs()[0]
+    profiler = instrument.Profiler(direc=str(tmpdir), top=5)
+    path = profiler.path(calc)
+    assert path == str(tmpdir.join(
+        'example_proj', 'example_model', 'example_run',
+        calc.name + '.ann.from_monthly_ts.example_model.example_run.'
+        '0004-0006.prof'))
+    assert instrument.Profiler().path(calc).startswith(calc.dir_out)
+
+    with pytest.raises(ZeroDivisionError):
+        profiler.profile(calc, lambda: 1 / 0)
+    assert os.path.isfile(path)
+    assert profiler.profile(calc, calc.compute, write_to_tar=False) is calc
+    assert 'compute' in str(pstats.Stats(path).stats)
+    with open(path + '.txt') as f:
+        assert f.readline() == 'Profile of {}\n'.format(calc)
+
+
+@pytest.mark.parametrize('exec_options', [
+    dict(),
+    dict(executor='processes', max_workers=2)])
+def test_submit_mult_calcs_profile(suite_specs, exec_options, tmpdir):
+    exec_options.update(write_to_tar=False, profile=dict(
+        calcs=lambda calc: calc.name == 'convection_rain',
+        dir=str(tmpdir)))
+    calcs = submit_mult_calcs(suite_specs, exec_options)
+    profiler = instrument.Profiler(direc=str(tmpdir))
+    profiled = {calc.name: os.path.isfile(profiler.path(calc))
+                for calc in calcs}
+    assert profiled == {'condensation_rain': False, 'convection_rain': True}
+    calc, = [calc for calc in calcs if calc.name == 'convection_rain']
+    assert os.path.isfile(profiler.path(calc) + '.txt')
@@ -0,0 +1,156 @@
+"""Test suite for aospy.manifest module."""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import shutil
+
+import pytest
+
+from aospy.automate import CalcSuite, submit_mult_calcs, AospyException
+from aospy.manifest import (Manifest, calc_key, default_manifest_path,
+                            PENDING, RUNNING, DONE, FAILED)
+from .data.objects import examples as lib
+from .data.objects.examples import (
+    example_proj, example_model, example_run, condensation_rain,
+    convection_rain
+)
+
+
+@pytest.fixture
+def suite_specs():
+    specs = dict(
+        library=lib,
+        projects=[example_proj],
+        models=[example_model],
+        runs=[example_run],
+        variables=[condensation_rain, convection_rain],
+        regions=[None],
+        date_ranges='default',
+        output_time_intervals=['ann'],
+        output_time_regional_reductions=['av'],
+        output_vertical_reductions=[None],
+        input_time_intervals=['monthly'],
+        input_time_datatypes=['ts'],
+        input_time_offsets=[None],
+        input_vertical_datatypes=[False],
+    )
+    yield specs
+    for direc in [example_proj.direc_out, example_proj.tar_direc_out]:
+        shutil.rmtree(direc, ignore_errors=True)
+
+
+@pytest.fixture
+def calcs(suite_specs):
+    return CalcSuite(suite_specs).create_calcs()
+
+
+@pytest.fixture
+def manifest(tmpdir):
+    return Manifest(str(tmpdir.join('manifest.json')))
+
+
+def test_calc_key_unique(calcs):
+    keys = [calc_key(calc) for calc in calcs]
+    assert len(set(keys)) == len(calcs)
+    assert all(key.startswith('example_proj/example_model/example_run/')
+               for key in keys)
+
+
+def test_default_manifest_path(calcs):
+    path = default_manifest_path(calcs)
+    assert path.startswith(os.path.join(example_proj.direc_out,
+                                        example_proj.name))
+    assert path == default_manifest_path(list(reversed(calcs)))
+    assert path != default_manifest_path(calcs[:1])
+
+
+def test_register(manifest, calcs):
+    assert manifest.entries == {}
+    manifest.register(calcs)
+    assert all(manifest.status(calc) == PENDING for calc in calcs)
+    with open(manifest.path) as f:
+        assert set(json.load(f)) == {calc_key(calc) for calc in calcs}
+
+
+def test_register_keeps_existing(manifest, calcs):
+    manifest.update(calcs[0], DONE)
+    manifest.register(calcs)
+    assert manifest.status(calcs[0]) == DONE
+    assert manifest.status(calcs[1]) == PENDING
+
+
+def test_mark_running_and_finished(manifest, calcs):
+    calc = calcs[0]
+    manifest.mark_running(calc)
+    entry = manifest.entries[calc_key(calc)]
+    assert entry['status'] == RUNNING
+    assert entry['attempts'] == 1
+    manifest.mark_finished(calc, entry['started'], traceback='Traceback')
+    entry = manifest.entries[calc_key(calc)]
+    assert entry['status'] == FAILED
+    assert entry['traceback'] == 'Traceback'
+    assert entry['failure'] == 'error'
+    assert entry['elapsed'] >= 0
+
+    manifest.mark_running(calc)
+    manifest.mark_finished(calc, entry['started'])
+    entry = manifest.entries[calc_key(calc)]
+    assert entry['status'] == DONE
+    assert entry['traceback'] is None
+    assert entry['failure'] is None
+    assert entry['attempts'] == 2
+
+
+def test_mark_running_concurrent(manifest, calcs):
+    # No attempt is lost when the same Calc is started concurrently.
+    calc = calcs[0]
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda _: manifest.mark_running(calc), range(20)))
+    assert manifest.entries[calc_key(calc)]['attempts'] == 20
+
+
+def test_update_invalid_status(manifest, calcs):
+    with pytest.raises(ValueError):
+        manifest.update(calcs[0], 'finished')
+
+
+def test_pending(manifest, calcs):
+    assert manifest.pending(calcs) == calcs
+    manifest.update(calcs[0], DONE)
+    manifest.update(calcs[1], RUNNING)
+    assert manifest.pending(calcs) == calcs[1:]
+
+
+def test_merge(manifest, calcs, tmpdir):
+    paths = [str(tmpdir.join('0.json')), str(tmpdir.join('1.json'))]
+    manifest.update(calcs[0], FAILED, started=1.)
+    Manifest(paths[0]).update(calcs[0], DONE, started=0.)
+    Manifest(paths[0]).update(calcs[1], FAILED, started=2.)
+    Manifest(paths[1]).update(calcs[1], RUNNING, started=3.)
+    manifest.merge(paths + [str(tmpdir.join('missing.json'))])
+    assert manifest.status(calcs[0]) == DONE
+    assert manifest.status(calcs[1]) == RUNNING
+    manifest.merge([paths[0]])
+    assert manifest.status(calcs[1]) == RUNNING
+
+
+def test_submit_mult_calcs_writes_manifest(suite_specs, calcs):
+    submit_mult_calcs(suite_specs, dict(write_to_tar=False))
+    manifest = Manifest(default_manifest_path(calcs))
+    assert all(manifest.status(calc) == DONE for calc in calcs)
+
+
+def test_submit_mult_calcs_resume(suite_specs, calcs, tmpdir):
+    path = str(tmpdir.join('manifest.json'))
+    Manifest(path).update(calcs[0], DONE)
+    result = submit_mult_calcs(suite_specs, dict(write_to_tar=False,
+                                                 manifest=path, resume=True))
+    assert len(result) == len(calcs) - 1
+    assert calc_key(result[0]) == calc_key(calcs[1])
+    assert submit_mult_calcs(suite_specs, dict(
+        write_to_tar=False, manifest=path, resume=True)) == []
+
+
+def test_submit_mult_calcs_resume_no_manifest(suite_specs):
+    with pytest.raises(AospyException):
+        submit_mult_calcs(suite_specs, dict(manifest=False, resume=True))
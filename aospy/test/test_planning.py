@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Test suite for aospy.planning module."""
+import json
+import os
+import shutil
+
+import pytest
+
+from aospy import scheduling
+from aospy.automate import CalcSuite, submit_mult_calcs
+from aospy.manifest import default_manifest_path
+from aospy.planning import (ExecutionPlan, plan_calcs, output_status,
+                            MISSING, STALE, CURRENT)
+from .data.objects import examples as lib
+from .data.objects.examples import (
+    example_proj, example_model, example_run, condensation_rain,
+    convection_rain
+)
+
+
+@pytest.fixture
+def suite_specs():
+    specs = dict(
+        library=lib,
+        projects=[example_proj],
+        models=[example_model],
+        runs=[example_run],
+        variables=[condensation_rain, convection_rain],
+        regions=[None],
+        date_ranges='default',
+        output_time_intervals=['ann'],
+        output_time_regional_reductions=['av', 'std'],
+        output_vertical_reductions=[None],
+        input_time_intervals=['monthly'],
+        input_time_datatypes=['ts'],
+        input_time_offsets=[None],
+        input_vertical_datatypes=[False],
+    )
+    yield specs
+    for direc in [example_proj.direc_out, example_proj.tar_direc_out]:
+        shutil.rmtree(direc, ignore_errors=True)
+
+
+@pytest.fixture
+def calcs(suite_specs):
+    return CalcSuite(suite_specs).create_calcs()
+
+
+def test_output_status(calcs):
+    calc = calcs[0]
+    files = scheduling.input_files(calc)
+    assert output_status(calc, files) == {'av': MISSING, 'std': MISSING}
+    calc.compute(write_to_tar=False)
+    assert output_status(calc, files) == {'av': CURRENT, 'std': CURRENT}
+    os.utime(calc.path_out['std'], (0, 0))
+    assert output_status(calc, files) == {'av': CURRENT, 'std': STALE}
+
+
+def test_plan_calcs(calcs):
+    plan = plan_calcs(calcs, n_workers=2)
+    assert isinstance(plan, ExecutionPlan)
+    assert len(plan) == 2
+    files = scheduling.input_files(calcs[0])
+    assert plan.unique_files == files
+    assert plan.unique_bytes == sum(os.path.getsize(f) for f in files)
+    assert plan.total_bytes == 2 * plan.unique_bytes
+    assert plan.shared_inputs == {path: [0, 1] for path in files}
+    assert (plan.n_outputs, plan.n_existing, plan.n_current) == (4, 0, 0)
+    assert plan.total_seconds == pytest.approx(
+        sum(scheduling.estimate_cost(calc)['seconds'] for calc in calcs))
+    assert plan.wall_seconds == pytest.approx(max(
+        entry['seconds'] for entry in plan.entries))
+    assert plan.concurrent_memory == pytest.approx(
+        sum(entry['memory'] for entry in plan.entries))
+    assert json.loads(json.dumps(plan.to_dict()))['n_calcs'] == 2
+    assert str(plan).startswith(
+        'Execution plan for 2 calculations on 2 workers:')
+
+
+def test_submit_mult_calcs_plan_only(suite_specs, calcs, capsys):
+    plan = submit_mult_calcs(suite_specs, dict(plan_only=True))
+    assert isinstance(plan, ExecutionPlan)
+    assert plan.n_workers == 1
+    assert 'Execution plan for 2 calculations' in capsys.readouterr()[0]
+    assert not any(os.path.exists(path) for calc in calcs
+                   for path in calc.path_out.values())
+    assert not os.path.exists(default_manifest_path(calcs))
+
+    submit_mult_calcs(suite_specs, dict(write_to_tar=False))
+    plan = submit_mult_calcs(suite_specs, dict(
+        plan_only=True, executor='processes', max_workers=3))
+    assert plan.n_workers == 3
+    assert (plan.n_outputs, plan.n_existing, plan.n_current) == (4, 4, 4)
@@ -1,3 +1,6 @@
+import os
+import pickle
+
 import numpy as np
 import pytest
 import xarray as xr
@@ -6,12 +9,17 @@ from aospy import Region
 from aospy.region import (
     _get_land_mask,
     BoundsRect,
+    WeightsCache,
+    regions_reduce,
+    stack_weights,
 )
 from aospy.internal_names import (
     LAT_STR,
     LON_STR,
+    REGION_STR,
     SFC_AREA_STR,
-    LAND_MASK_STR
+    LAND_MASK_STR,
+    YEAR_STR
 )
 from aospy.utils import Longitude
 
@@ -223,3 +231,109 @@ def test_ts_non_aospy_names(data_reg_alt_names):
     result = region_land_mask.ts(data_reg_alt_names, **_map_to_alt_names)
     expected = xr.DataArray(data_reg_alt_names.values[3, 0])
     xr.testing.assert_identical(result, expected)
+
+
+def test_weights(data_for_reg_calcs):
+    result = region_land_mask.weights(data_for_reg_calcs, cache=WeightsCache())
+    expected = np.zeros(data_for_reg_calcs.shape)
+    expected[1:, 0] = (data_for_reg_calcs.sfc_area.values[1:, 0] *
+                       data_for_reg_calcs.land_mask.values[1:, 0])
+    np.testing.assert_allclose(result.values, expected)
+    assert result.dims == (LAT_STR, LON_STR)
+
+
+def test_weights_cached(data_for_reg_calcs):
+    cache = WeightsCache()
+    first = region_land_mask.weights(data_for_reg_calcs, cache=cache)
+    region_no_land_mask.weights(data_for_reg_calcs, cache=cache)
+    assert len(cache) == 2
+    second = region_land_mask.weights(data_for_reg_calcs, cache=cache)
+    assert len(cache) == 2
+    assert second.values is first.values
+
+    # The land mask is part of the key of Regions that apply it.
+    other = data_for_reg_calcs.copy(deep=True)
+    other[LAND_MASK_STR].values[:] = 1.
+    region_land_mask.weights(other, cache=cache)
+    region_no_land_mask.weights(other, cache=cache)
+    assert len(cache) == 3
+
+
+def test_weights_cache_direc(data_for_reg_calcs, tmpdir):
+    direc = str(tmpdir.join('weights'))
+    expected = region_land_mask.weights(data_for_reg_calcs,
+                                        cache=WeightsCache(direc))
+    assert len(os.listdir(direc)) == 1
+
+    cache = WeightsCache(direc)
+    result = region_land_mask.weights(data_for_reg_calcs, cache=cache)
+    xr.testing.assert_identical(result, expected)
+    assert len(cache) == 1
+    assert len(os.listdir(direc)) == 1
+
+
+def test_weights_cache_pickle(data_for_reg_calcs, tmpdir):
+    cache = WeightsCache(str(tmpdir))
+    region_land_mask.weights(data_for_reg_calcs, cache=cache)
+    result = pickle.loads(pickle.dumps(cache))
+    assert result.direc == cache.direc
+    assert len(result) == 0
+    region_land_mask.weights(data_for_reg_calcs, cache=result)
+    assert len(result) == 1
+
+
+def test_ts_invalid_per_time(data_for_reg_calcs):
+    # Points that are invalid at one time only are excluded at that time.
+    data = xr.concat([data_for_reg_calcs, data_for_reg_calcs * 2.], dim='t')
+    data[1, 2, 0] = np.nan
+    result = region_no_land_mask.ts(data)
+    sfc_area = data_for_reg_calcs.sfc_area.values
+    values = data_for_reg_calcs.values
+    expected = [(values[2, 0] * sfc_area[2, 0] +
+                 values[3, 0] * sfc_area[3, 0]) /
+                (sfc_area[2, 0] + sfc_area[3, 0]), 2. * values[3, 0]]
+    np.testing.assert_allclose(result.values, expected)
+    assert result.dims == ('t',)
+
+
+region_ocean = Region(
+    name='ocean',
+    description='Test region with ocean mask',
+    west_bound=0.,
+    east_bound=20.,
+    south_bound=-20.,
+    north_bound=90.,
+    do_land_mask='ocean'
+)
+
+
+def test_stack_weights(data_for_reg_calcs):
+    regions = [region_no_land_mask, region_ocean]
+    result = stack_weights(regions, data_for_reg_calcs)
+    assert result.dims == (REGION_STR, LAT_STR, LON_STR)
+    assert list(result[REGION_STR].values) == ['test', 'ocean']
+    for i, region in enumerate(regions):
+        np.testing.assert_array_equal(
+            result.values[i], region.weights(data_for_reg_calcs).values)
+
+
+@pytest.mark.parametrize('func', ['ts', 'av', 'std'])
+def test_regions_reduce(data_for_reg_calcs, func):
+    data = xr.concat([data_for_reg_calcs, data_for_reg_calcs * 2.,
+                      data_for_reg_calcs - 1.], dim=YEAR_STR)
+    data[YEAR_STR] = [2000, 2001, 2002]
+    data[1, 3, 0] = np.nan
+    data[2, 2, 1] = np.nan
+    regions = [region_no_land_mask, region_ocean]
+    result = regions_reduce(regions, data, func)
+    assert result.dims[-1] == REGION_STR
+    for region in regions:
+        expected = getattr(region, func)(data)
+        xr.testing.assert_allclose(
+            result.sel(**{REGION_STR: region.name}).drop(REGION_STR),
+            expected)
+
+
+def test_regions_reduce_invalid_func(data_for_reg_calcs):
+    with pytest.raises(ValueError):
+        regions_reduce([region_no_land_mask], data_for_reg_calcs, 'max')
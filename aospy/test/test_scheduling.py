@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+"""Test suite for aospy.scheduling module."""
+import os
+
+import pytest
+import xarray as xr
+
+from aospy import scheduling
+from aospy.calc import Calc
+from .data.objects.examples import (
+    example_proj, example_model, example_run, condensation_rain, precip,
+    sphum, globe, sahel
+)
+
+
+def _calc(var=condensation_rain, **kwargs):
+    params = dict(proj=example_proj, model=example_model, run=example_run,
+                  var=var, date_range='default', intvl_in='monthly',
+                  intvl_out='ann', dtype_in_time='ts', dtype_out_time='av')
+    params.update(kwargs)
+    return Calc(**params)
+
+
+def test_input_files():
+    files = scheduling.input_files(_calc())
+    assert [os.path.basename(path) for path in files] == [
+        '00040101.precip_monthly.nc', '00050101.precip_monthly.nc',
+        '00060101.precip_monthly.nc']
+    # Composite Vars read the files of each of their constituent Vars.
+    assert scheduling.input_files(_calc(var=precip)) == files
+
+
+def test_estimate_cost():
+    calc = _calc()
+    cost = scheduling.estimate_cost(calc)
+    assert cost['files'] == scheduling.input_files(calc)
+    assert cost['bytes'] == sum(os.path.getsize(f) for f in cost['files'])
+    assert cost['seconds'] > 0
+
+    regional = _calc(dtype_out_time=['av', 'reg.av'], region=[globe, sahel])
+    assert (scheduling.estimate_cost(regional)['seconds'] >
+            cost['seconds'])
+
+    vertical = _calc(var=sphum, date_range=('0006', '0006'),
+                     dtype_in_vert='sigma', dtype_out_vert='vert_int')
+    vertical_cost = scheduling.estimate_cost(vertical)
+    assert len(vertical_cost['files']) == 1
+    assert (vertical_cost['seconds'] - scheduling._OVERHEAD_SECONDS >
+            (vertical_cost['bytes'] / scheduling._BYTES_PER_SECOND))
+
+
+def test_estimate_cost_missing_files(monkeypatch):
+    calc = _calc(intvl_in='daily')
+    monkeypatch.setattr(scheduling, 'input_files', lambda calc: [])
+    cost = scheduling.estimate_cost(calc)
+    assert cost['bytes'] == (3 * 365 *
+                             scheduling._NOMINAL_BYTES_PER_TIMESTEP)
+
+
+_COSTS = [dict(seconds=s, bytes=0) for s in [1., 5., 2., 5., 4.]]
+
+
+def test_longest_first():
+    assert scheduling.longest_first(_COSTS) == [1, 3, 4, 2, 0]
+
+
+@pytest.mark.parametrize(
+    ('n_workers', 'expected'),
+    [(1, [[1, 3, 4, 2, 0]]),
+     (2, [[1, 4], [3, 2, 0]]),
+     (8, [[1], [3], [4], [2], [0], [], [], []])])
+def test_pack_longest_first(n_workers, expected):
+    assert scheduling.pack_longest_first(_COSTS, n_workers) == expected
+
+
+def test_partition_by_inputs():
+    shared = [_calc(), _calc(dtype_out_time='std'),
+              _calc(var=precip, dtype_out_time='reg.av', region=[globe])]
+    other = _calc(var=sphum, date_range=('0006', '0006'),
+                  dtype_in_vert='sigma')
+    calcs = shared + [other]
+    costs = [scheduling.estimate_cost(calc) for calc in calcs]
+    partitions = scheduling.partition_by_inputs(calcs, costs)
+    assert sorted(map(sorted, partitions)) == [[0, 1, 2], [3]]
+    # The Calcs of each partition are ordered longest first.
+    assert [p for p in partitions if 3 not in p][0][0] == 2
+
+    # Calcs whose input files are unknown are not grouped.
+    unknown = [dict(c, files=[]) for c in costs[:2]]
+    assert sorted(map(sorted, scheduling.partition_by_inputs(
+        calcs[:2], unknown))) == [[0], [1]]
+
+
+def test_partition_by_inputs_splits():
+    calcs = [_calc() for _ in range(4)]
+    costs = [dict(files=['a.nc'], bytes=0, seconds=s)
+             for s in [4., 3., 2., 1.]]
+    assert scheduling.partition_by_inputs(calcs, costs, 1) == [[0, 1, 2, 3]]
+    assert (scheduling.partition_by_inputs(calcs, costs, 2) ==
+            [[1, 2], [0], [3]])
+    assert (scheduling.partition_by_inputs(calcs, costs, 4) ==
+            [[0], [1], [2], [3]])
+
+
+def test_estimate_memory():
+    calc = _calc()
+    nbytes = 0
+    for path in scheduling.input_files(calc):
+        with xr.open_dataset(path) as ds:
+            nbytes += ds[condensation_rain.name].nbytes
+    assert scheduling._input_nbytes(calc) == nbytes
+    assert (scheduling.estimate_memory(calc) ==
+            scheduling._PEAK_FACTOR * nbytes)
+
+    regional = _calc(dtype_out_time=['av', 'reg.av'], region=[globe, sahel])
+    assert (scheduling.estimate_memory(regional) >
+            scheduling.estimate_memory(calc))
+
+
+def test_estimate_memory_missing_files(monkeypatch):
+    calc = _calc(intvl_in='daily')
+    monkeypatch.setattr(scheduling, '_input_nbytes', lambda calc: 0)
+    assert scheduling.estimate_memory(calc) == (
+        scheduling._PEAK_FACTOR * 3 * 365 *
+        scheduling._NOMINAL_BYTES_PER_TIMESTEP)
+
+
+def test_memory_model():
+    model = scheduling.MemoryModel()
+    calc, other = _calc(), _calc(var=precip)
+    assert model.calibrate(calc, 100.) == 100.
+    model.record([calc], 100., 300.)
+    assert model.calibrate(calc, 10.) == 30.
+    # Kinds of Calcs without measurements use the largest recorded ratio.
+    model.record([other], 100., 50.)
+    assert model.calibrate(other, 10.) == 5.
+    assert model.calibrate(_calc(intvl_in='daily'), 10.) == 30.
+
+
+def test_memory_model_version():
+    model = scheduling.MemoryModel()
+    calc = _calc()
+    model.record([calc], 100., 300.)
+    assert model.version == 1
+    # Small changes in the ratio of a known kind do not change the version.
+    model.record([calc], 100., 310.)
+    assert model.version == 1
+    assert model.calibrate(calc, 10.) == 31.
+    model.record([calc], 100., 400.)
+    assert model.version == 2
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    calcs = [_calc(), _calc(dtype_out_time='std'), _calc(var=precip)]
+    estimates = {id(calc): nbytes for calc, nbytes in zip(calcs, [4, 3, 2])}
+    monkeypatch.setattr(scheduling, 'estimate_memory',
+                        lambda calc: estimates[id(calc)])
+    tasks = [[calcs[0]], [calcs[1]], [calcs[2]]]
+    return scheduling.AdmissionController(6, tasks,
+                                          model=scheduling.MemoryModel())
+
+
+def test_admission_controller(admission):
+    assert admission.estimate(0) == 4
+    assert admission.admit(0)
+    assert not admission.admit(1)
+    assert admission.admit(2)
+    assert admission.in_use == 6
+    admission.release(0)
+    assert admission.admit(1)
+    assert admission.in_use == 5
+    # A task exceeding the budget is only admitted if forced.
+    assert not admission.admit(0)
+    assert admission.admit(0, force=True)
+    assert admission.in_use == 9
+
+
+def test_admission_controller_feedback(admission):
+    assert admission.admit(1)
+    admission.release(1, peak=6)
+    # Calcs of the same kind as the measured one are estimated at twice the
+    # size; the others use the same (largest recorded) ratio.
+    assert admission.estimate(0) == 8
+    assert admission.estimate(2) == 4
+    assert not admission.admit(0)
+    assert admission.admit(0, force=True)
+
+
+def test_admission_controller_waiting(admission):
+    waiting = admission.waiting(range(3))
+    assert len(waiting) == 3
+    # The largest task that fits is admitted first.
+    assert waiting.pop() == 0
+    assert waiting.pop() == 2
+    assert waiting.pop() is None
+    assert waiting.pop(force=True) == 1
+    assert len(waiting) == 0
+    assert admission.in_use == 9
+    assert waiting.pop(force=True) is None
+
+
+def test_admission_controller_waiting_resorts(admission):
+    waiting = admission.waiting(range(3))
+    assert waiting.pop() == 0
+    admission.release(0, peak=12)
+    # Tasks 1 and 2 are now estimated at 9 and 6, so only task 2 fits.
+    assert waiting.pop() == 2
+    assert waiting.pop() is None
+    assert waiting.pop(force=True) == 1
+
+
+def test_admission_controller_max_concurrency(admission):
+    assert admission.max_concurrency(8) == 1
+    admission.budget = 7
+    assert admission.max_concurrency(8) == 2
+    assert admission.max_concurrency(1) == 1
+    admission.budget = 1
+    assert admission.max_concurrency(8) == 1
+    admission.budget = 100
+    assert admission.max_concurrency(8) == 3
+
+
+def test_format_schedule():
+    calcs = ['calc{}'.format(i) for i in range(len(_COSTS))]
+    report = scheduling.format_schedule(calcs, _COSTS, 2)
+    lines = report.splitlines()
+    assert '17.0 s in total, 9.0 s wall-clock' in lines[0]
+    assert [line.split()[-1] for line in lines[1:]] == [
+        'calc1', 'calc3', 'calc4', 'calc2', 'calc0']
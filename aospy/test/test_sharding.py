@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Test suite for aospy.sharding module."""
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+
+import pytest
+
+from aospy import scheduling, sharding
+from aospy.automate import CalcSuite, merge_shards, submit_mult_calcs
+from aospy.manifest import DONE, Manifest, calc_key, default_manifest_path
+from .data.objects import examples as lib
+from .data.objects.examples import (
+    example_proj, example_model, example_run, condensation_rain,
+    convection_rain, precip, globe, sahel
+)
+
+
+@pytest.fixture
+def suite_specs():
+    specs = dict(
+        library=lib,
+        projects=[example_proj],
+        models=[example_model],
+        runs=[example_run],
+        variables=[condensation_rain, convection_rain, precip],
+        regions=[globe, sahel],
+        date_ranges='default',
+        output_time_intervals=['ann', 'jja'],
+        output_time_regional_reductions=['av'],
+        output_vertical_reductions=[None],
+        input_time_intervals=['monthly'],
+        input_time_datatypes=['ts'],
+        input_time_offsets=[None],
+        input_vertical_datatypes=[False],
+    )
+    yield specs
+    for direc in [example_proj.direc_out, example_proj.tar_direc_out]:
+        shutil.rmtree(direc, ignore_errors=True)
+
+
+@pytest.fixture
+def calcs(suite_specs):
+    return CalcSuite(suite_specs).create_calcs()
+
+
+@pytest.mark.parametrize(('shard', 'expected'), [
+    ('0/1', (0, 1)), ('3/4', (3, 4)), ((1, 2), (1, 2))])
+def test_parse_shard(shard, expected):
+    assert sharding.parse_shard(shard) == expected
+
+
+@pytest.mark.parametrize('shard', ['4/4', '-1/2', '1', 'a/b', None, (1,)])
+def test_parse_shard_invalid(shard):
+    with pytest.raises(ValueError):
+        sharding.parse_shard(shard)
+
+
+def test_shard_paths(tmpdir):
+    path = str(tmpdir.join('data.tar'))
+    assert sharding.shard_path(path, '1/4') == str(
+        tmpdir.join('data.shard-1-of-4.tar'))
+    assert sharding.shard_paths(path) == []
+    for shard in ['1/2', '0/2']:
+        tmpdir.join(os.path.basename(sharding.shard_path(path,
+                                                         shard))).write('')
+    tmpdir.join('data.shard-0-of-2.tar.index.json').write('')
+    tmpdir.join('other.shard-0-of-2.tar').write('')
+    assert sharding.shard_paths(path) == [
+        str(tmpdir.join('data.shard-0-of-2.tar')),
+        str(tmpdir.join('data.shard-1-of-2.tar'))]
+
+
+def test_stable_hash():
+    assert sharding.stable_hash('a') == sharding.stable_hash('a')
+    assert sharding.stable_hash('a') != sharding.stable_hash('b')
+
+
+@pytest.mark.parametrize('balance', [True, False])
+def test_assign_shards(calcs, balance):
+    shards = sharding.assign_shards(calcs, 3, balance=balance)
+    assert set(shards) <= {0, 1, 2}
+    reversed_shards = sharding.assign_shards(calcs[::-1], 3, balance=balance)
+    assert reversed_shards[::-1] == shards
+    selected = [sharding.select_shard(calcs, (i, 3), balance=balance)
+                for i in range(3)]
+    assert sorted(calc_key(calc) for shard in selected for calc in shard) == (
+        sorted(calc_key(calc) for calc in calcs))
+
+
+def test_assign_shards_balanced(calcs):
+    shards = sharding.assign_shards(calcs, 4)
+    costs = [scheduling.estimate_cost(calc)['seconds'] for calc in calcs]
+    loads = [sum(cost for cost, i in zip(costs, shards) if i == shard)
+             for shard in range(4)]
+    assert max(loads) - min(loads) <= max(costs)
+
+
+def test_assign_shards_lazy(suite_specs, calcs):
+    specs = CalcSuite(suite_specs).create_calcs(lazy=True)
+    shards = sharding.assign_shards(specs, 2)
+    assert shards == [sharding.stable_hash(spec.key) % 2 for spec in specs]
+
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+_ASSIGN_CODE = """
+from aospy import sharding
+from aospy.automate import CalcSuite
+from aospy.manifest import default_manifest_path
+from aospy.test.data.objects import examples as lib
+suite_specs = dict(
+    library=lib, projects=[lib.example_proj], models=[lib.example_model],
+    runs=[lib.example_run], variables=[lib.condensation_rain,
+                                       lib.convection_rain, lib.precip],
+    regions=[lib.globe, lib.sahel], date_ranges='default',
+    output_time_intervals=['ann', 'jja'],
+    output_time_regional_reductions=['av', 'reg.av'],
+    output_vertical_reductions=[None], input_time_intervals=['monthly'],
+    input_time_datatypes=['ts'], input_time_offsets=[None],
+    input_vertical_datatypes=[False])
+specs = CalcSuite(suite_specs).create_calcs(lazy=True)
+print(default_manifest_path(specs, key=lambda spec: spec.key))
+for spec, shard in zip(specs, sharding.assign_shards(specs, 3)):
+    print(spec.key, shard)
+"""
+
+
+def test_assign_shards_lazy_stable_across_processes():
+    outputs = []
+    for seed in [1, 2]:
+        output = subprocess.check_output(
+            [sys.executable, '-W', 'ignore', '-c', _ASSIGN_CODE],
+            env=dict(os.environ, PYTHONPATH=_ROOT, PYTHONHASHSEED=str(seed)))
+        manifest_path, *assignment = output.decode().splitlines()
+        outputs.append((manifest_path, sorted(assignment)))
+    assert outputs[0] == outputs[1]
+    assert len(outputs[0][1]) == 6
+
+
+@pytest.mark.parametrize('exec_options', [
+    dict(), dict(lazy=True, shard_balance=False)])
+def test_submit_mult_calcs_shards(suite_specs, calcs, exec_options):
+    results = []
+    for shard in ['0/2', '1/2']:
+        options = dict(exec_options, shard=shard)
+        results.extend(submit_mult_calcs(suite_specs, options))
+    assert sorted(calc_key(calc) for calc in results) == sorted(
+        calc_key(calc) for calc in calcs)
+    tar_path = calcs[0].path_tar_out
+    assert not os.path.exists(tar_path)
+    assert len(sharding.shard_paths(tar_path)) == 2
+
+    merged = merge_shards(suite_specs, exec_options)
+    if exec_options.get('lazy'):
+        specs = CalcSuite(suite_specs).create_calcs(lazy=True)
+        path = default_manifest_path(specs, key=lambda spec: spec.key)
+    else:
+        path = default_manifest_path(calcs)
+    assert merged == [path, tar_path]
+    manifest = Manifest(path)
+    assert all(manifest.status(calc) == DONE for calc in calcs)
+    assert sharding.shard_paths(tar_path) == []
+    with tarfile.open(tar_path) as tar:
+        names = set(tar.getnames())
+    assert names == {name for calc in calcs for name in calc._tar_members()}
+    assert merge_shards(suite_specs, exec_options) == [path]
+
+
+def test_submit_mult_calcs_shard_invalid(suite_specs):
+    with pytest.raises(ValueError):
+        submit_mult_calcs(suite_specs, dict(shard='2/2'))
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""Test suite for aospy.specs module."""
+import os
+import pickle
+import subprocess
+import sys
+
+import cloudpickle
+
+import pytest
+
+from aospy import Var, specs
+from aospy.automate import CalcSuite
+from aospy.calc import Calc
+from aospy.specs import CalcSpecs, materialize
+from .data.objects import examples as lib
+from .data.objects.examples import (
+    example_proj, example_model, example_run, var_not_time_defined,
+    condensation_rain, convection_rain, precip, globe, sahel
+)
+
+
+@pytest.fixture
+def suite_specs():
+    return dict(
+        library=lib,
+        projects=[example_proj],
+        models=[example_model],
+        runs=[example_run],
+        variables=[condensation_rain, convection_rain, precip],
+        regions=[None],
+        date_ranges='default',
+        output_time_intervals=['ann', 'jja'],
+        output_time_regional_reductions=['av', 'ts'],
+        output_vertical_reductions=[None],
+        input_time_intervals=['monthly'],
+        input_time_datatypes=['ts'],
+        input_time_offsets=[None],
+        input_vertical_datatypes=[False],
+    )
+
+
+def test_create_calcs_lazy(suite_specs):
+    suite = CalcSuite(suite_specs)
+    calc_specs = suite.create_calcs(lazy=True)
+    calcs = suite.create_calcs()
+    assert isinstance(calc_specs, CalcSpecs)
+    assert len(calc_specs) == len(calcs) == 6
+    materialized = calc_specs.materialize()
+    assert all(isinstance(calc, Calc) for calc in materialized)
+    assert ([(str(calc), calc.path_out) for calc in materialized] ==
+            [(str(calc), calc.path_out) for calc in calcs])
+
+
+def test_calc_specs_do_not_create_calcs(suite_specs, monkeypatch):
+    def fail(**kwargs):
+        raise AssertionError('Calc created')
+    monkeypatch.setattr(specs, 'Calc', fail)
+    calc_specs = CalcSuite(suite_specs).create_calcs(lazy=True)
+    assert len(calc_specs) == 6
+    assert len(calc_specs.filter(var=precip)) == 2
+    assert len(calc_specs.filter(var=[precip, convection_rain],
+                                 intvl_out='jja')) == 2
+    assert len(calc_specs.filter(lambda spec: spec.var is precip,
+                                 intvl_out='ann')) == 1
+    assert len(calc_specs[2:5]) == 3
+    assert calc_specs[-1].run is example_run
+    with pytest.raises(AssertionError):
+        calc_specs[0].materialize()
+
+
+def test_calc_specs_prune_time_reductions(suite_specs):
+    suite_specs['variables'] = [var_not_time_defined]
+    calc_specs = CalcSuite(suite_specs).create_calcs(lazy=True)
+    assert [spec.dtype_out_time for spec in calc_specs] == [[], []]
+
+
+def test_calc_spec(suite_specs):
+    calc_specs = CalcSuite(suite_specs).create_calcs(lazy=True)
+    spec = calc_specs[0]
+    assert spec.proj is example_proj
+    assert spec.intvl_in == 'monthly'
+    with pytest.raises(AttributeError):
+        spec.not_a_param
+    assert str(spec) == str(spec.materialize()).replace('Calc', 'CalcSpec')
+    assert spec.key == calc_specs[0].key != calc_specs[1].key
+    assert cloudpickle.loads(cloudpickle.dumps(spec)).key == spec.key
+    assert isinstance(materialize(spec), Calc)
+    calc = spec.materialize()
+    assert materialize(calc) is calc
+
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+_KEYS_CODE = """
+from aospy.automate import CalcSuite
+from aospy.test.data.objects import examples as lib
+suite_specs = dict(
+    library=lib, projects=[lib.example_proj], models=[lib.example_model],
+    runs=[lib.example_run], variables=[lib.condensation_rain, lib.precip],
+    regions='all', date_ranges='default', output_time_intervals=['ann'],
+    output_time_regional_reductions=['av', 'reg.av'],
+    output_vertical_reductions=[None], input_time_intervals=['monthly'],
+    input_time_datatypes=['ts'], input_time_offsets=[None],
+    input_vertical_datatypes=[False])
+for spec in CalcSuite(suite_specs).create_calcs(lazy=True):
+    print(spec.key)
+"""
+
+
+def test_calc_spec_key_stable_across_processes():
+    keys = [sorted(subprocess.check_output(
+        [sys.executable, '-W', 'ignore', '-c', _KEYS_CODE],
+        env=dict(os.environ, PYTHONPATH=_ROOT, PYTHONHASHSEED=str(seed))
+    ).decode().split()) for seed in [1, 2]]
+    assert keys[0] == keys[1]
+    assert len(keys[0]) == 2
+    assert all('/region=globe,sahel/' in key for key in keys[0])
+
+
+def test_object_library():
+    obj_lib = specs.ObjectLibrary(lib)
+    assert obj_lib.name == lib.__name__
+    assert obj_lib.find('proj', 'example_proj') is example_proj
+    assert obj_lib.find('model', 'example_model') is example_model
+    assert obj_lib.find('var', 'total_precipitation') is precip
+    with pytest.raises(KeyError):
+        obj_lib.find('var', 'not_a_var')
+    assert specs.worker_library(lib.__name__) is specs.worker_library(
+        lib.__name__)
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_compact(suite_specs, lazy):
+    suite_specs['regions'] = [globe, sahel]
+    calc = CalcSuite(suite_specs).create_calcs(lazy=lazy)[0]
+    obj_lib = specs.ObjectLibrary(lib)
+    spec = specs.compact(calc, obj_lib)
+    assert isinstance(spec, specs.CompactCalcSpec)
+    assert specs.compact(spec, obj_lib) is spec
+    assert spec.library == lib.__name__
+    assert spec.var == specs.Reference(calc.var.name)
+    assert spec.run == specs.Reference('example_run')
+    assert spec.region == {specs.Reference('globe'),
+                           specs.Reference('sahel')}
+    assert len(pickle.dumps(spec)) < 2000
+    assert str(spec) == str(materialize(calc)).replace('Calc',
+                                                       'CompactCalcSpec')
+
+    result = pickle.loads(pickle.dumps(spec)).materialize()
+    assert result.var is calc.var
+    assert result.region == {globe, sahel}
+    assert result.path_out == materialize(calc).path_out
+
+
+def test_compact_embeds_objects_not_in_library(suite_specs):
+    var = Var(name='not_in_library', def_time=True)
+    suite_specs['variables'] = [var]
+    calc = CalcSuite(suite_specs).create_calcs(lazy=True)[0]
+    spec = specs.compact(calc, specs.ObjectLibrary(lib))
+    assert spec.var is var
+    assert spec.proj == specs.Reference('example_proj')
+    assert spec.materialize().var is var
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""Test suite for aospy.utils.archive module."""
+import json
+import os
+import tarfile
+
+import pytest
+
+from aospy.utils import archive
+
+
+@pytest.fixture
+def source_files(tmpdir):
+    paths = {}
+    for name, content in [('a.nc', b'aaaa'), ('b.nc', b'bbbbbbbb'),
+                          ('c.nc', b'c')]:
+        path = tmpdir.join('src', name)
+        path.write_binary(content, ensure=True)
+        paths[name] = str(path)
+    return paths
+
+
+@pytest.fixture
+def tar_path(tmpdir):
+    return str(tmpdir.join('out', 'data.tar'))
+
+
+def _read_members(tar_path):
+    with tarfile.open(tar_path, 'r') as tar:
+        return {info.name: tar.extractfile(info).read() for info in tar}
+
+
+def test_add_to_tar_new_archive(source_files, tar_path):
+    os.makedirs(os.path.dirname(tar_path))
+    archive.add_to_tar(tar_path, {'a.nc': source_files['a.nc'],
+                                  'b.nc': source_files['b.nc']})
+    assert _read_members(tar_path) == {'a.nc': b'aaaa', 'b.nc': b'bbbbbbbb'}
+
+
+def test_add_to_tar_replaces_members(source_files, tar_path, tmpdir):
+    os.makedirs(os.path.dirname(tar_path))
+    archive.add_to_tar(tar_path, {'a.nc': source_files['a.nc'],
+                                  'b.nc': source_files['b.nc']})
+    archive.add_to_tar(tar_path, {'a.nc': source_files['c.nc']})
+    with tarfile.open(tar_path, 'r') as tar:
+        assert sorted(tar.getnames()) == ['a.nc', 'b.nc']
+    assert _read_members(tar_path) == {'a.nc': b'c', 'b.nc': b'bbbbbbbb'}
+    assert sorted(os.listdir(os.path.dirname(tar_path))) == [
+        '.aospy_locks', 'data.tar', 'data.tar.index.json']
+
+
+def test_tar_index(source_files, tar_path):
+    os.makedirs(os.path.dirname(tar_path))
+    archive.add_to_tar(tar_path, {name: path for name, path
+                                  in source_files.items()})
+    with open(archive.index_path(tar_path)) as f:
+        index = json.load(f)
+    assert index['size'] == os.path.getsize(tar_path)
+    assert index['members'] == archive.build_tar_index(tar_path)
+    with open(tar_path, 'rb') as f:
+        for name, (offset, size) in index['members'].items():
+            f.seek(offset)
+            with open(source_files[name], 'rb') as src:
+                assert f.read(size) == src.read()
+
+
+def test_read_tar_members(source_files, tar_path):
+    os.makedirs(os.path.dirname(tar_path))
+    archive.add_to_tar(tar_path, {name: path for name, path
+                                  in source_files.items()})
+    assert archive.read_tar_members(tar_path, ['a.nc', 'c.nc']) == {
+        'a.nc': b'aaaa', 'c.nc': b'c'}
+    with pytest.raises(KeyError):
+        archive.read_tar_members(tar_path, ['d.nc'])
+
+
+def test_read_tar_index_rebuilds_stale(source_files, tar_path):
+    os.makedirs(os.path.dirname(tar_path))
+    archive.add_to_tar(tar_path, {'a.nc': source_files['a.nc']})
+    with tarfile.open(tar_path, 'a') as tar:
+        tar.add(source_files['b.nc'], arcname='b.nc')
+    index = archive.read_tar_index(tar_path)
+    assert sorted(index) == ['a.nc', 'b.nc']
+    with open(archive.index_path(tar_path)) as f:
+        assert sorted(json.load(f)['members']) == ['a.nc', 'b.nc']
+    assert archive.read_tar_members(tar_path, ['b.nc']) == {
+        'b.nc': b'bbbbbbbb'}
+
+    os.remove(archive.index_path(tar_path))
+    assert archive.read_tar_index(tar_path) == index
+
+
+def test_merge_tars(source_files, tmpdir, tar_path):
+    os.makedirs(os.path.dirname(tar_path))
+    archive.add_to_tar(tar_path, {'a.nc': source_files['a.nc']})
+    sources = [str(tmpdir.join('out', name)) for name in ['0.tar', '1.tar']]
+    archive.add_to_tar(sources[0], {'a.nc': source_files['b.nc'],
+                                    'b.nc': source_files['b.nc']})
+    archive.add_to_tar(sources[1], {'b.nc': source_files['c.nc'],
+                                    'c.nc': source_files['c.nc']})
+    archive.merge_tars(tar_path, sources)
+    with tarfile.open(tar_path, 'r') as tar:
+        assert sorted(tar.getnames()) == ['a.nc', 'b.nc', 'c.nc']
+    assert _read_members(tar_path) == {'a.nc': b'bbbbbbbb', 'b.nc': b'c',
+                                       'c.nc': b'c'}
+    assert archive.read_tar_index(tar_path) == archive.build_tar_index(
+        tar_path)
@@ -1,9 +1,19 @@
 #!/usr/bin/env python
 """Test suite for aospy.io module."""
+import os
+import pickle
 import sys
+import threading
+import time
 import unittest
 
+import dask
+import numpy as np
+import pytest
+import xarray as xr
+
 import aospy.utils.io as io
+from aospy.internal_names import LAT_STR, LON_STR, YEAR_STR
 
 
 class AospyIOTestCase(unittest.TestCase):
@@ -25,5 +35,209 @@ class TestIO(AospyIOTestCase):
                  '00010101.atmos_month.nc')
 
 
+@pytest.fixture
+def ds_for_encoding():
+    arr = xr.DataArray(np.zeros((5, 40, 10)), dims=[YEAR_STR, LAT_STR,
+                                                    LON_STR])
+    return xr.Dataset({'a': arr, 'b': xr.DataArray(1.)})
+
+
+def test_netcdf_encoding_default(ds_for_encoding):
+    assert io.netcdf_encoding(ds_for_encoding) == {}
+
+
+@pytest.mark.parametrize(
+    ('chunking', 'expected'),
+    [(None, None),
+     ('time', (5, 16, 10)),
+     ('map', (1, 40, 10)),
+     ({LAT_STR: 8, 'nonexistent': 3}, (5, 8, 10))])
+def test_netcdf_encoding_netcdf4(ds_for_encoding, chunking, expected):
+    encoding = io.netcdf_encoding(ds_for_encoding, 'NETCDF4', zlib=True,
+                                  complevel=2, shuffle=True,
+                                  chunking=chunking,
+                                  least_significant_digit=3)
+    assert encoding['a'].pop('chunksizes', None) == expected
+    assert encoding['a'] == dict(zlib=True, complevel=2, shuffle=True,
+                                 least_significant_digit=3)
+    assert 'chunksizes' not in encoding['b']
+
+
+def test_netcdf_encoding_invalid(ds_for_encoding):
+    with pytest.raises(ValueError):
+        io.netcdf_encoding(ds_for_encoding, 'NETCDF3_64BIT', zlib=True)
+    with pytest.raises(ValueError):
+        io.netcdf_encoding(ds_for_encoding, 'NETCDF4', chunking='years')
+
+
+def test_zarr_encoding(ds_for_encoding):
+    numcodecs = pytest.importorskip('numcodecs')
+    assert io.zarr_encoding(ds_for_encoding) == {}
+    encoding = io.zarr_encoding(ds_for_encoding, chunking='map', zlib=True,
+                                complevel=2, least_significant_digit=3)
+    assert encoding['a']['chunks'] == (1, 40, 10)
+    assert encoding['a']['compressor'] == numcodecs.Zlib(level=2)
+    assert encoding['a']['filters'] == [numcodecs.Quantize(3, 'float64')]
+    assert 'chunks' not in encoding['b']
+
+
+@pytest.fixture
+def reg_ds():
+    return xr.Dataset({'globe': (YEAR_STR, np.ones(3))},
+                      coords={YEAR_STR: [4, 5, 6]})
+
+
+def test_upsert_to_netcdf_new_file(reg_ds, tmpdir):
+    path = str(tmpdir.join('reg.nc'))
+    io.upsert_to_netcdf(reg_ds, path)
+    with xr.open_dataset(path) as result:
+        xr.testing.assert_identical(result.load(), reg_ds)
+
+
+def test_upsert_to_netcdf_in_place(reg_ds, tmpdir):
+    path = str(tmpdir.join('reg.nc'))
+    reg_ds.to_netcdf(path)
+    new = xr.Dataset({'sahel': (YEAR_STR, 2 * np.ones(3)),
+                      'globe': (YEAR_STR, 3 * np.ones(3))},
+                     coords={YEAR_STR: [4, 5, 6]})
+    io.upsert_to_netcdf(new[['sahel']], path)
+    io.upsert_to_netcdf(new[['globe']], path)
+    with xr.open_dataset(path) as result:
+        xr.testing.assert_equal(result.load(), new)
+
+
+def test_upsert_to_netcdf_rewrite(reg_ds, tmpdir):
+    path = str(tmpdir.join('reg.nc'))
+    reg_ds.to_netcdf(path)
+    # Changing the dimensions of an existing variable requires a rewrite.
+    new = xr.Dataset({'globe': ((YEAR_STR, 'bounds'), np.ones((3, 2))),
+                      'sahel': (YEAR_STR, np.zeros(3))},
+                     coords={YEAR_STR: [4, 5, 6]})
+    io.upsert_to_netcdf(new[['sahel']], path)
+    io.upsert_to_netcdf(new[['globe']], path)
+    with xr.open_dataset(path) as result:
+        xr.testing.assert_equal(result.load(), new)
+    assert os.listdir(str(tmpdir)) == ['reg.nc']
+
+
+def test_upsert_to_netcdf_corrupt_file(reg_ds, tmpdir):
+    path = str(tmpdir.join('reg.nc'))
+    with open(path, 'w') as f:
+        f.write('not a netCDF file')
+    # The file, which may hold other outputs, is not replaced.
+    with pytest.raises(IOError):
+        io.upsert_to_netcdf(reg_ds, path)
+    with open(path) as f:
+        assert f.read() == 'not a netCDF file'
+    assert os.listdir(str(tmpdir)) == ['reg.nc']
+
+
+def test_upsert_to_netcdf_failed_write(reg_ds, tmpdir, monkeypatch):
+    # A write that fails partway leaves the existing file as it was.
+    path = str(tmpdir.join('reg.nc'))
+    reg_ds.to_netcdf(path)
+    new = xr.Dataset({'sahel': (YEAR_STR, 2 * np.ones(3))},
+                     coords={YEAR_STR: [4, 5, 6]})
+
+    def fail(self, path, *args, **kwargs):
+        with open(path, 'ab') as f:
+            f.write(b'partial')
+        raise KeyboardInterrupt
+    monkeypatch.setattr(xr.Dataset, 'to_netcdf', fail)
+    with pytest.raises(KeyboardInterrupt):
+        io.upsert_to_netcdf(new, path)
+    monkeypatch.undo()
+    with xr.open_dataset(path) as result:
+        xr.testing.assert_identical(result.load(), reg_ds)
+    assert os.listdir(str(tmpdir)) == ['reg.nc']
+
+
+def test_upsert_to_netcdf_group(reg_ds, tmpdir):
+    path = str(tmpdir.join('store.nc'))
+    other = reg_ds.rename({'globe': 'other'})
+    io.upsert_to_netcdf(other, path, group='a/b', format='NETCDF4')
+    io.upsert_to_netcdf(reg_ds, path, group='a/c', format='NETCDF4')
+    assert io.netcdf_groups(path) == ['a/b', 'a/c']
+
+    # Rewriting one group preserves the others.
+    new = xr.Dataset({'globe': ((YEAR_STR, 'bounds'), np.ones((3, 2)))},
+                     coords={YEAR_STR: [4, 5, 6]})
+    io.upsert_to_netcdf(new, path, group='a/c', format='NETCDF4')
+    assert io.netcdf_groups(path) == ['a/b', 'a/c']
+    xr.testing.assert_equal(io.load_netcdf(path, group='a/b'), other)
+    xr.testing.assert_equal(io.load_netcdf(path, group='a/c'), new)
+    assert sorted(os.listdir(str(tmpdir))) == ['store.nc']
+
+
+def test_atomic_to_netcdf_cleans_up(reg_ds, tmpdir):
+    path = str(tmpdir.join('reg.nc'))
+    with pytest.raises(ValueError):
+        io.atomic_to_netcdf(reg_ds, path, format='not-a-format')
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_path_lock(tmpdir):
+    path = str(tmpdir.join('subdir', 'counter'))
+    with io.path_lock(path):
+        with open(path, 'w') as f:
+            f.write('0')
+
+    def increment():
+        with io.path_lock(path):
+            with open(path) as f:
+                value = int(f.read())
+            time.sleep(0.01)
+            with open(path, 'w') as f:
+                f.write(str(value + 1))
+
+    threads = [threading.Thread(target=increment) for _ in range(5)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    with open(path) as f:
+        assert f.read() == '5'
+    # The lock file is kept out of the way of the locked path.
+    assert sorted(os.listdir(str(tmpdir.join('subdir')))) == [
+        '.aospy_locks', 'counter']
+    assert os.path.isfile(io.lock_path(path))
+
+
+@pytest.mark.parametrize('output_format', ['NETCDF3_64BIT', 'NETCDF4'])
+def test_load_netcdf_and_dataset_from_bytes(reg_ds, tmpdir, output_format):
+    path = str(tmpdir.join('reg.nc'))
+    reg_ds.to_netcdf(path, format=output_format)
+    xr.testing.assert_identical(io.load_netcdf(path), reg_ds)
+    with open(path, 'rb') as f:
+        data = f.read()
+    xr.testing.assert_identical(io.dataset_from_bytes(data), reg_ds)
+
+
 if __name__ == '__main__':
     sys.exit(unittest.main())
+
+
+def test_serializable_rlock():
+    lock = io.SerializableRLock()
+    unpickled = pickle.loads(pickle.dumps(lock))
+    assert unpickled.lock is lock.lock
+    assert io.SerializableRLock().lock is not lock.lock
+    with lock:
+        with unpickled:
+            acquired = []
+            thread = threading.Thread(
+                target=lambda: acquired.append(lock.acquire(blocking=False)))
+            thread.start()
+            thread.join()
+            assert acquired == [False]
+
+
+def test_synchronous_dask_interleaved():
+    # Contexts entered by different threads may exit in any order.
+    before = dask.config.get('scheduler', None)
+    first, second = io.synchronous_dask(), io.synchronous_dask()
+    first.__enter__()
+    second.__enter__()
+    assert dask.config.get('scheduler') == 'synchronous'
+    first.__exit__(None, None, None)
+    assert dask.config.get('scheduler') == 'synchronous'
+    second.__exit__(None, None, None)
+    assert dask.config.get('scheduler', None) == before
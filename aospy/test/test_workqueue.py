@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""Test suite for aospy.workqueue and aospy.worker modules."""
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+from aospy import Calc, worker
+from aospy.automate import CalcSuite, submit_mult_calcs
+from aospy.manifest import DONE, Manifest
+from aospy.workqueue import WorkQueue
+from .data.objects import examples as lib
+from .data.objects.examples import (
+    example_proj, example_model, example_run, condensation_rain,
+    convection_rain, precip, globe
+)
+
+
+@pytest.fixture
+def suite_specs():
+    specs = dict(
+        library=lib,
+        projects=[example_proj],
+        models=[example_model],
+        runs=[example_run],
+        variables=[condensation_rain, convection_rain, precip],
+        regions=[globe],
+        date_ranges='default',
+        output_time_intervals=['ann', 'jja'],
+        output_time_regional_reductions=['av', 'reg.av'],
+        output_vertical_reductions=[None],
+        input_time_intervals=['monthly'],
+        input_time_datatypes=['ts'],
+        input_time_offsets=[None],
+        input_vertical_datatypes=[False],
+    )
+    yield specs
+    for direc in [example_proj.direc_out, example_proj.tar_direc_out]:
+        shutil.rmtree(direc, ignore_errors=True)
+
+
+@pytest.fixture
+def calcs(suite_specs):
+    return CalcSuite(suite_specs).create_calcs()
+
+
+@pytest.fixture
+def queue(tmpdir):
+    return WorkQueue(str(tmpdir.join('queue')))
+
+
+def test_put_and_claim(queue, calcs):
+    assert queue.put(calcs) == len(calcs)
+    assert queue.put(calcs) == 0
+    assert queue.counts() == dict(pending=6, claimed=0, done=0, failed=0)
+
+    claims = [queue.claim('worker-{}'.format(i)) for i in range(len(calcs))]
+    assert queue.claim() is None
+    assert len(set(claim.task for claim in claims)) == len(calcs)
+    assert claims[0].worker == 'worker-0'
+    assert claims[0].attempt == 0
+    assert sorted(str(claim.load()) for claim in claims) == sorted(
+        str(calc) for calc in calcs)
+    assert claims[0].heartbeat()
+    assert claims[0].finish()
+    assert not claims[0].heartbeat()
+    assert claims[1].finish(succeeded=False)
+    assert queue.counts() == dict(pending=0, claimed=4, done=1, failed=1)
+
+    # Failed Calcs are added again; the others are not.
+    assert queue.put(calcs) == 1
+    assert queue.counts() == dict(pending=1, claimed=4, done=1, failed=0)
+
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+_ENQUEUE_CODE = """
+import sys
+from aospy.automate import submit_mult_calcs
+from aospy.test.data.objects import examples as lib
+suite_specs = dict(
+    library=lib, projects=[lib.example_proj], models=[lib.example_model],
+    runs=[lib.example_run], variables=[lib.condensation_rain, lib.precip],
+    regions=[lib.globe, lib.sahel], date_ranges='default',
+    output_time_intervals=['ann', 'jja'],
+    output_time_regional_reductions=['av', 'reg.av'],
+    output_vertical_reductions=[None], input_time_intervals=['monthly'],
+    input_time_datatypes=['ts'], input_time_offsets=[None],
+    input_vertical_datatypes=[False])
+submit_mult_calcs(suite_specs, dict(
+    queue=sys.argv[1], lazy=sys.argv[2] == 'lazy', prompt_verify=False,
+    manifest=False))
+"""
+
+
+@pytest.mark.parametrize('lazy', ['lazy', 'eager'])
+def test_put_same_names_across_processes(queue, lazy):
+    # Resubmitting a suite from another process adds none of its tasks.
+    def enqueue(seed):
+        subprocess.check_call(
+            [sys.executable, '-W', 'ignore', '-c', _ENQUEUE_CODE, queue.direc,
+             lazy],
+            env=dict(os.environ, PYTHONPATH=_ROOT, PYTHONHASHSEED=str(seed)))
+
+    enqueue(1)
+    assert queue.counts()['pending'] == 4
+    while True:
+        claim = queue.claim('test')
+        if claim is None:
+            break
+        claim.finish()
+    enqueue(2)
+    assert queue.counts()['pending'] == 0
+    assert queue.counts()['done'] == 4
+
+
+def test_requeue_stale(queue, calcs):
+    queue.configure(stale_after=60., max_attempts=2)
+    queue.put(calcs[:2])
+    claims = [queue.claim('dead'), queue.claim('alive')]
+    assert queue.requeue_stale() == []
+    old = time.time() - 120.
+    os.utime(claims[0].path, (old, old))
+    assert queue.requeue_stale() == [claims[0].task]
+    assert not claims[0].heartbeat()
+    assert not claims[0].finish()
+
+    claim = queue.claim('dead')
+    assert (claim.task, claim.attempt) == (claims[0].task, 1)
+    os.utime(claim.path, (old, old))
+    assert queue.requeue_stale() == [claim.task]
+    assert queue.counts() == dict(pending=0, claimed=1, done=0, failed=1)
+
+
+def test_run_worker(suite_specs, calcs, tmpdir):
+    manifest = str(tmpdir.join('manifest.json'))
+    queue_dir = str(tmpdir.join('queue'))
+    queue = submit_mult_calcs(suite_specs, dict(
+        queue=queue_dir, manifest=manifest, write_to_tar=False,
+        queue_options=dict(heartbeat=0.1)))
+    assert isinstance(queue, WorkQueue)
+    assert queue.config['compute_kwargs'] == dict(write_to_tar=False)
+    assert queue.counts()['pending'] == len(calcs)
+
+    counts = worker.run_worker(queue_dir, max_tasks=2)
+    assert counts == dict(done=2, failed=0)
+    assert worker.run_worker(queue_dir) == dict(done=4, failed=0)
+    assert queue.counts() == dict(pending=0, claimed=0, done=6, failed=0)
+    assert all(Manifest(manifest).status(calc) == DONE for calc in calcs)
+    assert all(os.path.isfile(path) for calc in calcs
+               for path in calc.path_out.values())
+
+
+def test_worker_processes(suite_specs, calcs, tmpdir):
+    queue_dir = str(tmpdir.join('queue'))
+    queue = submit_mult_calcs(suite_specs, dict(queue=queue_dir, lazy=True))
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=root)
+    workers = [subprocess.Popen([sys.executable, '-m', 'aospy.worker',
+                                 queue_dir, '--poll', '0.1'], env=env)
+               for _ in range(3)]
+    assert [process.wait(timeout=300) for process in workers] == [0, 0, 0]
+    assert queue.counts() == dict(pending=0, claimed=0, done=6, failed=0)
+    assert os.path.isfile(calcs[0].path_tar_out)
+
+
+def test_worker_main_failed(queue, calcs, monkeypatch):
+    def compute(self, **kwargs):
+        raise ValueError(self)
+    monkeypatch.setattr(Calc, 'compute', compute)
+    queue.put(calcs[:1])
+    assert worker.main([queue.direc, '--poll', '0']) == 1
+    assert queue.counts()['failed'] == 1
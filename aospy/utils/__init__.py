@@ -1,4 +1,5 @@
 """Subpackage comprising various utility functions used elsewhere in aospy."""
+from . import archive
 from . import io
 from . import longitude
 from .longitude import Longitude
@@ -6,4 +7,4 @@ from . import times
 from . import vertcoord
 
 
-__all__ = ['Longitude', 'io', 'longitude', 'times', 'vertcoord']
+__all__ = ['Longitude', 'archive', 'io', 'longitude', 'times', 'vertcoord']
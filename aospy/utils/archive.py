@@ -0,0 +1,233 @@
+"""Utility functions for archiving aospy output in tar files."""
+import json
+import logging
+import mmap
+import os
+import tarfile
+
+from .io import path_lock, tmp_path_for
+
+
+def index_path(tar_path):
+    """Path of the sidecar file holding the member index of a tar archive."""
+    return tar_path + '.index.json'
+
+
+def build_tar_index(tar_path):
+    """Create the index of the regular-file members of a tar archive.
+
+    Only the member headers are read; the members' data is skipped over.
+
+    Parameters
+    ----------
+    tar_path : str
+        The path to the tar archive
+
+    Returns
+    -------
+    dict
+        Mapping of each member's name to a ``[offset, size]`` list, where
+        ``offset`` is the byte offset of the member's data within the archive
+        and ``size`` is its length in bytes
+    """
+    with tarfile.open(tar_path, 'r') as tar:
+        return {info.name: [info.offset_data, info.size] for info in tar
+                if info.isfile()}
+
+
+def write_tar_index(tar_path, members=None):
+    """Write the sidecar member index of a tar archive.
+
+    Along with the members, the index records the archive's size and
+    modification time, so that an index that is out of date with respect to
+    its archive can be detected.
+
+    Parameters
+    ----------
+    tar_path : str
+        The path to the tar archive
+    members : dict, optional
+        The member index, as returned by :py:func:`build_tar_index`.  If not
+        given, it is built from the archive.
+
+    Returns
+    -------
+    dict
+        The member index
+    """
+    if members is None:
+        members = build_tar_index(tar_path)
+    stat = os.stat(tar_path)
+    index = dict(size=stat.st_size, mtime=stat.st_mtime, members=members)
+    path = index_path(tar_path)
+    tmp_path = tmp_path_for(path)
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+    return members
+
+
+def add_to_tar(tar_path, members):
+    """Add files to a tar archive, replacing existing members of the same name.
+
+    Rather than deleting and appending members one at a time, which rewrites
+    the archive for every file, the archive is written once: the existing
+    members that are not being replaced are copied into a new archive,
+    followed by the new files, and the new archive then atomically replaces
+    the old one.  Its member index is then written via
+    :py:func:`write_tar_index`.  The archive is locked for the duration, so
+    concurrent calls for the same archive are safe.
+
+    No external ``tar`` command is required.
+
+    Parameters
+    ----------
+    tar_path : str
+        The path to the tar archive.  It is created if it does not exist.
+    members : dict
+        Mapping of the name of each member within the archive to the path of
+        the file to be added under that name
+    """
+    def add(new_tar):
+        for name in sorted(members):
+            new_tar.add(members[name], arcname=name)
+    _rewrite_tar(tar_path, members, add)
+
+
+def _copy_members(old_tar, new_tar, skip=()):
+    for info in old_tar:
+        if info.name in skip:
+            continue
+        if info.isfile():
+            new_tar.addfile(info, old_tar.extractfile(info))
+        else:
+            new_tar.addfile(info)
+
+
+def _rewrite_tar(tar_path, replaced, add):
+    """Rewrite a tar archive, replacing the members of the given names.
+
+    The existing members not in ``replaced`` are copied into a new archive,
+    to which ``add`` then adds the new members, and the new archive
+    atomically replaces the old one, under a lock on the archive.
+    """
+    with path_lock(tar_path):
+        tmp_path = tmp_path_for(tar_path)
+        try:
+            with tarfile.open(tmp_path, 'w') as new_tar:
+                if os.path.isfile(tar_path):
+                    with tarfile.open(tar_path, 'r') as old_tar:
+                        _copy_members(old_tar, new_tar, skip=replaced)
+                add(new_tar)
+            os.replace(tmp_path, tar_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        write_tar_index(tar_path)
+
+
+def merge_tars(tar_path, sources):
+    """Add the members of other tar archives to a tar archive.
+
+    Members of the archive with the same name as a member of any of the
+    sources are replaced, as are members of earlier sources with the same
+    name as one of a later source.  As with :py:func:`add_to_tar`, the
+    archive is written once.
+
+    Parameters
+    ----------
+    tar_path : str
+        The path to the tar archive.  It is created if it does not exist.
+    sources : sequence of str
+        The paths to the tar archives whose members are added
+    """
+    names = [set(build_tar_index(source)) for source in sources]
+
+    def add(new_tar):
+        for i, source in enumerate(sources):
+            later = set().union(*names[i + 1:])
+            with tarfile.open(source, 'r') as old_tar:
+                _copy_members(old_tar, new_tar, skip=later)
+    _rewrite_tar(tar_path, set().union(*names), add)
+
+
+def read_tar_index(tar_path):
+    """Get the member index of a tar archive, rebuilding it if necessary.
+
+    The sidecar index written by :py:func:`write_tar_index` is used if it
+    exists and its recorded size and modification time match those of the
+    archive.  Otherwise the index is rebuilt by reading the archive's member
+    headers and, if possible, rewritten.
+
+    Parameters
+    ----------
+    tar_path : str
+        The path to the tar archive
+
+    Returns
+    -------
+    dict
+        Mapping of each member's name to a ``[offset, size]`` list.  See
+        :py:func:`build_tar_index`.
+    """
+    stat = os.stat(tar_path)
+    try:
+        with open(index_path(tar_path)) as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        index = None
+    if (index is not None and index.get('size') == stat.st_size and
+            index.get('mtime') == stat.st_mtime):
+        return index['members']
+    logging.debug('Rebuilding out-of-date or missing index of tar file '
+                  '{}'.format(tar_path))
+    members = build_tar_index(tar_path)
+    try:
+        write_tar_index(tar_path, members)
+    except (IOError, OSError):
+        pass
+    return members
+
+
+def read_tar_members(tar_path, names, index=None):
+    """Read the data of multiple members of a tar archive.
+
+    The archive is opened and memory-mapped once, and each member's data is
+    read directly from its byte range according to the archive's index,
+    without scanning through the archive.
+
+    Parameters
+    ----------
+    tar_path : str
+        The path to the tar archive
+    names : sequence of str
+        The names of the members to read
+    index : dict, optional
+        The member index of the archive.  If not given, it is obtained via
+        :py:func:`read_tar_index`.
+
+    Returns
+    -------
+    dict
+        Mapping of each of the given names to the member's data, as bytes
+
+    Raises
+    ------
+    KeyError
+        If any of the names is not a member of the archive
+    """
+    if index is None:
+        index = read_tar_index(tar_path)
+    ranges = {name: index[name] for name in names}
+    data = {}
+    with open(tar_path, 'rb') as f:
+        if not any(size for offset, size in ranges.values()):
+            return {name: b'' for name in names}
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for name, (offset, size) in ranges.items():
+                data[name] = mapped[offset:offset + size]
+        finally:
+            mapped.close()
+    return data
@@ -1,8 +1,32 @@
 """Utility functions for data input and output."""
+from contextlib import contextmanager
+from distutils.version import LooseVersion
 import logging
+import os
+import shutil
 import subprocess
+import tempfile
+import threading
+import uuid
+import weakref
 
+import dask
+import dask.local
 import numpy as np
+import xarray as xr
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from ..internal_names import TIME_STR, YEAR_STR
+
+
+DEFAULT_NETCDF_FORMAT = 'NETCDF3_64BIT'
+_NETCDF4_FORMATS = ('NETCDF4', 'NETCDF4_CLASSIC')
+_TIME_DIMS = (TIME_STR, YEAR_STR)
+_TS_CHUNK_SIZE = 16
 
 
 def data_in_label(intvl_in, dtype_in_time, dtype_in_vert=False):
@@ -135,3 +159,490 @@ def dmget(files_list):
         subprocess.call(['dmget'] + archive_files)
     except OSError:
         logging.debug('dmget command not found in this machine')
+
+
+def _format_bytes(nbytes):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if nbytes < 1024:
+            return '{0:.1f} {1}'.format(nbytes, unit)
+        nbytes /= 1024.
+    return '{0:.1f} TB'.format(nbytes)
+
+
+_LOCK_DIREC = '.aospy_locks'
+
+
+def lock_path(path):
+    """The path of the file on which :py:func:`path_lock` locks a path.
+
+    Lock files are kept in a hidden '.aospy_locks' directory alongside the
+    locked path, so that they do not clutter e.g. output directories.
+    """
+    direc, name = os.path.split(path)
+    return os.path.join(direc, _LOCK_DIREC, name + '.lock')
+
+
+@contextmanager
+def path_lock(path):
+    """Hold an exclusive, inter-process lock on the given path.
+
+    The lock is taken on a separate file (see :py:func:`lock_path`), which
+    is created if necessary, so the path itself need not exist, and may be
+    replaced while it is locked.  On platforms without ``fcntl`` (i.e.
+    Windows), no lock is taken.
+
+    Parameters
+    ----------
+    path : str
+        The path to lock
+    """
+    lock_file_path = lock_path(path)
+    direc = os.path.dirname(lock_file_path)
+    if not os.path.isdir(direc):
+        try:
+            os.makedirs(direc)
+        except OSError:
+            pass
+    with open(lock_file_path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def tmp_path_for(path):
+    """Unique temporary path in the same directory as the given path.
+
+    Files written to this path can subsequently be atomically renamed to the
+    given path via ``os.replace``.
+    """
+    return '{0}.{1}.tmp'.format(path, uuid.uuid4().hex[:12])
+
+
+def atomic_to_netcdf(ds, path, **kwargs):
+    """Write a Dataset to netCDF via a temporary file and a rename.
+
+    Readers of ``path`` therefore see either the previous file or the new
+    one, never a partially written file.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The Dataset to write
+    path : str
+        The path of the file to write
+    **kwargs
+        Passed to ``xarray.Dataset.to_netcdf``
+    """
+    tmp_path = tmp_path_for(path)
+    try:
+        ds.to_netcdf(tmp_path, **kwargs)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def netcdf_groups(path):
+    """List the groups of a netCDF4 file that contain variables.
+
+    Parameters
+    ----------
+    path : str
+        The path to the netCDF4 file
+
+    Returns
+    -------
+    list of str
+        The full path of each group within the file, e.g. 'a/b', not
+        including the root group
+    """
+    import netCDF4
+    groups = []
+    with netCDF4.Dataset(path) as nc:
+        stack = list(nc.groups.values())
+        while stack:
+            group = stack.pop()
+            if group.variables:
+                groups.append(group.path.strip('/'))
+            stack.extend(group.groups.values())
+    return sorted(groups)
+
+
+def _rewrite_netcdf_group(ds, path, group, **kwargs):
+    """Atomically rewrite a netCDF4 file, replacing one of its groups."""
+    try:
+        others = [g for g in netcdf_groups(path) if g != group]
+    except (IOError, OSError, RuntimeError):
+        others = []
+    copy_kwargs = {k: v for k, v in kwargs.items() if k != 'encoding'}
+    tmp_path = tmp_path_for(path)
+    try:
+        ds.to_netcdf(tmp_path, group=group, **kwargs)
+        for other in others:
+            with xr.open_dataset(path, group=other) as data:
+                data.load().to_netcdf(tmp_path, mode='a', group=other,
+                                      **copy_kwargs)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def upsert_to_netcdf(ds, path, group=None, **kwargs):
+    """Add or overwrite the Dataset's variables in a netCDF file.
+
+    If the file exists, the variables of ``ds`` are written in place to a
+    copy of it, overwriting any existing variables of the same name and
+    leaving the others untouched, which then atomically replaces the file.
+    A writer that dies partway therefore leaves the file as it was, and
+    readers, which need not lock the file, see either the previous file or
+    the new one.  If writing in place is not possible, e.g. because the
+    dimensions of the existing file are incompatible, the existing and new
+    variables are merged and the file is rewritten via
+    :py:func:`atomic_to_netcdf` (or, if writing to a group, with the file's
+    other groups copied over).
+
+    This function does not itself lock ``path``; concurrent writers should
+    use :py:func:`path_lock`.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The Dataset whose variables are to be written
+    path : str
+        The path of the file to write
+    group : str, optional
+        The path of the netCDF4 group to write to, e.g. 'a/b'.  By default,
+        the root group.
+    **kwargs
+        Passed to ``xarray.Dataset.to_netcdf``
+
+    Raises
+    ------
+    IOError
+        If the existing file cannot be read, in which case it is left as it
+        is rather than replaced, since it may hold other outputs
+    """
+    if not os.path.isfile(path):
+        return atomic_to_netcdf(ds, path, group=group, **kwargs)
+    try:
+        groups = netcdf_groups(path)
+    except (IOError, OSError, RuntimeError) as e:
+        raise IOError('The existing file {0} cannot be read ({1}), so it is '
+                      'not overwritten; remove it to write to '
+                      'it.'.format(path, e))
+    tmp_path = tmp_path_for(path)
+    try:
+        shutil.copyfile(path, tmp_path)
+        ds.to_netcdf(tmp_path, mode='a', group=group, **kwargs)
+        os.replace(tmp_path, path)
+        return
+    except (ValueError, RuntimeError, KeyError, EOFError, IOError) as e:
+        logging.info('Unable to write to {0} in place ({1}); rewriting '
+                     'the file instead.'.format(path, e))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if group is None or group in groups:
+        with xr.open_dataset(path, group=group) as existing:
+            merged = existing.load()
+    else:
+        merged = xr.Dataset()
+    merged.update(ds)
+    if group is None:
+        atomic_to_netcdf(merged, path, **kwargs)
+    else:
+        _rewrite_netcdf_group(merged, path, group, **kwargs)
+
+
+class SerializableRLock(object):
+    """A reentrant lock that is shared, rather than copied, when pickled.
+
+    Like ``dask.utils.SerializableLock``, all instances with the same token
+    within a process share the same underlying lock, so that the lock can be
+    passed to ``dask.array.from_array`` (e.g. via the ``lock`` argument of
+    ``xr.open_mfdataset``) within graphs that are serialized.
+
+    Parameters
+    ----------
+    token : str, optional
+        Identifier of the underlying lock.  By default a new lock is created.
+    """
+    _locks = weakref.WeakValueDictionary()
+
+    def __init__(self, token=None):
+        self.token = token or str(uuid.uuid4())
+        lock = SerializableRLock._locks.get(self.token)
+        if lock is None:
+            lock = threading.RLock()
+            SerializableRLock._locks[self.token] = lock
+        self.lock = lock
+
+    def acquire(self, *args, **kwargs):
+        return self.lock.acquire(*args, **kwargs)
+
+    def release(self):
+        return self.lock.release()
+
+    def __enter__(self):
+        self.lock.acquire()
+
+    def __exit__(self, *args):
+        self.lock.release()
+
+    def __getstate__(self):
+        return self.token
+
+    def __setstate__(self, token):
+        self.__init__(token)
+
+
+# The netCDF4 and HDF5 libraries are not thread-safe, so all of aospy's calls
+# into them, including reads of the chunks of lazily loaded input data, hold
+# this lock.
+_NETCDF4_LOCK = SerializableRLock('aospy-netcdf4')
+
+# The dask configuration is global to the process, so it is only changed by
+# the first thread to request synchronous dask computations and restored by
+# the last, while holding this lock.
+_SYNCHRONOUS_DASK_LOCK = threading.Lock()
+_synchronous_dask_state = dict(count=0, config=None)
+
+
+def _set_synchronous_dask():
+    if LooseVersion(dask.__version__) < '0.18':
+        return dask.set_options(get=dask.local.get_sync)
+    return dask.config.set(scheduler='synchronous')
+
+
+@contextmanager
+def synchronous_dask():
+    """Context manager under which dask computations run synchronously.
+
+    This can be entered by multiple threads at once: dask's configuration
+    is set when the first of them enters and restored when the last of
+    them exits, regardless of the order in which they do so.
+    """
+    state = _synchronous_dask_state
+    with _SYNCHRONOUS_DASK_LOCK:
+        if not state['count']:
+            state['config'] = _set_synchronous_dask()
+        state['count'] += 1
+    try:
+        yield
+    finally:
+        with _SYNCHRONOUS_DASK_LOCK:
+            state['count'] -= 1
+            if not state['count']:
+                state['config'].__exit__(None, None, None)
+                state['config'] = None
+
+
+def load_netcdf(path, group=None):
+    """Open a netCDF file and load its entire contents into memory.
+
+    This is safe to call concurrently from multiple threads: netCDF3 files
+    are read using the pure-Python scipy backend, and reads of netCDF4 files
+    are serialized.
+
+    Parameters
+    ----------
+    path : str
+        The path to the netCDF file
+    group : str, optional
+        The path of the netCDF4 group to load.  By default, the root group.
+
+    Returns
+    -------
+    xarray.Dataset
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(3)
+    if magic == b'CDF' and group is None:
+        with xr.open_dataset(path, engine='scipy') as ds:
+            return ds.load()
+    with _NETCDF4_LOCK:
+        with xr.open_dataset(path, group=group) as ds:
+            return ds.load()
+
+
+def dataset_from_bytes(data):
+    """Load a Dataset from the contents of a netCDF file held in memory.
+
+    Both netCDF3 and netCDF4 (i.e. HDF5-based) formats are supported.
+    netCDF4 data is opened in memory if the underlying netCDF library
+    supports it, and otherwise is first written to a temporary file.
+
+    Parameters
+    ----------
+    data : bytes
+        The full contents of a netCDF file
+
+    Returns
+    -------
+    xarray.Dataset
+        The Dataset, with all of its values loaded into memory
+    """
+    if data[:4] != b'\x89HDF':
+        with xr.open_dataset(data) as ds:
+            return ds.load()
+    import netCDF4
+    with _NETCDF4_LOCK:
+        try:
+            nc = netCDF4.Dataset('aospy_in_memory.nc', memory=data)
+        except (IOError, OSError, ValueError):
+            pass
+        else:
+            with xr.open_dataset(xr.backends.NetCDF4DataStore(nc)) as ds:
+                return ds.load()
+        with tempfile.NamedTemporaryFile(suffix='.nc') as f:
+            f.write(data)
+            f.flush()
+            with xr.open_dataset(f.name) as ds:
+                return ds.load()
+
+
+def _chunk_sizes(arr, chunking):
+    """Chunk shape of the given array for the specified access pattern."""
+    if isinstance(chunking, dict):
+        return tuple(min(chunking.get(dim, size), size)
+                     for dim, size in zip(arr.dims, arr.shape))
+    if chunking == 'time':
+        return tuple(size if dim in _TIME_DIMS else min(size, _TS_CHUNK_SIZE)
+                     for dim, size in zip(arr.dims, arr.shape))
+    if chunking == 'map':
+        return tuple(1 if dim in _TIME_DIMS else size
+                     for dim, size in zip(arr.dims, arr.shape))
+    raise ValueError("Chunking must be one of None, 'time', 'map', or a "
+                     "dict mapping dimension names to chunk sizes; got "
+                     "'{}'".format(chunking))
+
+
+def netcdf_encoding(ds, output_format=DEFAULT_NETCDF_FORMAT, zlib=False,
+                    complevel=4, shuffle=False, chunking=None,
+                    least_significant_digit=None):
+    """Create the encoding with which to write a Dataset to netCDF.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The Dataset to be written
+    output_format : str, optional
+        The netCDF format used to write the file (default 'NETCDF3_64BIT').
+        All other options require 'NETCDF4' or 'NETCDF4_CLASSIC'.
+    zlib : bool, optional
+        Whether to compress the data variables using zlib (default False)
+    complevel : int, optional
+        The zlib compression level, from 1 to 9 (default 4)
+    shuffle : bool, optional
+        Whether to apply the HDF5 shuffle filter before compression (default
+        False)
+    chunking : {None, 'time', 'map', dict}, optional
+        The chunk shape of the data variables on disk:
+
+        - None : use the netCDF library's default chunking
+        - 'time' : chunks span the full time (or year) axis and small tiles
+          of the other dimensions, for fast access to the timeseries at
+          individual points
+        - 'map' : chunks comprise a single time (or year) index and the full
+          extent of the other dimensions, for fast access to individual maps
+        - dict : mapping of dimension names to chunk sizes; dimensions not
+          included span their full extent
+
+    least_significant_digit : int, optional
+        If given, quantize the data variables to retain this many decimal
+        digits of precision, which greatly improves compression.
+
+    Returns
+    -------
+    dict
+        The encoding of each data variable to which any of the options apply,
+        to be passed as the ``encoding`` argument of
+        ``xarray.Dataset.to_netcdf``.
+
+    Raises
+    ------
+    ValueError
+        If any compression, chunking, or quantization options are requested
+        for a netCDF3 output format.
+
+    """
+    options = dict()
+    if zlib:
+        options.update(zlib=True, complevel=complevel)
+    if shuffle:
+        options['shuffle'] = True
+    if least_significant_digit is not None:
+        options['least_significant_digit'] = least_significant_digit
+    if ((options or chunking is not None) and
+            output_format not in _NETCDF4_FORMATS):
+        raise ValueError("Compression, chunking, and quantization of output "
+                         "require one of the {0} formats; got "
+                         "'{1}'".format(_NETCDF4_FORMATS, output_format))
+    encoding = dict()
+    for name, arr in ds.data_vars.items():
+        var_encoding = options.copy()
+        if chunking is not None and arr.ndim:
+            var_encoding['chunksizes'] = _chunk_sizes(arr, chunking)
+        if var_encoding:
+            encoding[name] = var_encoding
+    return encoding
+
+
+def zarr_encoding(ds, chunking=None, zlib=False, complevel=4, shuffle=False,
+                  least_significant_digit=None):
+    """Create the encoding with which to write a Dataset to a Zarr store.
+
+    Accepts the same options as :py:func:`netcdf_encoding`, so that a single
+    set of output options can be used with either output backend.  By default
+    Zarr compresses data using Blosc with byte-shuffling, so ``shuffle`` is
+    implied and has no further effect.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The Dataset to be written
+    chunking : {None, 'time', 'map', dict}, optional
+        The chunk shape of the data variables in the store.  See
+        :py:func:`netcdf_encoding`.
+    zlib : bool, optional
+        Whether to compress using zlib rather than the default Blosc (default
+        False)
+    complevel : int, optional
+        The zlib compression level, from 1 to 9 (default 4)
+    shuffle : bool, optional
+        Ignored
+    least_significant_digit : int, optional
+        If given, quantize floating point data variables to retain this many
+        decimal digits of precision.
+
+    Returns
+    -------
+    dict
+        The encoding of each data variable to which any of the options apply,
+        to be passed as the ``encoding`` argument of
+        ``xarray.Dataset.to_zarr``.
+
+    """
+    encoding = dict()
+    for name, arr in ds.data_vars.items():
+        var_encoding = dict()
+        if zlib:
+            import numcodecs
+            var_encoding['compressor'] = numcodecs.Zlib(level=complevel)
+        if (least_significant_digit is not None and
+                np.issubdtype(arr.dtype, np.floating)):
+            import numcodecs
+            var_encoding['filters'] = [numcodecs.Quantize(
+                least_significant_digit, dtype=arr.dtype)]
+        if chunking is not None and arr.ndim:
+            var_encoding['chunks'] = _chunk_sizes(arr, chunking)
+        if var_encoding:
+            encoding[name] = var_encoding
+    return encoding
@@ -0,0 +1,120 @@
+"""Worker executing the Calcs of a :py:class:`aospy.workqueue.WorkQueue`.
+
+Run as ``python -m aospy.worker <queue_dir>``; see ``--help`` for options.
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+
+from .automate import _compute_or_skip_on_error
+from .manifest import Manifest
+from .workqueue import WorkQueue, default_worker_id
+
+
+class _Heartbeat(object):
+    """Context manager sending the heartbeats of a Claim in a thread."""
+    def __init__(self, claim, interval):
+        self.claim = claim
+        self.interval = interval
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.claim.heartbeat():
+                logging.warning('Lost the claim {}'.format(self.claim))
+                return
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(queue_dir, worker=None, poll=5., wait=False, max_tasks=None):
+    """Execute Calcs from the work queue until it is empty.
+
+    Parameters
+    ----------
+    queue_dir : str
+        The directory of the :py:class:`aospy.workqueue.WorkQueue`
+    worker : str, optional
+        Identifier of the worker.  Defaults to
+        :py:func:`aospy.workqueue.default_worker_id`.
+    poll : float, optional
+        Seconds to wait before checking the queue again when no task is
+        pending.  Default 5.
+    wait : bool, optional
+        If True, keep waiting for tasks when the queue is empty, rather than
+        returning once no tasks are pending or claimed by other workers.
+        Default False.
+    max_tasks : int, optional
+        If given, return after executing this many tasks.
+
+    Returns
+    -------
+    dict
+        The number of tasks the worker completed ('done') and that failed
+        ('failed')
+    """
+    worker = worker or default_worker_id()
+    queue = WorkQueue(queue_dir)
+    config = queue.config
+    manifest = config['manifest'] and Manifest(config['manifest'])
+    counts = dict(done=0, failed=0)
+    logging.info('Worker {0} started on {1}'.format(worker, queue))
+    while max_tasks is None or sum(counts.values()) < max_tasks:
+        queue.requeue_stale()
+        claim = queue.claim(worker)
+        if claim is None:
+            if not wait and not queue.counts()['claimed']:
+                break
+            time.sleep(poll)
+            continue
+        with _Heartbeat(claim, config['heartbeat']):
+            try:
+                calc = claim.load()
+            except Exception:
+                logging.exception('Unable to load the task of '
+                                  '{}'.format(claim))
+                calc = None
+            result = calc and _compute_or_skip_on_error(
+                calc, dict(config['compute_kwargs']), manifest=manifest)
+        succeeded = result is not None
+        claim.finish(succeeded)
+        counts['done' if succeeded else 'failed'] += 1
+    logging.info('Worker {0} finished: {1}'.format(worker, counts))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m aospy.worker',
+        description='Execute aospy calculations from a work queue.')
+    parser.add_argument('queue_dir', help='the directory of the work queue')
+    parser.add_argument('--worker', help='identifier of this worker '
+                        '(default: <hostname>-<pid>)')
+    parser.add_argument('--poll', type=float, default=5.,
+                        help='seconds between checks of an empty queue')
+    parser.add_argument('--wait', action='store_true',
+                        help='keep waiting for tasks once the queue is empty')
+    parser.add_argument('--max-tasks', type=int,
+                        help='exit after executing this many tasks')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='log progress')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else
+                        logging.WARNING)
+    counts = run_worker(args.queue_dir, worker=args.worker, poll=args.poll,
+                        wait=args.wait, max_tasks=args.max_tasks)
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,300 @@
+"""A work queue of Calcs on a shared filesystem, needing no scheduler.
+
+The queue is a directory holding one file per task, i.e. per pickled Calc
+or :py:class:`aospy.specs.CalcSpec`, in one of the subdirectories
+'pending', 'claimed', 'done', and 'failed'.  Every change of a task's state
+is a rename of its file, which is atomic, so that any number of workers,
+on any number of machines sharing the filesystem, can take tasks from the
+queue at once, each task being claimed by exactly one of them.  A worker
+holding a claim periodically updates the modification time of the claimed
+file as a heartbeat; a claim whose heartbeat has stopped, e.g. because its
+worker was killed, is returned to 'pending' by any other worker, up to a
+maximum number of attempts.
+
+Workers are started via ``python -m aospy.worker <queue_dir>`` (see
+:py:mod:`aospy.worker`), and may join or leave at any time.
+"""
+import json
+import logging
+import os
+import socket
+import time
+
+import cloudpickle
+
+from .manifest import calc_key
+from .sharding import stable_hash
+from .specs import CalcSpec
+from .utils.io import tmp_path_for
+
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+_STATES = (PENDING, CLAIMED, DONE, FAILED)
+_CONFIG = 'config.json'
+_DEFAULT_CONFIG = dict(compute_kwargs={}, manifest=None, stale_after=600.,
+                       heartbeat=30., max_attempts=3)
+
+
+def _task_name(calc):
+    """File name of the task of the Calc, stable across processes.
+
+    Like the keys it is derived from, it does not depend on the hash seed,
+    so that the same Calc put by different processes is the same task.
+    """
+    key = calc.key if isinstance(calc, CalcSpec) else calc_key(calc)
+    return '{:016x}'.format(stable_hash(key))
+
+
+def _parse(filename):
+    """The task name, attempt, and worker, if any, of a task's file name."""
+    name, _, worker = filename.partition('@')
+    task, attempt = name.rsplit('.', 1)
+    return task, int(attempt), worker or None
+
+
+def default_worker_id():
+    """Identifier of this process, unique among those sharing a queue."""
+    return '{0}-{1}'.format(socket.gethostname(), os.getpid())
+
+
+class Claim(object):
+    """A task claimed from a :py:class:`WorkQueue` by a worker.
+
+    Attributes
+    ----------
+    path : str
+        The path of the claimed file
+    task : str
+        The name of the task
+    attempt : int
+        The number of previous attempts at the task
+    """
+    def __init__(self, queue, path):
+        self.queue = queue
+        self.path = path
+        self.task, self.attempt, self.worker = _parse(os.path.basename(path))
+
+    def __str__(self):
+        return 'aospy.workqueue.Claim "{}"'.format(self.path)
+
+    __repr__ = __str__
+
+    def load(self):
+        """The Calc or CalcSpec of the task."""
+        with open(self.path, 'rb') as f:
+            return cloudpickle.load(f)
+
+    def heartbeat(self):
+        """Record that the worker holding the claim is still alive.
+
+        Returns
+        -------
+        bool
+            False if the claim has been lost, i.e. it was considered stale
+            and returned to the queue.
+        """
+        try:
+            os.utime(self.path, None)
+        except OSError:
+            return False
+        return True
+
+    def finish(self, succeeded=True):
+        """Move the task to 'done' or 'failed'.
+
+        Returns
+        -------
+        bool
+            False if the claim had been lost, in which case the task is left
+            as it is.
+        """
+        state = DONE if succeeded else FAILED
+        try:
+            os.rename(self.path, self.queue._path(
+                state, '{0}.{1}'.format(self.task, self.attempt)))
+        except OSError:
+            logging.warning('The claim {} was lost before the task '
+                            'finished'.format(self))
+            return False
+        return True
+
+
+class WorkQueue(object):
+    """A work queue of Calcs in a directory on a shared filesystem.
+
+    Parameters
+    ----------
+    direc : str
+        The directory of the queue.  It is created by :py:meth:`configure`
+        or :py:meth:`put` if it does not exist.
+    """
+    def __init__(self, direc):
+        self.direc = direc
+
+    def __str__(self):
+        return 'aospy.WorkQueue "{}"'.format(self.direc)
+
+    __repr__ = __str__
+
+    def _path(self, state, filename=''):
+        return os.path.join(self.direc, state, filename)
+
+    def _list(self, state):
+        try:
+            return sorted(os.listdir(self._path(state)))
+        except OSError:
+            return []
+
+    @property
+    def config(self):
+        """The options of the queue, as set via :py:meth:`configure`."""
+        config = dict(_DEFAULT_CONFIG)
+        try:
+            with open(os.path.join(self.direc, _CONFIG)) as f:
+                config.update(json.load(f))
+        except (IOError, OSError):
+            pass
+        return config
+
+    def configure(self, compute_kwargs=None, manifest=None, stale_after=600.,
+                  heartbeat=30., max_attempts=3):
+        """Create the queue's directories and set its options.
+
+        Parameters
+        ----------
+        compute_kwargs : dict, optional
+            Keyword arguments to :py:meth:`aospy.Calc.compute`, which must
+            be JSON-serializable
+        manifest : str, optional
+            The path of the :py:class:`aospy.manifest.Manifest` in which
+            the workers record the status of each Calc
+        stale_after : float, optional
+            Seconds after its last heartbeat after which a claim is returned
+            to the queue.  It must comfortably exceed ``heartbeat``, and any
+            difference between the clocks of the machines sharing the
+            queue.  Default 600.
+        heartbeat : float, optional
+            Seconds between the heartbeats of a claim.  Default 30.
+        max_attempts : int, optional
+            The number of times a task is claimed before it is considered
+            failed, if its claims keep going stale.  Default 3.
+        """
+        for state in _STATES:
+            os.makedirs(self._path(state), exist_ok=True)
+        config = dict(compute_kwargs=compute_kwargs or {}, manifest=manifest,
+                      stale_after=stale_after, heartbeat=heartbeat,
+                      max_attempts=max_attempts)
+        path = os.path.join(self.direc, _CONFIG)
+        tmp_path = tmp_path_for(path)
+        with open(tmp_path, 'w') as f:
+            json.dump(config, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def put(self, calcs):
+        """Add tasks executing the given Calcs or CalcSpecs to the queue.
+
+        Calcs already pending, claimed, or done are not added again; those
+        that failed are retried.
+
+        Returns
+        -------
+        int
+            The number of tasks added
+        """
+        if not os.path.isfile(os.path.join(self.direc, _CONFIG)):
+            self.configure()
+        existing = set(_parse(filename)[0] for state in (PENDING, CLAIMED,
+                                                         DONE)
+                       for filename in self._list(state))
+        failed = self._list(FAILED)
+        n_added = 0
+        for calc in calcs:
+            task = _task_name(calc)
+            if task in existing:
+                continue
+            for filename in failed:
+                if _parse(filename)[0] == task:
+                    os.remove(self._path(FAILED, filename))
+            path = os.path.join(self.direc, task)
+            tmp_path = tmp_path_for(path)
+            with open(tmp_path, 'wb') as f:
+                cloudpickle.dump(calc, f)
+            os.rename(tmp_path, self._path(PENDING, task + '.0'))
+            existing.add(task)
+            n_added += 1
+        return n_added
+
+    def counts(self):
+        """The number of tasks in each state."""
+        return {state: len(self._list(state)) for state in _STATES}
+
+    def claim(self, worker=None):
+        """Claim a pending task.
+
+        Parameters
+        ----------
+        worker : str, optional
+            Identifier of the claiming worker.  Defaults to
+            :py:func:`default_worker_id`.
+
+        Returns
+        -------
+        Claim or None
+            None if no task is pending
+        """
+        worker = worker or default_worker_id()
+        for filename in self._list(PENDING):
+            pending = self._path(PENDING, filename)
+            claimed = self._path(CLAIMED, '{0}@{1}'.format(filename, worker))
+            try:
+                # Renaming preserves the modification time, so it is
+                # updated first so that the claim is not immediately stale.
+                os.utime(pending, None)
+                os.rename(pending, claimed)
+            except OSError:
+                # Another worker claimed the task first.
+                continue
+            return Claim(self, claimed)
+        return None
+
+    def requeue_stale(self):
+        """Return claims whose heartbeat has stopped to the queue.
+
+        A claimed task that has reached the maximum number of attempts is
+        moved to 'failed' instead.
+
+        Returns
+        -------
+        list of str
+            The names of the tasks returned to the queue or failed
+        """
+        config = self.config
+        now = time.time()
+        requeued = []
+        for filename in self._list(CLAIMED):
+            path = self._path(CLAIMED, filename)
+            try:
+                if now - os.path.getmtime(path) < config['stale_after']:
+                    continue
+            except OSError:
+                continue
+            task, attempt, worker = _parse(filename)
+            attempt += 1
+            if attempt >= config['max_attempts']:
+                target = self._path(FAILED, '{0}.{1}'.format(task, attempt))
+            else:
+                target = self._path(PENDING, '{0}.{1}'.format(task, attempt))
+            try:
+                os.rename(path, target)
+            except OSError:
+                continue
+            logging.warning('Moved task {0} of stale worker {1} to {2} after '
+                            '{3} of {4} attempts'.format(
+                                task, worker, os.path.basename(
+                                    os.path.dirname(target)),
+                                attempt, config['max_attempts']))
+            requeued.append(task)
+        return requeued
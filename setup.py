@@ -33,6 +33,7 @@ setuptools.setup(
                       'toolz >= 0.7.2',
                       'dask >= 0.14',
                       'distributed >= 1.17.1',
+                      'psutil >= 5.0',
                       'xarray >= 0.10.6',
                       'cloudpickle >= 0.2.1',
                       'cftime >= 1.0.0'],
@@ -40,6 +41,7 @@ setuptools.setup(
     package_data={'aospy': ['test/data/netcdf/*.nc']},
     scripts=['aospy/examples/aospy_main.py',
              'aospy/examples/example_obj_lib.py'],
+    entry_points={'console_scripts': ['aospy = aospy.cli:main']},
     license="Apache",
     keywords="climate science netcdf xarray",
     url="https://github.com/spencerahill/aospy",